@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+import sys
+
+from . import (
+    bench_e2e,
+    bench_protocol,
+    bench_wire,
+)
+from .compare import compare
+from .harness import Results
+
+SUITES = {
+    "wire": bench_wire.run,
+    "protocol": bench_protocol.run,
+    "e2e": bench_e2e.run,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Benchmarks for openttd-protocol")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="run the benchmarks")
+    run.add_argument("--output", "-o", help="write the results as JSON to this file")
+    run.add_argument("suites", nargs="*", help=f"suites to run: {', '.join(SUITES)} (default: all)")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.10, help="relative change that counts as regression (default: 0.10)"
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        regressions = compare(args.baseline, args.current, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) found")
+            sys.exit(1)
+        return
+
+    for name in args.suites:
+        if name not in SUITES:
+            parser.error(f"unknown suite: {name}")
+
+    results = Results()
+    for name in args.suites or SUITES:
+        suite = SUITES[name]
+        if asyncio.iscoroutinefunction(suite):
+            asyncio.run(suite(results))
+        else:
+            suite(results)
+
+    if args.output:
+        results.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
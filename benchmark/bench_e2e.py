@@ -0,0 +1,266 @@
+import asyncio
+import gc
+import time
+import tracemalloc
+
+from openttd_protocol.protocol.content import ContentProtocol
+from openttd_protocol.protocol.coordinator import CoordinatorProtocol
+from openttd_protocol.protocol.stun import StunProtocol
+from openttd_protocol.wire.cache import PacketCache
+from openttd_protocol.wire.read import (
+    read_uint16,
+    read_uint32,
+)
+
+from . import payloads
+from .harness import (
+    NullTransport,
+    connect,
+    percentile,
+)
+
+THROUGHPUT_PACKETS = 20000
+LATENCY_PACKETS = 2000
+IDLE_CONNECTIONS = 1000
+CHUNK_SIZE = 65536
+# Entries in the listing that is in flight while measuring control latency.
+BULK_ENTRIES = 20000
+# Content id the control packets (CLIENT_INFO_ID) ask for; those of the
+# listing start at 1.
+PROBE_CONTENT_ID = 0
+
+
+class StunApplication:
+    def __init__(self, expected):
+        self.expected = expected
+        self.count = 0
+        self.done = asyncio.get_running_loop().create_future()
+
+    async def receive_PACKET_STUN_SERCLI_STUN(self, source, protocol_version, token, interface_number):
+        self.count += 1
+        if self.count == self.expected:
+            self.done.set_result(None)
+
+
+class CoordinatorApplication:
+    async def receive_PACKET_COORDINATOR_CLIENT_CONNECT(self, source, protocol_version, invite_code):
+        await source.protocol.send_PACKET_COORDINATOR_GC_CONNECT_FAILED(protocol_version, "token")
+
+
+class CachedContentProtocol(ContentProtocol):
+    info_list_cache = PacketCache()
+
+
+class ContentApplication:
+    def __init__(self):
+        self.tasks = set()
+
+    @staticmethod
+    def _entries():
+        return [payloads.server_info_kwargs(content_id) for content_id in range(1, BULK_ENTRIES + 1)]
+
+    async def receive_PACKET_CONTENT_CLIENT_INFO_LIST(self, source, content_type, openttd_version, branch_versions):
+        # Answer in the background, so the packets received meanwhile are
+        # handled; otherwise they wait for the listing anyway.
+        task = asyncio.create_task(
+            source.protocol.send_CLIENT_INFO_LIST_response(
+                content_type, openttd_version, branch_versions, self._entries
+            )
+        )
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def receive_PACKET_CONTENT_CLIENT_INFO_ID(self, source, content_infos):
+        for content_info in content_infos:
+            await source.protocol.send_PACKET_CONTENT_SERVER_INFO(
+                **payloads.server_info_kwargs(content_info.content_id)
+            )
+
+
+class NotifyTransport(NullTransport):
+    """NullTransport that resolves a future on every write."""
+
+    def __init__(self):
+        super().__init__()
+        self.future = None
+
+    def write(self, data):
+        super().write(data)
+        if self.future is not None and not self.future.done():
+            self.future.set_result(data)
+
+
+def _report_throughput(results, name, packets, size, duration):
+    results.add(f"e2e.{name}.packets", packets / duration, "packets/s", higher_is_better=True)
+    results.add(f"e2e.{name}.bytes", packets * size / duration, "bytes/s", higher_is_better=True)
+
+
+def _report_latency(results, name, latencies):
+    for fraction in (0.5, 0.9, 0.99):
+        value = percentile(latencies, fraction) * 1e6
+        results.add(f"e2e.{name}.latency.p{int(fraction * 100)}", value, "us")
+
+
+async def _memory_throughput(results):
+    application = StunApplication(THROUGHPUT_PACKETS)
+    protocol = StunProtocol(application)
+    connect(protocol)
+
+    packet = payloads.encode_STUN_SERCLI_STUN()
+    stream = packet * THROUGHPUT_PACKETS
+
+    start = time.perf_counter()
+    for offset in range(0, len(stream), CHUNK_SIZE):
+        protocol.data_received(stream[offset : offset + CHUNK_SIZE])
+    await application.done
+    duration = time.perf_counter() - start
+
+    protocol.connection_lost(None)
+    _report_throughput(results, "memory.stun", THROUGHPUT_PACKETS, len(packet), duration)
+
+
+async def _memory_latency(results):
+    loop = asyncio.get_running_loop()
+    protocol = CoordinatorProtocol(CoordinatorApplication())
+    transport = NotifyTransport()
+    connect(protocol, transport)
+
+    packet = payloads.encode_COORDINATOR_CLIENT_CONNECT()
+
+    latencies = []
+    for _ in range(LATENCY_PACKETS):
+        transport.future = loop.create_future()
+        start = time.perf_counter()
+        protocol.data_received(packet)
+        await transport.future
+        latencies.append(time.perf_counter() - start)
+
+    protocol.connection_lost(None)
+    _report_latency(results, "memory.coordinator", latencies)
+
+
+async def _memory_idle_connections(results):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    protocols = []
+    for i in range(IDLE_CONNECTIONS):
+        protocol = CoordinatorProtocol(CoordinatorApplication())
+        connect(protocol, NullTransport(("127.0.0.1", 10000 + i)))
+        protocols.append(protocol)
+    # Let the tasks of the protocols start, so they are idle waiting.
+    await asyncio.sleep(0)
+
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    results.add("e2e.memory.idle_connection", size / IDLE_CONNECTIONS, "bytes")
+
+    for protocol in protocols:
+        protocol.connection_lost(None)
+
+
+async def _socket_throughput(results, port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+    request = payloads.encode_COORDINATOR_CLIENT_CONNECT()
+    response_size = len(b"\x00\x00\x09token\x00")
+
+    start = time.perf_counter()
+
+    async def send():
+        for _ in range(THROUGHPUT_PACKETS):
+            writer.write(request)
+            await writer.drain()
+
+    async def receive():
+        await reader.readexactly(response_size * THROUGHPUT_PACKETS)
+
+    await asyncio.gather(send(), receive())
+    duration = time.perf_counter() - start
+
+    writer.close()
+    _report_throughput(results, "socket.coordinator", THROUGHPUT_PACKETS, len(request) + response_size, duration)
+
+
+async def _socket_latency(results, port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+    request = payloads.encode_COORDINATOR_CLIENT_CONNECT()
+    response_size = len(b"\x00\x00\x09token\x00")
+
+    latencies = []
+    for _ in range(LATENCY_PACKETS):
+        start = time.perf_counter()
+        writer.write(request)
+        await reader.readexactly(response_size)
+        latencies.append(time.perf_counter() - start)
+
+    writer.close()
+    _report_latency(results, "socket.coordinator", latencies)
+
+
+async def _socket_control_during_bulk(results, port):
+    # How long a small request waits for its answer, while a large listing
+    # is being sent over the same connection.
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    loop = asyncio.get_running_loop()
+
+    probe = payloads.encode_CONTENT_CLIENT_INFO_ID([PROBE_CONTENT_ID])
+    answered = None
+
+    async def receive():
+        listed = 0
+        while listed < BULK_ENTRIES:
+            header = await reader.readexactly(2)
+            length, _ = read_uint16(memoryview(header))
+            data = await reader.readexactly(length - 2)
+            # A SERVER_INFO starts with the content type and content id.
+            content_id, _ = read_uint32(memoryview(data)[2:])
+            if content_id == PROBE_CONTENT_ID:
+                answered.set_result(time.perf_counter())
+            else:
+                listed += 1
+
+    receiver = asyncio.create_task(receive())
+    writer.write(payloads.encode_CONTENT_CLIENT_INFO_LIST())
+
+    latencies = []
+    while not receiver.done() and len(latencies) < LATENCY_PACKETS:
+        answered = loop.create_future()
+        start = time.perf_counter()
+        writer.write(probe)
+        await asyncio.wait([answered, receiver], return_when=asyncio.FIRST_COMPLETED)
+        if answered.done():
+            latencies.append(answered.result() - start)
+
+    await receiver
+    writer.close()
+    _report_latency(results, "socket.content.control_during_bulk", latencies)
+
+
+async def run(results):
+    await _memory_throughput(results)
+    await _memory_latency(results)
+    await _memory_idle_connections(results)
+
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: CoordinatorProtocol(CoordinatorApplication()), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        await _socket_throughput(results, port)
+        await _socket_latency(results, port)
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    server = await loop.create_server(lambda: CachedContentProtocol(ContentApplication()), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        await _socket_control_during_bulk(results, port)
+    finally:
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,155 @@
+from openttd_protocol.protocol.content import (
+    ContentProtocol,
+    ContentType,
+)
+from openttd_protocol.protocol.coordinator import (
+    ConnectionType,
+    CoordinatorProtocol,
+    NetworkCoordinatorErrorType,
+)
+from openttd_protocol.protocol.game import GameProtocol
+from openttd_protocol.protocol.stun import StunProtocol
+from openttd_protocol.protocol.turn import TurnProtocol
+
+from . import payloads
+from .harness import (
+    connect,
+    measure,
+    measure_async,
+)
+
+
+def _new(protocol_class):
+    protocol = protocol_class(None)
+    protocol.task.cancel()
+    connect(protocol)
+    return protocol
+
+
+def _decode(results, protocol, name, packet):
+    packet = memoryview(packet)
+    source = protocol.source
+
+    # Make sure the payload is actually valid, before measuring it.
+    protocol.receive_packet(source, packet)
+
+    results.add(f"decode.{name}", measure(lambda: protocol.receive_packet(source, packet)), "ns/op")
+
+
+async def _encode(results, name, func):
+    results.add(f"encode.{name}", await measure_async(func), "ns/op")
+
+
+async def run(results):
+    content = _new(ContentProtocol)
+    coordinator = _new(CoordinatorProtocol)
+    game = _new(GameProtocol)
+    stun = _new(StunProtocol)
+    turn = _new(TurnProtocol)
+
+    # Decoding of every packet the library can receive.
+    _decode(results, content, "content.CLIENT_INFO_LIST", payloads.encode_CONTENT_CLIENT_INFO_LIST())
+    _decode(results, content, "content.CLIENT_INFO_ID[100]", payloads.encode_CONTENT_CLIENT_INFO_ID(range(100)))
+    _decode(results, content, "content.CLIENT_INFO_EXTID[50]", payloads.encode_CONTENT_CLIENT_INFO_EXTID(range(50)))
+    _decode(
+        results,
+        content,
+        "content.CLIENT_INFO_EXTID_MD5[50]",
+        payloads.encode_CONTENT_CLIENT_INFO_EXTID(range(50), with_md5sum=True),
+    )
+    _decode(results, content, "content.CLIENT_CONTENT[20]", payloads.encode_CONTENT_CLIENT_CONTENT(range(20)))
+
+    _decode(results, coordinator, "coordinator.SERVER_REGISTER", payloads.encode_COORDINATOR_SERVER_REGISTER())
+    _decode(results, coordinator, "coordinator.SERVER_UPDATE[0]", payloads.encode_COORDINATOR_SERVER_UPDATE(0))
+    _decode(results, coordinator, "coordinator.SERVER_UPDATE[30]", payloads.encode_COORDINATOR_SERVER_UPDATE(30))
+    _decode(results, coordinator, "coordinator.CLIENT_LISTING", payloads.encode_COORDINATOR_CLIENT_LISTING())
+    _decode(results, coordinator, "coordinator.CLIENT_CONNECT", payloads.encode_COORDINATOR_CLIENT_CONNECT())
+    _decode(
+        results, coordinator, "coordinator.SERCLI_CONNECT_FAILED", payloads.encode_COORDINATOR_SERCLI_CONNECT_FAILED()
+    )
+    _decode(results, coordinator, "coordinator.CLIENT_CONNECTED", payloads.encode_COORDINATOR_CLIENT_CONNECTED())
+    _decode(results, coordinator, "coordinator.SERCLI_STUN_RESULT", payloads.encode_COORDINATOR_SERCLI_STUN_RESULT())
+
+    _decode(results, game, "game.SERVER_GAME_INFO[30]", payloads.encode_GAME_SERVER_GAME_INFO(30))
+    _decode(results, game, "game.SERVER_SHUTDOWN", payloads.encode_GAME_SERVER_SHUTDOWN())
+
+    _decode(results, stun, "stun.SERCLI_STUN", payloads.encode_STUN_SERCLI_STUN())
+
+    _decode(results, turn, "turn.SERCLI_CONNECT", payloads.encode_TURN_SERCLI_CONNECT())
+
+    # Encoding (and sending) of every packet the library can send.
+    server_info = payloads.server_info_kwargs(1)
+    await _encode(results, "content.SERVER_INFO", lambda: content.send_PACKET_CONTENT_SERVER_INFO(**server_info))
+    await _encode(
+        results,
+        "content.SERVER_CONTENT[1MiB]",
+        lambda: content.send_PACKET_CONTENT_SERVER_CONTENT(
+            ContentType.CONTENT_TYPE_NEWGRF, 1, 1024 * 1024, "benchmark.tar", payloads.Stream(1024 * 1024)
+        ),
+    )
+
+    servers = payloads.servers(200)
+    newgrf_lookup_table = payloads.newgrf_lookup_table(500)
+    await _encode(
+        results,
+        "coordinator.GC_ERROR",
+        lambda: coordinator.send_PACKET_COORDINATOR_GC_ERROR(
+            6, NetworkCoordinatorErrorType.NETWORK_COORDINATOR_ERROR_INVALID_INVITE_CODE, "invalid invite code"
+        ),
+    )
+    await _encode(
+        results,
+        "coordinator.GC_REGISTER_ACK",
+        lambda: coordinator.send_PACKET_COORDINATOR_GC_REGISTER_ACK(
+            6, ConnectionType.CONNECTION_TYPE_DIRECT, "+abcdef", "secret"
+        ),
+    )
+    await _encode(
+        results,
+        "coordinator.GC_NEWGRF_LOOKUP[500]",
+        lambda: coordinator.send_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(6, 0, newgrf_lookup_table),
+    )
+    await _encode(
+        results,
+        "coordinator.GC_LISTING[200]",
+        lambda: coordinator.send_PACKET_COORDINATOR_GC_LISTING(6, 7, servers, newgrf_lookup_table),
+    )
+    await _encode(
+        results,
+        "coordinator.GC_LISTING[200,v4]",
+        lambda: coordinator.send_PACKET_COORDINATOR_GC_LISTING(6, 4, servers, newgrf_lookup_table),
+    )
+    await _encode(
+        results,
+        "coordinator.GC_CONNECTING",
+        lambda: coordinator.send_PACKET_COORDINATOR_GC_CONNECTING(6, "token", "+abcdef"),
+    )
+    await _encode(
+        results,
+        "coordinator.GC_CONNECT_FAILED",
+        lambda: coordinator.send_PACKET_COORDINATOR_GC_CONNECT_FAILED(6, "token"),
+    )
+    await _encode(
+        results,
+        "coordinator.GC_DIRECT_CONNECT",
+        lambda: coordinator.send_PACKET_COORDINATOR_GC_DIRECT_CONNECT(6, "token", 1, "192.0.2.1", 3979),
+    )
+    await _encode(
+        results,
+        "coordinator.GC_STUN_REQUEST",
+        lambda: coordinator.send_PACKET_COORDINATOR_GC_STUN_REQUEST(6, "token"),
+    )
+    await _encode(
+        results,
+        "coordinator.GC_STUN_CONNECT",
+        lambda: coordinator.send_PACKET_COORDINATOR_GC_STUN_CONNECT(6, "token", 1, 0, "192.0.2.1", 3979),
+    )
+    await _encode(
+        results,
+        "coordinator.GC_TURN_CONNECT",
+        lambda: coordinator.send_PACKET_COORDINATOR_GC_TURN_CONNECT(6, "token", 1, "ticket", "192.0.2.1:3974"),
+    )
+
+    await _encode(results, "game.CLIENT_GAME_INFO", lambda: game.send_PACKET_CLIENT_GAME_INFO())
+
+    await _encode(results, "turn.TURN_CONNECTED", lambda: turn.send_PACKET_TURN_TURN_CONNECTED(6, "192.0.2.1"))
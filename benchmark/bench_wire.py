@@ -0,0 +1,64 @@
+from openttd_protocol.wire.read import (
+    read_bytes,
+    read_string,
+    read_uint8,
+    read_uint16,
+    read_uint32,
+    read_uint64,
+)
+from openttd_protocol.wire.write import (
+    SEND_TCP_MTU,
+    write_bytes,
+    write_init,
+    write_presend,
+    write_string,
+    write_uint8,
+    write_uint16,
+    write_uint32,
+    write_uint64,
+)
+
+from .harness import measure
+
+
+def run(results):
+    data = memoryview(b"\x01\x02\x03\x04\x05\x06\x07\x08" * 8)
+    string = memoryview(b"OpenTTD Benchmark Server #1234\x00" + b"\x00" * 8)
+
+    for name, func in (
+        ("read_uint8", lambda: read_uint8(data)),
+        ("read_uint16", lambda: read_uint16(data)),
+        ("read_uint32", lambda: read_uint32(data)),
+        ("read_uint64", lambda: read_uint64(data)),
+        ("read_bytes[16]", lambda: read_bytes(data, 16)),
+        ("read_string[30]", lambda: read_string(string)),
+    ):
+        results.add(f"wire.{name}", measure(func), "ns/op")
+
+    # Writes append to a packet; start from a fresh one every now and then,
+    # to not measure the cost of an ever-growing bytearray.
+    packet = write_init(1)
+
+    def fresh(func):
+        def wrapper():
+            if len(packet) > 4096:
+                del packet[3:]
+            func()
+
+        return wrapper
+
+    for name, func in (
+        ("write_uint8", lambda: write_uint8(packet, 1)),
+        ("write_uint16", lambda: write_uint16(packet, 0x0201)),
+        ("write_uint32", lambda: write_uint32(packet, 0x04030201)),
+        ("write_uint64", lambda: write_uint64(packet, 0x0807060504030201)),
+        ("write_bytes[16]", lambda: write_bytes(packet, b"\x01" * 16)),
+        ("write_string[30]", lambda: write_string(packet, "OpenTTD Benchmark Server #1234")),
+    ):
+        results.add(f"wire.{name}", measure(fresh(func)), "ns/op")
+
+    results.add("wire.write_init", measure(lambda: write_init(1)), "ns/op")
+
+    presend = write_init(1)
+    write_bytes(presend, b"\x01" * 100)
+    results.add("wire.write_presend[100]", measure(lambda: write_presend(presend, SEND_TCP_MTU)), "ns/op")
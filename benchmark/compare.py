@@ -0,0 +1,36 @@
+import json
+
+
+def compare(baseline_filename, current_filename, threshold):
+    """Print the difference between two result files; returns the names of the regressed benchmarks."""
+    with open(baseline_filename) as f:
+        baseline = json.load(f)["results"]
+    with open(current_filename) as f:
+        current = json.load(f)["results"]
+
+    regressions = []
+    for name in sorted(set(baseline) & set(current)):
+        old = baseline[name]
+        new = current[name]
+        if old["value"] == 0:
+            continue
+
+        change = (new["value"] - old["value"]) / old["value"]
+        # Express every change as "positive is worse".
+        worse = -change if old["higher_is_better"] else change
+
+        marker = ""
+        if worse > threshold:
+            marker = "REGRESSION"
+            regressions.append(name)
+        elif worse < -threshold:
+            marker = "improvement"
+
+        print(f"{name:<72} {old['value']:>14.1f} {new['value']:>14.1f} {new['unit']:<10} {change:>+8.1%} {marker}")
+
+    for name in sorted(set(baseline) - set(current)):
+        print(f"{name:<72} missing in {current_filename}")
+    for name in sorted(set(current) - set(baseline)):
+        print(f"{name:<72} new in {current_filename}")
+
+    return regressions
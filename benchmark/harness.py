@@ -0,0 +1,117 @@
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+
+
+class Results:
+    def __init__(self):
+        self.results = {}
+
+    def add(self, name, value, unit, higher_is_better=False):
+        self.results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        print(f"{name:<72} {value:>14.1f} {unit}")
+
+    def save(self, filename):
+        data = {
+            "meta": {
+                "python": sys.version.split(" ")[0],
+                "implementation": platform.python_implementation(),
+                "platform": platform.platform(),
+                "timestamp": time.time(),
+            },
+            "results": self.results,
+        }
+        with open(filename, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+
+
+def measure(func, min_time=0.05, repeat=5):
+    """Return the median time in nanoseconds a single call to func takes."""
+    timer = timeit.Timer(func)
+
+    # Find how many calls it takes to run for at least min_time.
+    number = 1
+    while True:
+        duration = timer.timeit(number)
+        if duration >= min_time:
+            break
+        number *= 2 if duration == 0 else max(2, int(min_time / duration * 1.2))
+
+    timings = [timer.timeit(number) / number for _ in range(repeat)]
+    return statistics.median(timings) * 1e9
+
+
+async def measure_async(func, min_time=0.05, repeat=5):
+    """Return the median time in nanoseconds a single await of func() takes."""
+
+    async def run(number):
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        return time.perf_counter() - start
+
+    number = 1
+    while True:
+        duration = await run(number)
+        if duration >= min_time:
+            break
+        number *= 2 if duration == 0 else max(2, int(min_time / duration * 1.2))
+
+    timings = [await run(number) / number for _ in range(repeat)]
+    return statistics.median(timings) * 1e9
+
+
+def percentile(values, fraction):
+    """Return the value at the fraction (0..1) of the sorted values."""
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(fraction * (len(values) - 1)))))
+    return values[index]
+
+
+class NullTransport:
+    """Transport that accepts and discards everything written to it."""
+
+    def __init__(self, peername=("127.0.0.1", 12345)):
+        self.peername = peername
+        self.written = 0
+        self.closing = False
+
+    def get_extra_info(self, name, default=None):
+        if name in ("peername", "sockname"):
+            return self.peername
+        return default
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        pass
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def write(self, data):
+        self.written += len(data)
+
+    def is_closing(self):
+        return self.closing
+
+    def close(self):
+        self.closing = True
+
+    def abort(self):
+        self.closing = True
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+
+def connect(protocol, transport=None):
+    """Connect a protocol to a NullTransport, as if a client just connected."""
+    if transport is None:
+        transport = NullTransport()
+    protocol.connection_made(transport)
+    return transport
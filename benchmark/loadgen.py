@@ -0,0 +1,390 @@
+import argparse
+import asyncio
+import collections
+import random
+import time
+
+from openttd_protocol.protocol.content import PacketContentType
+from openttd_protocol.protocol.coordinator import PacketCoordinatorType
+from openttd_protocol.protocol.turn import PacketTurnType
+from openttd_protocol.wire.read import (
+    read_uint8,
+    read_uint16,
+)
+
+from . import payloads
+from .harness import percentile
+
+# Load generator simulating many OpenTTD clients / servers against a service
+# running on this machine. Every virtual client connects, does a few
+# requests picked from the mix, and disconnects again (connection churn).
+# New virtual clients arrive with exponentially distributed gaps, to get the
+# requested average arrival rate.
+#
+# Example, against a Game Coordinator listening on port 3976:
+#   python -m benchmark.loadgen coordinator --port 3976 --rate 200 --duration 30
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.error_types = collections.Counter()
+        self.connections = 0
+        self.connect_latencies = []
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def report(self, duration):
+        print(f"Duration:          {duration:.1f} s")
+        print(f"Connections:       {self.connections} ({self.connections / duration:.1f}/s)")
+        print(f"Packets sent:      {self.packets_sent} ({self.packets_sent / duration:.1f}/s)")
+        print(f"Packets received:  {self.packets_received} ({self.packets_received / duration:.1f}/s)")
+        print(f"Bytes sent:        {self.bytes_sent} ({self.bytes_sent / duration:.1f}/s)")
+        print(f"Bytes received:    {self.bytes_received} ({self.bytes_received / duration:.1f}/s)")
+        print()
+
+        print(f"{'action':<20} {'count':>8} {'errors':>8} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+        rows = [("tcp_connect", self.connect_latencies)] + sorted(self.latencies.items())
+        for name, latencies in rows:
+            errors = self.errors[name]
+            if not latencies:
+                print(f"{name:<20} {0:>8} {errors:>8}")
+                continue
+            print(
+                f"{name:<20} {len(latencies):>8} {errors:>8} "
+                f"{percentile(latencies, 0.5) * 1000:>10.2f} "
+                f"{percentile(latencies, 0.9) * 1000:>10.2f} "
+                f"{percentile(latencies, 0.99) * 1000:>10.2f} "
+                f"{max(latencies) * 1000:>10.2f}"
+            )
+
+        if self.error_types:
+            print()
+            print(f"{'error':<40} {'count':>8}")
+            for name, count in self.error_types.most_common():
+                print(f"{name:<40} {count:>8}")
+
+
+class Connection:
+    def __init__(self, reader, writer, stats, slow_read_rate):
+        self.reader = reader
+        self.writer = writer
+        self.stats = stats
+        self.slow_read_rate = slow_read_rate
+        self.registered = False
+
+    async def send(self, packet):
+        self.writer.write(packet)
+        await self.writer.drain()
+        self.stats.packets_sent += 1
+        self.stats.bytes_sent += len(packet)
+
+    async def _read(self, size):
+        if not self.slow_read_rate:
+            return await self.reader.readexactly(size)
+
+        # Slow readers read in small pieces, and wait between them. This
+        # makes the server's write buffer for this connection fill up.
+        data = b""
+        while len(data) < size:
+            chunk = await self.reader.readexactly(min(1024, size - len(data)))
+            data += chunk
+            await asyncio.sleep(len(chunk) / self.slow_read_rate)
+        return data
+
+    async def receive(self, timeout=None):
+        """Receive a single packet; returns its type and body."""
+        # Only waiting for the header can time out; a timeout while reading
+        # the body would leave the connection halfway a packet.
+        header = await asyncio.wait_for(self.reader.readexactly(2), timeout)
+        length, _ = read_uint16(memoryview(header))
+        body = memoryview(await self._read(length - 2))
+        packet_type, body = read_uint8(body)
+
+        self.stats.packets_received += 1
+        self.stats.bytes_received += length
+        return packet_type, body
+
+    async def receive_until(self, done):
+        while True:
+            packet_type, body = await self.receive()
+            if done(packet_type, body):
+                return
+
+    async def receive_answers(self, count, settle):
+        """Receive count packets; or, as a server skips what it doesn't know, till none arrive for settle seconds."""
+        # Returns when the last packet was received, so the time waiting for
+        # the answers that never come is not counted as latency.
+        received = None
+        while count is None or count > 0:
+            try:
+                await self.receive(timeout=None if received is None else settle)
+            except asyncio.TimeoutError:
+                break
+            received = time.perf_counter()
+            if count is not None:
+                count -= 1
+        return received
+
+    def close(self):
+        self.writer.close()
+
+
+# Every action sends one or more packets, and waits for the answer (if any).
+# An action can return when its answer was complete, if that was before it
+# returned.
+
+
+async def coordinator_register(connection, index):
+    await connection.send(payloads.encode_COORDINATOR_SERVER_REGISTER(invite_code=f"+lg{index}"))
+    await connection.receive_until(
+        lambda packet_type, body: packet_type
+        in (PacketCoordinatorType.PACKET_COORDINATOR_GC_REGISTER_ACK, PacketCoordinatorType.PACKET_COORDINATOR_GC_ERROR)
+    )
+    connection.registered = True
+
+
+async def coordinator_update(connection, index):
+    # A server has to register before it can send updates.
+    if not connection.registered:
+        await coordinator_register(connection, index)
+    await connection.send(payloads.encode_COORDINATOR_SERVER_UPDATE(name=f"Load generator {index}"))
+
+
+async def coordinator_listing(connection, index):
+    def done(packet_type, body):
+        # The listing ends with a GC_LISTING containing zero servers.
+        if packet_type != PacketCoordinatorType.PACKET_COORDINATOR_GC_LISTING:
+            return False
+        count, _ = read_uint16(body)
+        return count == 0
+
+    await connection.send(payloads.encode_COORDINATOR_CLIENT_LISTING())
+    await connection.receive_until(done)
+
+
+async def coordinator_connect(connection, index):
+    await connection.send(payloads.encode_COORDINATOR_CLIENT_CONNECT(invite_code=f"+lg{index}"))
+    await connection.receive()
+
+
+# The content service answers with a SERVER_INFO per entry it knows, and
+# nothing for those it doesn't; there is no packet marking the end.
+CONTENT_SETTLE = 0.2
+
+
+async def content_info_list(connection, index):
+    await connection.send(payloads.encode_CONTENT_CLIENT_INFO_LIST())
+    return await connection.receive_answers(None, CONTENT_SETTLE)
+
+
+async def content_info_id(connection, index):
+    await connection.send(payloads.encode_CONTENT_CLIENT_INFO_ID(random.sample(range(1, 10000), 20)))
+    return await connection.receive_answers(20, CONTENT_SETTLE)
+
+
+async def content_info_extid(connection, index):
+    await connection.send(payloads.encode_CONTENT_CLIENT_INFO_EXTID(random.sample(range(1, 10000), 20)))
+    return await connection.receive_answers(20, CONTENT_SETTLE)
+
+
+async def content_info_extid_md5(connection, index):
+    await connection.send(
+        payloads.encode_CONTENT_CLIENT_INFO_EXTID(random.sample(range(1, 10000), 20), with_md5sum=True)
+    )
+    return await connection.receive_answers(20, CONTENT_SETTLE)
+
+
+async def content_download(connection, index):
+    def done(packet_type, body):
+        # A file ends with an empty SERVER_CONTENT packet.
+        return packet_type == PacketContentType.PACKET_CONTENT_SERVER_CONTENT and len(body) == 0
+
+    await connection.send(payloads.encode_CONTENT_CLIENT_CONTENT([random.randint(1, 10000)]))
+    await connection.receive_until(done)
+
+
+async def stun_request(connection, index):
+    await connection.send(payloads.encode_STUN_SERCLI_STUN(token=f"lg{index}"))
+
+
+ACTIONS = {
+    "coordinator": {
+        "register": coordinator_register,
+        "update": coordinator_update,
+        "listing": coordinator_listing,
+        "connect": coordinator_connect,
+    },
+    "content": {
+        "info_list": content_info_list,
+        "info_id": content_info_id,
+        "info_extid": content_info_extid,
+        "info_extid_md5": content_info_extid_md5,
+        "download": content_download,
+    },
+    "stun": {
+        "stun": stun_request,
+    },
+    "turn": {
+        # TURN is handled separately, as it needs two connections.
+        "connect": None,
+    },
+}
+
+DEFAULT_MIX = {
+    "coordinator": "register=1,update=10,listing=5,connect=2",
+    "content": "info_list=5,info_id=3,info_extid=3,info_extid_md5=1,download=1",
+    "stun": "stun=1",
+    "turn": "connect=1",
+}
+
+
+class LoadGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.stats = Stats()
+
+        self.actions = []
+        self.weights = []
+        for entry in (args.mix or DEFAULT_MIX[args.protocol]).split(","):
+            name, _, weight = entry.partition("=")
+            if name not in ACTIONS[args.protocol]:
+                raise ValueError(f"unknown action for {args.protocol}: {name}")
+            self.actions.append(name)
+            self.weights.append(float(weight or 1))
+
+        self._index = 0
+        self._semaphore = None
+
+    async def _connect(self):
+        start = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.args.host, self.args.port), self.args.timeout
+        )
+        self.stats.connect_latencies.append(time.perf_counter() - start)
+        self.stats.connections += 1
+
+        slow_read_rate = self.args.slow_read_rate if random.random() < self.args.slow_readers else None
+        return Connection(reader, writer, self.stats, slow_read_rate)
+
+    def _failed(self, name, err):
+        self.stats.errors[name] += 1
+        self.stats.error_types[type(err).__name__] += 1
+        if self.args.verbose:
+            print(f"{name} failed: {err!r}")
+
+    async def _timed(self, name, coroutine):
+        start = time.perf_counter()
+        try:
+            end = await asyncio.wait_for(coroutine, self.args.timeout)
+        except Exception as err:
+            # Also unexpected errors, like an answer that doesn't parse; they
+            # are reported by type, instead of ending the client.
+            self._failed(name, err)
+            return False
+
+        if end is None:
+            end = time.perf_counter()
+        self.stats.latencies[name].append(end - start)
+        return True
+
+    async def _turn_client(self, index):
+        # Two connections with the same ticket are paired by the TURN server.
+        ticket = f"lg{index}"
+
+        async def side():
+            connection = await self._connect()
+            try:
+                await connection.send(payloads.encode_TURN_SERCLI_CONNECT(ticket=ticket))
+                await connection.receive_until(
+                    lambda packet_type, body: packet_type == PacketTurnType.PACKET_TURN_TURN_CONNECTED
+                )
+            finally:
+                connection.close()
+
+        await self._timed("connect", asyncio.gather(side(), side()))
+
+    async def _client(self, index):
+        if self.args.protocol == "turn":
+            await self._turn_client(index)
+            return
+
+        try:
+            connection = await self._connect()
+        except (asyncio.TimeoutError, OSError) as err:
+            self._failed("tcp_connect", err)
+            return
+
+        try:
+            for _ in range(self.args.requests_per_connection):
+                name = random.choices(self.actions, self.weights)[0]
+                if not await self._timed(name, ACTIONS[self.args.protocol][name](connection, index)):
+                    break
+        finally:
+            connection.close()
+
+    async def _guarded_client(self, index):
+        try:
+            await self._client(index)
+        except Exception as err:
+            # Nobody awaits the task of a client; so report it here, or it
+            # would go unnoticed.
+            self._failed("client", err)
+        finally:
+            self._semaphore.release()
+
+    async def run(self):
+        self._semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        tasks = set()
+        start = time.perf_counter()
+        deadline = start + self.args.duration
+
+        while time.perf_counter() < deadline:
+            await self._semaphore.acquire()
+
+            self._index += 1
+            task = asyncio.create_task(self._guarded_client(self._index))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+            if self.args.rate:
+                await asyncio.sleep(random.expovariate(self.args.rate))
+
+        if tasks:
+            await asyncio.wait(tasks)
+
+        self.stats.report(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark.loadgen", description="Load generator")
+    parser.add_argument("protocol", choices=list(ACTIONS), help="protocol of the service to load")
+    parser.add_argument("--host", default="127.0.0.1", help="host of the service (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, required=True, help="port of the service")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to generate new clients (default: 10)")
+    parser.add_argument("--rate", type=float, default=100, help="new clients per second; 0 is unlimited")
+    parser.add_argument("--concurrency", type=int, default=1000, help="max concurrent clients (default: 1000)")
+    parser.add_argument(
+        "--requests-per-connection", type=int, default=5, help="requests before reconnecting (default: 5)"
+    )
+    parser.add_argument("--mix", help="weighted actions, like 'listing=5,connect=1'")
+    parser.add_argument("--slow-readers", type=float, default=0, help="fraction of clients reading slowly (0..1)")
+    parser.add_argument("--slow-read-rate", type=float, default=16384, help="bytes/s a slow reader reads")
+    parser.add_argument("--timeout", type=float, default=10, help="seconds before a request fails (default: 10)")
+    parser.add_argument("--verbose", action="store_true", help="print every failure")
+    args = parser.parse_args()
+
+    try:
+        generator = LoadGenerator(args)
+    except ValueError as err:
+        parser.error(str(err))
+
+    asyncio.run(generator.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import hashlib
+import struct
+
+from openttd_protocol.protocol.content import (
+    ContentType,
+    PacketContentType,
+)
+from openttd_protocol.protocol.coordinator import (
+    NewGRFSerializationType,
+    PacketCoordinatorType,
+)
+from openttd_protocol.protocol.game import PacketGameType
+from openttd_protocol.protocol.stun import PacketStunType
+from openttd_protocol.protocol.turn import PacketTurnType
+from openttd_protocol.wire.write import (
+    SEND_TCP_MTU,
+    write_bytes,
+    write_init,
+    write_presend,
+    write_string,
+    write_uint8,
+    write_uint16,
+    write_uint32,
+    write_uint64,
+)
+
+# The library implements the server side of most protocols; these are the
+# client side counterparts, to create realistic packets to feed to it.
+
+
+def _md5(value):
+    return hashlib.md5(str(value).encode()).digest()
+
+
+def encode_CONTENT_CLIENT_INFO_LIST(content_type=ContentType.CONTENT_TYPE_NEWGRF, branch_versions=None):
+    if branch_versions is None:
+        branch_versions = {"vanilla": "14.0", "jgrpp": "0.60"}
+
+    data = write_init(PacketContentType.PACKET_CONTENT_CLIENT_INFO_LIST)
+    write_uint8(data, content_type)
+    write_uint32(data, 0xFFFFFFFF)
+    write_uint8(data, len(branch_versions))
+    for branch, version in branch_versions.items():
+        write_string(data, branch)
+        write_string(data, version)
+    return write_presend(data, SEND_TCP_MTU)
+
+
+def encode_CONTENT_CLIENT_INFO_ID(content_ids, packet_type=PacketContentType.PACKET_CONTENT_CLIENT_INFO_ID):
+    data = write_init(packet_type)
+    write_uint16(data, len(content_ids))
+    for content_id in content_ids:
+        write_uint32(data, content_id)
+    return write_presend(data, SEND_TCP_MTU)
+
+
+def encode_CONTENT_CLIENT_CONTENT(content_ids):
+    return encode_CONTENT_CLIENT_INFO_ID(content_ids, PacketContentType.PACKET_CONTENT_CLIENT_CONTENT)
+
+
+def encode_CONTENT_CLIENT_INFO_EXTID(unique_ids, with_md5sum=False):
+    if with_md5sum:
+        data = write_init(PacketContentType.PACKET_CONTENT_CLIENT_INFO_EXTID_MD5)
+    else:
+        data = write_init(PacketContentType.PACKET_CONTENT_CLIENT_INFO_EXTID)
+    write_uint8(data, len(unique_ids))
+    for unique_id in unique_ids:
+        write_uint8(data, ContentType.CONTENT_TYPE_NEWGRF)
+        write_uint32(data, unique_id)
+        if with_md5sum:
+            write_bytes(data, _md5(unique_id))
+    return write_presend(data, SEND_TCP_MTU)
+
+
+def encode_COORDINATOR_SERVER_REGISTER(invite_code="+abcdef", server_port=3979, protocol_version=6):
+    data = write_init(PacketCoordinatorType.PACKET_COORDINATOR_SERVER_REGISTER)
+    write_uint8(data, protocol_version)
+    write_uint8(data, 1)  # SERVER_GAME_TYPE_PUBLIC
+    write_uint16(data, server_port)
+    write_string(data, invite_code)
+    write_string(data, "secret")
+    return write_presend(data, SEND_TCP_MTU)
+
+
+def _write_game_info(data, newgrf_count, name, clients_on):
+    write_uint8(data, 7)  # game_info_version
+    write_uint64(data, 123456789)  # ticks_playing
+    write_uint8(data, NewGRFSerializationType.NST_GRFID_MD5_NAME)
+    write_uint32(data, 0xFFFFFFFF)  # gamescript_version
+    write_string(data, "")  # gamescript_name
+    write_uint8(data, newgrf_count)
+    for i in range(newgrf_count):
+        write_uint32(data, 0x4E4D0000 + i)
+        write_bytes(data, _md5(i))
+        write_string(data, f"NewGRF number {i}")
+    write_uint32(data, 730000)  # game_date
+    write_uint32(data, 720000)  # start_date
+    write_uint8(data, 15)  # companies_max
+    write_uint8(data, 3)  # companies_on
+    write_uint8(data, 10)  # spectators_max
+    write_string(data, name)
+    write_string(data, "14.0")
+    write_uint8(data, 0)  # use_password
+    write_uint8(data, 25)  # clients_max
+    write_uint8(data, clients_on)
+    write_uint8(data, 0)  # spectators_on
+    write_uint16(data, 512)  # map_width
+    write_uint16(data, 512)  # map_height
+    write_uint8(data, 0)  # map_type
+    write_uint8(data, 1)  # is_dedicated
+
+
+def encode_COORDINATOR_SERVER_UPDATE(newgrf_count=30, name="Benchmark server", clients_on=5):
+    data = write_init(PacketCoordinatorType.PACKET_COORDINATOR_SERVER_UPDATE)
+    write_uint8(data, 6)  # protocol_version
+    _write_game_info(data, newgrf_count, name, clients_on)
+    return write_presend(data, SEND_TCP_MTU)
+
+
+def encode_GAME_SERVER_GAME_INFO(newgrf_count=30, name="Benchmark server", clients_on=5):
+    data = write_init(PacketGameType.PACKET_SERVER_GAME_INFO)
+    _write_game_info(data, newgrf_count, name, clients_on)
+    return write_presend(data, SEND_TCP_MTU)
+
+
+def encode_GAME_SERVER_SHUTDOWN():
+    data = write_init(PacketGameType.PACKET_SERVER_SHUTDOWN)
+    return write_presend(data, SEND_TCP_MTU)
+
+
+def encode_COORDINATOR_CLIENT_LISTING(newgrf_lookup_table_cursor=0):
+    data = write_init(PacketCoordinatorType.PACKET_COORDINATOR_CLIENT_LISTING)
+    write_uint8(data, 6)  # protocol_version
+    write_uint8(data, 7)  # game_info_version
+    write_string(data, "14.0")
+    write_uint32(data, newgrf_lookup_table_cursor)
+    return write_presend(data, SEND_TCP_MTU)
+
+
+def encode_COORDINATOR_CLIENT_CONNECT(invite_code="+abcdef"):
+    data = write_init(PacketCoordinatorType.PACKET_COORDINATOR_CLIENT_CONNECT)
+    write_uint8(data, 6)  # protocol_version
+    write_string(data, invite_code)
+    return write_presend(data, SEND_TCP_MTU)
+
+
+def encode_COORDINATOR_SERCLI_CONNECT_FAILED(token="token"):
+    data = write_init(PacketCoordinatorType.PACKET_COORDINATOR_SERCLI_CONNECT_FAILED)
+    write_uint8(data, 6)  # protocol_version
+    write_string(data, token)
+    write_uint8(data, 1)  # tracking_number
+    return write_presend(data, SEND_TCP_MTU)
+
+
+def encode_COORDINATOR_CLIENT_CONNECTED(token="token"):
+    data = write_init(PacketCoordinatorType.PACKET_COORDINATOR_CLIENT_CONNECTED)
+    write_uint8(data, 6)  # protocol_version
+    write_string(data, token)
+    return write_presend(data, SEND_TCP_MTU)
+
+
+def encode_COORDINATOR_SERCLI_STUN_RESULT(token="token"):
+    data = write_init(PacketCoordinatorType.PACKET_COORDINATOR_SERCLI_STUN_RESULT)
+    write_uint8(data, 6)  # protocol_version
+    write_string(data, token)
+    write_uint8(data, 0)  # interface_number
+    write_uint8(data, 1)  # result
+    return write_presend(data, SEND_TCP_MTU)
+
+
+def encode_STUN_SERCLI_STUN(token="token", interface_number=0):
+    data = write_init(PacketStunType.PACKET_STUN_SERCLI_STUN)
+    write_uint8(data, 6)  # protocol_version
+    write_string(data, token)
+    write_uint8(data, interface_number)
+    return write_presend(data, SEND_TCP_MTU)
+
+
+def encode_TURN_SERCLI_CONNECT(ticket="ticket"):
+    data = write_init(PacketTurnType.PACKET_TURN_SERCLI_CONNECT)
+    write_uint8(data, 6)  # protocol_version
+    write_string(data, ticket)
+    return write_presend(data, SEND_TCP_MTU)
+
+
+# Arguments for the send_* functions of the library.
+
+
+def server_info_kwargs(content_id):
+    return {
+        "content_type": ContentType.CONTENT_TYPE_NEWGRF,
+        "content_id": content_id,
+        "filesize": 123456,
+        "name": f"Benchmark NewGRF {content_id}",
+        "version": "1.2.3",
+        "url": "https://www.openttd.org/",
+        "description": "A NewGRF used for benchmarking. " * 8,
+        "unique_id": struct.pack(">I", 0x4E4D0000 + content_id),
+        "md5sum": _md5(content_id),
+        "dependencies": [1, 2, 3],
+        "tags": ["benchmark", "trains", "realistic"],
+    }
+
+
+class Server:
+    def __init__(self, index, newgrf_count=30):
+        self.game_type = 1  # SERVER_GAME_TYPE_PUBLIC
+        self.connection_string = f"192.0.2.{index % 250}:{3979 + index}"
+        self.newgrfs_indexed = list(range(newgrf_count))
+        self.info = {
+            "ticks_playing": 123456789,
+            "gamescript_version": None,
+            "gamescript_name": None,
+            "game_date": 730000,
+            "start_date": 720000,
+            "companies_max": 15,
+            "companies_on": 3,
+            "spectators_max": 10,
+            "name": f"Benchmark server {index}",
+            "openttd_version": "14.0",
+            "use_password": 0,
+            "clients_max": 25,
+            "clients_on": 5,
+            "spectators_on": 0,
+            "map_width": 512,
+            "map_height": 512,
+            "map_type": 0,
+            "is_dedicated": 1,
+        }
+
+
+def servers(count, newgrf_count=30):
+    return [Server(index, newgrf_count) for index in range(count)]
+
+
+def newgrf_lookup_table(count):
+    return {
+        index: {"grfid": 0x4E4D0000 + index, "md5sum": _md5(index).hex(), "name": f"NewGRF {index}"}
+        for index in range(count)
+    }
+
+
+class Stream:
+    """Minimal in-memory file, as expected by send_PACKET_CONTENT_SERVER_CONTENT."""
+
+    def __init__(self, size):
+        self._data = memoryview(b"\x5a" * size)
+        self._offset = 0
+
+    def eof(self):
+        return self._offset >= len(self._data)
+
+    def read(self, count):
+        data = self._data[self._offset : self._offset + count]
+        self._offset += count
+        return data
@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import collections
+import time
+
+from openttd_protocol.protocol.content import ContentProtocol
+from openttd_protocol.protocol.coordinator import CoordinatorProtocol
+from openttd_protocol.protocol.game import GameProtocol
+from openttd_protocol.protocol.stun import StunProtocol
+from openttd_protocol.protocol.turn import TurnProtocol
+from openttd_protocol.wire.capture import (
+    Direction,
+    read_capture,
+)
+from openttd_protocol.wire.exceptions import PacketInvalid
+
+from .harness import connect
+
+# Replay the packets received in a capture (see PacketCapture), either
+# through the decoders of a protocol, or over a socket to a service running
+# on this machine. By default as fast as possible; with --speed 1 at the
+# original timing (--speed 2 twice as fast, etc).
+#
+# Examples:
+#   python -m benchmark.replay capture.bin --protocol coordinator
+#   python -m benchmark.replay capture.bin --port 3976 --speed 1
+
+PROTOCOLS = {
+    "content": ContentProtocol,
+    "coordinator": CoordinatorProtocol,
+    "game": GameProtocol,
+    "stun": StunProtocol,
+    "turn": TurnProtocol,
+}
+
+
+class Pacer:
+    """Sleep till a record is due, relative to the first record."""
+
+    def __init__(self, speed):
+        self.speed = speed
+        self._first = None
+        self._start = None
+
+    async def wait(self, timestamp):
+        if not self.speed:
+            return
+
+        if self._first is None:
+            self._first = timestamp
+            self._start = time.perf_counter()
+            return
+
+        delay = (timestamp - self._first) / self.speed - (time.perf_counter() - self._start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def received(filenames):
+    for filename in filenames:
+        for timestamp, connection_id, direction, packet in read_capture(filename):
+            if direction == Direction.RECEIVED:
+                yield timestamp, connection_id, packet
+
+
+async def replay_decode(args):
+    pacer = Pacer(args.speed)
+    protocols = {}
+    counts = collections.Counter()
+    decode_time = 0.0
+
+    start = time.perf_counter()
+    for timestamp, connection_id, packet in received(args.capture):
+        await pacer.wait(timestamp)
+
+        protocol = protocols.get(connection_id)
+        if protocol is None:
+            protocol = protocols[connection_id] = PROTOCOLS[args.protocol](None)
+            protocol.task.cancel()
+            connect(protocol)
+
+        decode_start = time.perf_counter()
+        try:
+            packet_type, _ = protocol.receive_packet(protocol.source, packet)
+        except PacketInvalid:
+            counts["invalid"] += 1
+            continue
+        finally:
+            decode_time += time.perf_counter() - decode_start
+
+        counts[packet_type.name] += 1
+    duration = time.perf_counter() - start
+
+    total = sum(counts.values())
+    print(f"Connections:      {len(protocols)}")
+    print(f"Packets:          {total} in {duration:.2f} s")
+    if decode_time:
+        print(f"Decode rate:      {total / decode_time:.0f} packets/s")
+    print()
+    for name, count in counts.most_common():
+        print(f"{name:<56} {count:>10}")
+
+
+async def _drain(reader, stats):
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            return
+        stats["bytes_received"] += len(data)
+
+
+async def replay_loopback(args):
+    pacer = Pacer(args.speed)
+    connections = {}
+    drains = []
+    stats = collections.Counter()
+
+    start = time.perf_counter()
+    for timestamp, connection_id, packet in received(args.capture):
+        await pacer.wait(timestamp)
+
+        writer = connections.get(connection_id)
+        if writer is None:
+            reader, writer = await asyncio.open_connection(args.host, args.port)
+            connections[connection_id] = writer
+            # Read (and discard) everything the service sends back, so it
+            # never stalls on us.
+            drains.append(asyncio.create_task(_drain(reader, stats)))
+
+        writer.write(packet)
+        await writer.drain()
+        stats["packets_sent"] += 1
+        stats["bytes_sent"] += len(packet)
+
+    duration = time.perf_counter() - start
+
+    # Give the service a moment to answer the last packets.
+    await asyncio.sleep(args.linger)
+
+    for writer in connections.values():
+        writer.close()
+    await asyncio.gather(*drains, return_exceptions=True)
+
+    print(f"Connections:      {len(connections)}")
+    print(f"Duration:         {duration:.2f} s")
+    print(f"Packets sent:     {stats['packets_sent']} ({stats['packets_sent'] / duration:.0f}/s)")
+    print(f"Bytes sent:       {stats['bytes_sent']} ({stats['bytes_sent'] / duration:.0f}/s)")
+    print(f"Bytes received:   {stats['bytes_received']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark.replay", description="Replay a packet capture")
+    parser.add_argument("capture", nargs="+", help="capture file(s), oldest first")
+    parser.add_argument("--protocol", choices=list(PROTOCOLS), help="decode with this protocol")
+    parser.add_argument("--host", default="127.0.0.1", help="host of the service (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, help="send to the service on this port")
+    parser.add_argument(
+        "--speed", type=float, default=0, help="1 is the original timing, 2 twice as fast; 0 (default) is unpaced"
+    )
+    parser.add_argument("--linger", type=float, default=1, help="seconds to wait for answers at the end (default: 1)")
+    args = parser.parse_args()
+
+    if (args.protocol is None) == (args.port is None):
+        parser.error("either --protocol or --port is required")
+
+    if args.protocol:
+        asyncio.run(replay_decode(args))
+    else:
+        asyncio.run(replay_loopback(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+import collections
+
+import numpy
+
+from ..protocol.coordinator import (
+    DAYS_TILL_ORIGINAL_BASE_YEAR,
+    GAMESCRIPT_VERSION_NONE,
+    NewGRFSerializationType,
+    PacketCoordinatorType,
+)
+from ..protocol.game import PacketGameType
+from ..wire.capture import (
+    Direction,
+    read_capture,
+)
+
+# Decode many SERVER_UPDATE (Game Coordinator) or SERVER_GAME_INFO (game
+# server) packets at once into columns, for offline analysis of captured
+# traffic. This requires numpy; install the "columnar" extra.
+#
+# Fields at a fixed offset are read for all packets of a game_info_version
+# at once. Only finding the end of the strings (and of the NewGRF list) is
+# done per packet; the fields after them are read in bulk again, relative to
+# the offsets found.
+#
+# Columns are named after the fields of the decoded messages. Fields that do
+# not exist in older versions are 0, and gamescript_version is
+# GAMESCRIPT_VERSION_NONE; dates and ticks_playing are converted the same as
+# receive_* would. Instead of the NewGRFs themselves there is newgrf_count.
+# Strings are stored as codes into a table of unique strings, where code 0 is
+# the empty string. Packets that fail to decode, including those with a
+# string that is not valid UTF-8, have valid set to False, and their other
+# columns are 0.
+
+Columns = collections.namedtuple("Columns", ["columns", "strings"])
+
+_STRING_COLUMNS = ("gamescript_name", "name", "openttd_version")
+
+
+def frame(data):
+    """Return the offsets of the (framed) packets in data."""
+    offsets = []
+    offset = 0
+    while offset + 2 <= len(data):
+        length = data[offset] | (data[offset + 1] << 8)
+        if length < 3 or offset + length > len(data):
+            break
+        offsets.append(offset)
+        offset += length
+    return numpy.array(offsets, dtype=numpy.int64)
+
+
+def load_capture(filename, packet_type):
+    """Return (data, offsets) of the received packets of this type in a PacketCapture file."""
+    packets = [
+        bytes(packet)
+        for _, _, direction, packet in read_capture(filename)
+        if direction == Direction.RECEIVED and len(packet) > 2 and packet[2] == packet_type
+    ]
+    data = b"".join(packets)
+    return data, frame(data)
+
+
+def _uint(buf, positions, size):
+    value = buf[positions].astype(numpy.uint64)
+    for i in range(1, size):
+        value |= buf[positions + i].astype(numpy.uint64) << numpy.uint64(8 * i)
+    return value
+
+
+def _is_utf8(value):
+    try:
+        value.decode()
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _scan(data, offsets, lengths, positions, game_info_version, newgrf_serialization_type, tables, skipped):
+    # Per packet, find the end of every string and of the NewGRF list. Returns
+    # whether every packet is valid, its newgrf_count, the codes of its
+    # strings, and the offsets of the field after the NewGRF list, after
+    # openttd_version and after the map-name (which is where map_width is).
+    count = len(offsets)
+    valid = numpy.ones(count, dtype=bool)
+    newgrf_counts = numpy.zeros(count, dtype=numpy.uint8)
+    anchors = numpy.zeros((3, count), dtype=numpy.int64)
+    codes = {name: numpy.zeros(count, dtype=numpy.int32) for name in _STRING_COLUMNS}
+
+    def skip_string(pos, end):
+        nul = data.find(b"\0", pos, end)
+        if nul < 0:
+            raise IndexError
+        return nul + 1
+
+    def check_string(pos, end):
+        # Strings that are not stored are still decoded by receive_*, so they
+        # have to be valid UTF-8 too. Like the stored strings, every unique
+        # one is only checked once.
+        next_pos = skip_string(pos, end)
+        value = data[pos : next_pos - 1]
+        if value not in skipped:
+            skipped[value] = _is_utf8(value)
+        if not skipped[value]:
+            raise IndexError
+        return next_pos
+
+    def read_string(name, row, pos, end):
+        next_pos = skip_string(pos, end)
+        table = tables[name]
+        codes[name][row] = table.setdefault(data[pos : next_pos - 1], len(table))
+        return next_pos
+
+    with_names = newgrf_serialization_type == NewGRFSerializationType.NST_GRFID_MD5_NAME
+
+    for row in range(count):
+        pos = positions[row]
+        end = offsets[row] + lengths[row]
+
+        try:
+            if game_info_version >= 5:
+                pos = read_string("gamescript_name", row, pos, end)
+
+            if game_info_version >= 4:
+                if pos >= end:
+                    raise IndexError
+                newgrf_count = newgrf_counts[row] = data[pos]
+                pos += 1
+                if with_names[row]:
+                    for _ in range(newgrf_count):
+                        pos = check_string(pos + 20, end)
+                else:
+                    pos += newgrf_count * 20
+            anchors[0, row] = pos
+
+            pos += (8 if game_info_version >= 3 else 0) + (3 if game_info_version >= 2 else 0)
+            pos = read_string("name", row, pos, end)
+            pos = read_string("openttd_version", row, pos, end)
+            anchors[1, row] = pos
+
+            pos += (1 if game_info_version < 6 else 0) + 4 + (4 if game_info_version < 3 else 0)
+            if game_info_version < 6:
+                pos = check_string(pos, end)  # Unused, used to be map-name
+            anchors[2, row] = pos
+
+            if pos + 6 != end:
+                raise IndexError
+        except IndexError:
+            valid[row] = False
+
+    return valid, newgrf_counts, codes, anchors
+
+
+def _clear_invalid(columns):
+    invalid = ~columns["valid"]
+    for name, column in columns.items():
+        if name != "valid":
+            column[invalid] = 0
+
+
+def _decode(data, offsets, header):
+    # "header" is the offset of game_info_version in the packet.
+    buf = numpy.frombuffer(data, dtype=numpy.uint8)
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    count = len(offsets)
+
+    if count:
+        lengths = _uint(buf, offsets, 2).astype(numpy.int64)
+        game_info_versions = numpy.where(lengths > header, buf[numpy.minimum(offsets + header, len(buf) - 1)], 0)
+    else:
+        lengths = numpy.zeros(0, dtype=numpy.int64)
+        game_info_versions = numpy.zeros(0, dtype=numpy.uint8)
+
+    columns = {
+        "valid": numpy.zeros(count, dtype=bool),
+        "game_info_version": game_info_versions.astype(numpy.uint8),
+        "ticks_playing": numpy.zeros(count, dtype=numpy.uint64),
+        "newgrf_serialization_type": numpy.zeros(count, dtype=numpy.uint8),
+        "gamescript_version": numpy.zeros(count, dtype=numpy.uint32),
+        "newgrf_count": numpy.zeros(count, dtype=numpy.uint8),
+        "game_date": numpy.zeros(count, dtype=numpy.uint32),
+        "start_date": numpy.zeros(count, dtype=numpy.uint32),
+        "companies_max": numpy.zeros(count, dtype=numpy.uint8),
+        "companies_on": numpy.zeros(count, dtype=numpy.uint8),
+        "spectators_max": numpy.zeros(count, dtype=numpy.uint8),
+        "use_password": numpy.zeros(count, dtype=numpy.uint8),
+        "clients_max": numpy.zeros(count, dtype=numpy.uint8),
+        "clients_on": numpy.zeros(count, dtype=numpy.uint8),
+        "spectators_on": numpy.zeros(count, dtype=numpy.uint8),
+        "map_width": numpy.zeros(count, dtype=numpy.uint16),
+        "map_height": numpy.zeros(count, dtype=numpy.uint16),
+        "map_type": numpy.zeros(count, dtype=numpy.uint8),
+        "is_dedicated": numpy.zeros(count, dtype=numpy.uint8),
+    }
+    for name in _STRING_COLUMNS:
+        columns[name] = numpy.zeros(count, dtype=numpy.int32)
+
+    # Code 0 is the empty string, which is also used for missing strings.
+    tables = {name: {b"": 0} for name in _STRING_COLUMNS}
+    skipped = {}
+
+    for game_info_version in range(1, 8):
+        rows = numpy.flatnonzero(game_info_versions == game_info_version)
+
+        # The fields before the first string are at a fixed offset.
+        fixed = header + 1 + (8 if game_info_version >= 7 else 0) + (1 if game_info_version >= 6 else 0)
+        fixed += 4 if game_info_version >= 5 else 0
+        rows = rows[lengths[rows] >= fixed]
+        if len(rows) == 0:
+            continue
+
+        pos = offsets[rows] + header + 1
+        if game_info_version >= 7:
+            ticks_playing = _uint(buf, pos, 8)
+            pos += 8
+
+        if game_info_version >= 6:
+            newgrf_serialization_type = buf[pos]
+            pos += 1
+        else:
+            newgrf_serialization_type = numpy.full(
+                len(rows), NewGRFSerializationType.NST_CONVERSION_GRFID_MD5, dtype=numpy.uint8
+            )
+
+        if game_info_version >= 5:
+            gamescript_version = _uint(buf, pos, 4)
+            pos += 4
+        else:
+            gamescript_version = numpy.full(len(rows), GAMESCRIPT_VERSION_NONE, dtype=numpy.uint32)
+
+        valid, newgrf_counts, codes, anchors = _scan(
+            data,
+            offsets[rows].tolist(),
+            lengths[rows].tolist(),
+            pos.tolist(),
+            game_info_version,
+            newgrf_serialization_type,
+            tables,
+            skipped,
+        )
+        if game_info_version >= 6:
+            valid &= newgrf_serialization_type < NewGRFSerializationType.NST_END
+            valid &= newgrf_serialization_type != NewGRFSerializationType.NST_LOOKUP_ID
+
+        # From here on, only read the packets that are complete.
+        rows, anchors = rows[valid], anchors[:, valid]
+        columns["valid"][rows] = True
+        columns["newgrf_serialization_type"][rows] = newgrf_serialization_type[valid]
+        columns["gamescript_version"][rows] = gamescript_version[valid]
+        columns["newgrf_count"][rows] = newgrf_counts[valid]
+        for name in _STRING_COLUMNS:
+            columns[name][rows] = codes[name][valid]
+
+        pos = anchors[0]
+        if game_info_version >= 3:
+            columns["game_date"][rows] = _uint(buf, pos, 4)
+            columns["start_date"][rows] = _uint(buf, pos + 4, 4)
+            pos = pos + 8
+        if game_info_version >= 2:
+            columns["companies_max"][rows] = buf[pos]
+            columns["companies_on"][rows] = buf[pos + 1]
+            columns["spectators_max"][rows] = buf[pos + 2]
+
+        pos = anchors[1]
+        if game_info_version < 6:
+            pos = pos + 1  # Unused, used to be server-lang
+        columns["use_password"][rows] = buf[pos]
+        columns["clients_max"][rows] = buf[pos + 1]
+        columns["clients_on"][rows] = buf[pos + 2]
+        columns["spectators_on"][rows] = buf[pos + 3]
+        if game_info_version < 3:
+            columns["game_date"][rows] = _uint(buf, pos + 4, 2) + DAYS_TILL_ORIGINAL_BASE_YEAR
+            columns["start_date"][rows] = _uint(buf, pos + 6, 2) + DAYS_TILL_ORIGINAL_BASE_YEAR
+
+        pos = anchors[2]
+        columns["map_width"][rows] = _uint(buf, pos, 2)
+        columns["map_height"][rows] = _uint(buf, pos + 2, 2)
+        columns["map_type"][rows] = buf[pos + 4]
+        columns["is_dedicated"][rows] = buf[pos + 5]
+
+        if game_info_version >= 7:
+            columns["ticks_playing"][rows] = ticks_playing[valid]
+        else:
+            # Estimate, like receive_* does.
+            days = columns["game_date"][rows].astype(numpy.int64) - columns["start_date"][rows].astype(numpy.int64)
+            columns["ticks_playing"][rows] = numpy.maximum(0, days * 74)
+
+    # Packets using a string that is not valid UTF-8 are invalid. Their code
+    # stays taken, but as no valid packet uses it, it is the empty string.
+    strings = {}
+    for name, table in tables.items():
+        strings[name] = []
+        invalid = []
+        for code, value in enumerate(table):
+            if _is_utf8(value):
+                strings[name].append(value.decode())
+            else:
+                strings[name].append("")
+                invalid.append(code)
+        if invalid:
+            columns["valid"] &= ~numpy.isin(columns[name], invalid)
+
+    return Columns(columns, strings)
+
+
+def decode_server_updates(data, offsets):
+    """Decode the Game Coordinator SERVER_UPDATE packets at these offsets in data into columns."""
+    columns, strings = _decode(data, offsets, 4)
+
+    # Valid packets are long enough to have a protocol_version.
+    buf = numpy.frombuffer(data, dtype=numpy.uint8)
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    protocol_version = numpy.zeros(len(offsets), dtype=numpy.uint8)
+    protocol_version[columns["valid"]] = buf[offsets[columns["valid"]] + 3]
+    columns["protocol_version"] = protocol_version
+    columns["valid"] &= (protocol_version >= 1) & (protocol_version <= 6)
+
+    _clear_invalid(columns)
+    return Columns(columns, strings)
+
+
+def decode_game_infos(data, offsets):
+    """Decode the SERVER_GAME_INFO packets at these offsets in data into columns."""
+    columns, strings = _decode(data, offsets, 3)
+    _clear_invalid(columns)
+    return Columns(columns, strings)
+
+
+def decode_capture(filename, packet_type):
+    """Decode the received SERVER_UPDATE or SERVER_GAME_INFO packets of a PacketCapture file into columns."""
+    data, offsets = load_capture(filename, packet_type)
+    if packet_type == PacketCoordinatorType.PACKET_COORDINATOR_SERVER_UPDATE:
+        return decode_server_updates(data, offsets)
+    if packet_type == PacketGameType.PACKET_SERVER_GAME_INFO:
+        return decode_game_infos(data, offsets)
+    raise ValueError(f"cannot decode packet type {packet_type} into columns")
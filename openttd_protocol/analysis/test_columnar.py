@@ -0,0 +1,163 @@
+import pytest
+
+from ..protocol.coordinator import (
+    CoordinatorProtocol,
+    PacketCoordinatorType,
+)
+from ..protocol.game import (
+    GameProtocol,
+    PacketGameType,
+)
+from ..wire.capture import PacketCapture
+from ..wire.write import (
+    SEND_TCP_MTU,
+    write_bytes,
+    write_init,
+    write_presend,
+    write_string,
+    write_uint8,
+    write_uint16,
+    write_uint32,
+    write_uint64,
+)
+
+numpy = pytest.importorskip("numpy")
+
+from .columnar import (  # noqa: E402
+    decode_capture,
+    decode_game_infos,
+    decode_server_updates,
+    frame,
+)
+
+
+def _write_game_info(data, game_info_version, index, with_names):
+    # NewGRF names can only be sent since game_info_version 6.
+    with_names = with_names and game_info_version >= 6
+
+    write_uint8(data, game_info_version)
+    if game_info_version >= 7:
+        write_uint64(data, 1000 + index)
+    if game_info_version >= 6:
+        write_uint8(data, 1 if with_names else 0)
+    if game_info_version >= 5:
+        write_uint32(data, index)
+        write_string(data, f"script {index % 3}")
+    if game_info_version >= 4:
+        write_uint8(data, index % 4)
+        for i in range(index % 4):
+            write_uint32(data, i)
+            write_bytes(data, bytes(16))
+            if with_names:
+                write_string(data, f"grf {i}")
+    if game_info_version >= 3:
+        write_uint32(data, 700000 + index)
+        write_uint32(data, 700000)
+    if game_info_version >= 2:
+        write_uint8(data, 15)
+        write_uint8(data, index % 15)
+        write_uint8(data, 10)
+    write_string(data, f"server {index}")
+    write_string(data, "14.1")
+    if game_info_version < 6:
+        write_uint8(data, 0)
+    write_uint8(data, index % 2)
+    write_uint8(data, 25)
+    write_uint8(data, index % 25)
+    write_uint8(data, 0)
+    if game_info_version < 3:
+        write_uint16(data, 1000 + index)
+        write_uint16(data, 1000)
+    if game_info_version < 6:
+        write_string(data, "map")
+    write_uint16(data, 256)
+    write_uint16(data, 512 + index)
+    write_uint8(data, 1)
+    write_uint8(data, 1)
+
+
+def _packets(packet_type, protocol_version=None):
+    packets = []
+    for index in range(28):
+        game_info_version = index % 7 + 1
+        data = write_init(packet_type)
+        if protocol_version is not None:
+            write_uint8(data, protocol_version)
+        _write_game_info(data, game_info_version, index, with_names=index % 2 == 0)
+        packets.append(bytes(write_presend(data, SEND_TCP_MTU)))
+    return packets
+
+
+def _assert_equal(result, packets, receive, skip):
+    columns, strings = result
+    assert columns["valid"].all()
+    for row, packet in enumerate(packets):
+        message = receive(None, memoryview(packet)[skip:])._asdict()
+        message["newgrf_count"] = len(message.pop("newgrfs") or [])
+        if "newgrf_serialization_type" in message:
+            message["newgrf_serialization_type"] = message["newgrf_serialization_type"].value
+        for name in ("companies_max", "companies_on", "spectators_max"):
+            message[name] = message[name] or 0
+        if message["gamescript_version"] is None:
+            message["gamescript_version"] = 4294967295
+            message["gamescript_name"] = ""
+
+        for name, value in message.items():
+            if name in strings:
+                assert strings[name][columns[name][row]] == value, name
+            else:
+                assert columns[name][row] == value, name
+
+
+def test_decode_server_updates():
+    packets = _packets(PacketCoordinatorType.PACKET_COORDINATOR_SERVER_UPDATE, protocol_version=6)
+    data = b"".join(packets)
+    result = decode_server_updates(data, frame(data))
+
+    _assert_equal(result, packets, CoordinatorProtocol.receive_PACKET_COORDINATOR_SERVER_UPDATE, 3)
+    assert (result.columns["protocol_version"] == 6).all()
+
+
+def test_decode_game_infos(tmp_path):
+    packets = _packets(PacketGameType.PACKET_SERVER_GAME_INFO)
+    data = b"".join(packets)
+    _assert_equal(decode_game_infos(data, frame(data)), packets, GameProtocol.receive_PACKET_SERVER_GAME_INFO, 3)
+
+    # Invalid packets are marked as such, without affecting the others.
+    truncated = packets[6][:-3]
+    truncated = bytes([len(truncated), 0]) + truncated[2:]
+    data = packets[0] + truncated + b"\x04\x00\x06\x09" + packets[1]
+    columns, strings = decode_game_infos(data, frame(data))
+    assert columns["valid"].tolist() == [True, False, False, True]
+    assert columns["map_height"].tolist() == [512, 0, 0, 513]
+    assert [strings["name"][code] for code in columns["name"]] == ["server 0", "", "", "server 1"]
+
+    filename = tmp_path / "capture.bin"
+    capture = PacketCapture(filename)
+    for packet in packets:
+        capture.packet_received(object.__new__(GameProtocol), packet)
+    capture.close()
+    columns, _ = decode_capture(filename, PacketGameType.PACKET_SERVER_GAME_INFO)
+    assert columns["clients_on"].tolist() == [index % 25 for index in range(28)]
+
+
+def test_decode_invalid_utf8():
+    packets = _packets(PacketGameType.PACKET_SERVER_GAME_INFO)
+    # A bad byte in a stored string (twice, sharing a table entry) and in a
+    # NewGRF name, which is not stored.
+    packets[2] = packets[2].replace(b"server 2", b"serve\xff 2")
+    packets[3] = packets[3].replace(b"server 3", b"serve\xff 2")
+    packets[6] = packets[6].replace(b"grf 1", b"grf \xff")
+    for row in (2, 3, 6):
+        with pytest.raises(UnicodeDecodeError):
+            GameProtocol.receive_PACKET_SERVER_GAME_INFO(None, memoryview(packets[row])[3:])
+
+    data = b"".join(packets)
+    columns, strings = decode_game_infos(data, frame(data))
+    assert columns["valid"].tolist() == [row not in (2, 3, 6) for row in range(28)]
+    assert [strings["name"][code] for code in columns["name"][:5]] == ["server 0", "server 1", "", "", "server 4"]
+    assert columns["map_height"][2] == 0
+
+    valid = [packet for row, packet in enumerate(packets) if row not in (2, 3, 6)]
+    data = b"".join(valid)
+    _assert_equal(decode_game_infos(data, frame(data)), valid, GameProtocol.receive_PACKET_SERVER_GAME_INFO, 3)
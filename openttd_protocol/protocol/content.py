@@ -1,17 +1,24 @@
+import collections
 import enum
 import logging
 import struct
 
 from ..wire.exceptions import PacketInvalidData
 from ..wire.read import (
+    iter_packets,
     read_string,
     read_uint8,
     read_uint16,
     read_uint32,
 )
-from ..wire.tcp import TCPProtocol
+from ..wire.tcp import (
+    Priority,
+    TCPProtocol,
+)
 from ..wire.write import (
     SEND_TCP_COMPAT_MTU,
+    SEND_TCP_MTU,
+    write_bytes,
     write_init,
     write_presend,
     write_string,
@@ -66,10 +73,61 @@ class ContentInfo:
         )
 
 
+# The decoded packets, as returned by receive_* and passed as is to callback
+# classes that set receive_messages (see TCPProtocol).
+ContentClientInfoListMessage = collections.namedtuple(
+    "ContentClientInfoListMessage", ["content_type", "openttd_version", "branch_versions"]
+)
+# Shared by CLIENT_INFO_ID, CLIENT_INFO_EXTID, CLIENT_INFO_EXTID_MD5 and CLIENT_CONTENT.
+ContentClientInfoMessage = collections.namedtuple("ContentClientInfoMessage", ["content_infos"])
+
+
 class ContentProtocol(TCPProtocol):
     PacketType = PacketContentType
     PACKET_END = PacketContentType.PACKET_CONTENT_END
 
+    # Set to a PacketCache to reuse encoded SERVER_INFO packets between all
+    # connections. Content metadata hardly ever changes, so this saves
+    # encoding the same packet over and over again. When the metadata of a
+    # content entry does change, call invalidate_PACKET_CONTENT_SERVER_INFO().
+    server_info_cache = None
+    # Set to a PacketCache (preferably with max_bytes set) to reuse the
+    # complete answer to a CLIENT_INFO_LIST between all connections. There
+    # are only a few distinct queries, but each answer can be thousands of
+    # packets. Call invalidate_CLIENT_INFO_LIST() when the content database
+    # changes; this clears both caches.
+    info_list_cache = None
+    # Set to a BandwidthScheduler to share the uplink fairly between all
+    # downloads of all connections. Other packets are never delayed by it.
+    transfer_scheduler = None
+
+    def __init__(self, callback_class):
+        super().__init__(callback_class)
+
+        # Until the client tells us otherwise, assume it is an old client that
+        # can only receive packets up to SEND_TCP_COMPAT_MTU.
+        self.mtu = SEND_TCP_COMPAT_MTU
+
+    def _negotiate_mtu(self, openttd_version):
+        # Since OpenTTD 12.0 (formerly known as 1.12), clients send an
+        # openttd_version of UINT32_MAX in CLIENT_INFO_LIST. These clients
+        # also support the bigger SEND_TCP_MTU. Older clients send their
+        # actual revision, and are stuck with SEND_TCP_COMPAT_MTU.
+        # Never downgrade; a connection that once proved to be a modern
+        # client stays one.
+        if openttd_version == 0xFFFFFFFF:
+            self.mtu = SEND_TCP_MTU
+
+    def receive_packet(self, source, data):
+        packet_type, message = super().receive_packet(source, data)
+
+        # The decoders have no side effects; the MTU is negotiated here, so
+        # it is set before any callback runs, whoever sends the answer.
+        if packet_type == PacketContentType.PACKET_CONTENT_CLIENT_INFO_LIST:
+            self._negotiate_mtu(message.openttd_version)
+
+        return packet_type, message
+
     @staticmethod
     def receive_PACKET_CONTENT_CLIENT_INFO_LIST(source, data):
         content_type, data = read_uint8(data)
@@ -95,7 +153,7 @@ class ContentProtocol(TCPProtocol):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected; remaining: ", len(data))
 
-        return {"content_type": content_type, "openttd_version": openttd_version, "branch_versions": branch_versions}
+        return ContentClientInfoListMessage(content_type, openttd_version, branch_versions)
 
     @staticmethod
     def _receive_client_info(data, count, has_content_id=False, has_content_type_and_unique_id=False, has_md5sum=False):
@@ -149,7 +207,7 @@ class ContentProtocol(TCPProtocol):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected; remaining: ", len(data))
 
-        return {"content_infos": content_infos}
+        return ContentClientInfoMessage(content_infos)
 
     @classmethod
     def receive_PACKET_CONTENT_CLIENT_INFO_EXTID(cls, source, data):
@@ -160,7 +218,7 @@ class ContentProtocol(TCPProtocol):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected; remaining: ", len(data))
 
-        return {"content_infos": content_infos}
+        return ContentClientInfoMessage(content_infos)
 
     @classmethod
     def receive_PACKET_CONTENT_CLIENT_INFO_EXTID_MD5(cls, source, data):
@@ -173,7 +231,7 @@ class ContentProtocol(TCPProtocol):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected; remaining: ", len(data))
 
-        return {"content_infos": content_infos}
+        return ContentClientInfoMessage(content_infos)
 
     @classmethod
     def receive_PACKET_CONTENT_CLIENT_CONTENT(cls, source, data):
@@ -184,10 +242,50 @@ class ContentProtocol(TCPProtocol):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected; remaining: ", len(data))
 
-        return {"content_infos": content_infos}
+        return ContentClientInfoMessage(content_infos)
 
-    async def send_PACKET_CONTENT_SERVER_INFO(
-        self, content_type, content_id, filesize, name, version, url, description, unique_id, md5sum, dependencies, tags
+    async def _send_metadata(self, packets):
+        # Metadata is small and latency sensitive; so it is never delayed by
+        # the transfer scheduler. It does count towards its global rate.
+        length = await self.send_packets(packets)
+        if self.transfer_scheduler is not None:
+            self.transfer_scheduler.charge(length)
+        return length
+
+    async def _send_listing(self, packets):
+        # A listing can be thousands of packets; it is sent as bulk, so the
+        # metadata of this connection goes ahead of it. Like metadata, it is
+        # not delayed by the transfer scheduler, but counts towards its rate.
+        length = await self.send_bulk(packets)
+        if self.transfer_scheduler is not None:
+            self.transfer_scheduler.charge(length)
+        return length
+
+    @classmethod
+    def invalidate_PACKET_CONTENT_SERVER_INFO(cls, content_id=None):
+        # Any cached CLIENT_INFO_LIST answer can contain the outdated packet.
+        if cls.info_list_cache is not None:
+            cls.info_list_cache.clear()
+
+        if cls.server_info_cache is None:
+            return
+
+        if content_id is None:
+            cls.server_info_cache.clear()
+            return
+
+        for mtu in (SEND_TCP_COMPAT_MTU, SEND_TCP_MTU):
+            cls.server_info_cache.discard((content_id, mtu))
+
+    @classmethod
+    def invalidate_CLIENT_INFO_LIST(cls):
+        # The answers are built from SERVER_INFO packets, so clearing only
+        # the answers would rebuild them from outdated packets.
+        cls.invalidate_PACKET_CONTENT_SERVER_INFO()
+
+    @staticmethod
+    def _encode_PACKET_CONTENT_SERVER_INFO(
+        mtu, content_type, content_id, filesize, name, version, url, description, unique_id, md5sum, dependencies, tags
     ):
         data = write_init(PacketContentType.PACKET_CONTENT_SERVER_INFO)
 
@@ -213,8 +311,9 @@ class ContentProtocol(TCPProtocol):
         else:
             write_uint32(data, struct.unpack("<I", unique_id)[0])
 
-        for i in range(16):
-            write_uint8(data, md5sum[i])
+        if len(md5sum) != 16:
+            raise ValueError(f"md5sum should be 16 bytes, not {len(md5sum)}")
+        write_bytes(data, bytes(md5sum))
 
         write_uint8(data, len(dependencies))
         for dependency in dependencies:
@@ -224,8 +323,75 @@ class ContentProtocol(TCPProtocol):
         for tag in tags:
             write_string(data, tag)
 
-        write_presend(data, SEND_TCP_COMPAT_MTU)
-        return await self.send_packet(data)
+        return write_presend(data, mtu)
+
+    def encode_PACKET_CONTENT_SERVER_INFO(self, content_id, **kwargs):
+        # Returns the SERVER_INFO packet ready to be sent to this connection.
+        # The result can be passed to send_packet() / send_packets(), which
+        # allows answering a CLIENT_INFO_LIST with many entries in one go.
+        cache = self.server_info_cache
+        if cache is None:
+            return self._encode_PACKET_CONTENT_SERVER_INFO(self.mtu, content_id=content_id, **kwargs)
+
+        key = (content_id, self.mtu)
+        packet = cache.get(key)
+        if packet is None:
+            packet = self._encode_PACKET_CONTENT_SERVER_INFO(self.mtu, content_id=content_id, **kwargs)
+            cache.put(key, packet)
+        return packet
+
+    async def send_PACKET_CONTENT_SERVER_INFO(
+        self, content_type, content_id, filesize, name, version, url, description, unique_id, md5sum, dependencies, tags
+    ):
+        data = self.encode_PACKET_CONTENT_SERVER_INFO(
+            content_type=content_type,
+            content_id=content_id,
+            filesize=filesize,
+            name=name,
+            version=version,
+            url=url,
+            description=description,
+            unique_id=unique_id,
+            md5sum=md5sum,
+            dependencies=dependencies,
+            tags=tags,
+        )
+        return await self._send_metadata([data])
+
+    @staticmethod
+    def _normalize_CLIENT_INFO_LIST(content_type, openttd_version, branch_versions, mtu):
+        # Branch versions are only sent by clients with an openttd_version of
+        # UINT32_MAX, and their order has no meaning.
+        return (int(content_type), openttd_version, tuple(sorted(branch_versions.items())), mtu)
+
+    async def _encode_CLIENT_INFO_LIST_response(self, get_entries):
+        entries = get_entries()
+        if hasattr(entries, "__aiter__"):
+            return [self.encode_PACKET_CONTENT_SERVER_INFO(**entry) async for entry in entries]
+        return [self.encode_PACKET_CONTENT_SERVER_INFO(**entry) for entry in entries]
+
+    async def send_CLIENT_INFO_LIST_response(self, content_type, openttd_version, branch_versions, get_entries):
+        # Answer a CLIENT_INFO_LIST with a SERVER_INFO for every entry.
+        # get_entries() is only called when the answer is not cached yet, and
+        # should return an iterable (or async iterable) of dicts with the
+        # parameters of send_PACKET_CONTENT_SERVER_INFO().
+        cache = self.info_list_cache
+        if cache is None:
+            packets = await self._encode_CLIENT_INFO_LIST_response(get_entries)
+            return await self._send_listing(packets)
+
+        key = self._normalize_CLIENT_INFO_LIST(content_type, openttd_version, branch_versions, self.mtu)
+        response = cache.get(key)
+        if response is None:
+            # An async get_entries() can be slow; if the caches are
+            # invalidated meanwhile, the answer is sent but not cached.
+            generation = cache.generation
+            response = b"".join(await self._encode_CLIENT_INFO_LIST_response(get_entries))
+            cache.put(key, response, generation=generation)
+
+        # The answer is cached as a single blob; it is still sent packet by
+        # packet (in slices), as bulk.
+        return await self._send_listing(iter_packets(response))
 
     async def send_PACKET_CONTENT_SERVER_CONTENT(self, content_type, content_id, filesize, filename, stream):
         # First, send a packet to tell the client it will be receiving a file
@@ -237,17 +403,28 @@ class ContentProtocol(TCPProtocol):
         write_uint32(data, filesize)
         write_string(data, filename)
 
-        write_presend(data, SEND_TCP_COMPAT_MTU)
-        length = await self.send_packet(data)
-
-        # Next, send the content of the file over
-        while not stream.eof():
-            data = write_init(PacketContentType.PACKET_CONTENT_SERVER_CONTENT)
-            data += stream.read(SEND_TCP_COMPAT_MTU - 3)
-            write_presend(data, SEND_TCP_COMPAT_MTU)
-            length += await self.send_packet(data)
+        write_presend(data, self.mtu)
+        length = await self._send_metadata([data])
+
+        # Next, send the content of the file over. Use the biggest packets the
+        # client supports, as that means a lot less packets (and headers).
+        mtu = self.mtu
+        scheduler = self.transfer_scheduler
+        if scheduler is not None:
+            scheduler.open(self, self.source)
+        try:
+            while not stream.eof():
+                data = write_init(PacketContentType.PACKET_CONTENT_SERVER_CONTENT)
+                data += stream.read(mtu - 3)
+                write_presend(data, mtu)
+                if scheduler is not None:
+                    await scheduler.acquire(self, len(data))
+                length += await self.send_packet(data, Priority.BULK)
+        finally:
+            if scheduler is not None:
+                scheduler.close(self)
 
         data = write_init(PacketContentType.PACKET_CONTENT_SERVER_CONTENT)
-        write_presend(data, SEND_TCP_COMPAT_MTU)
-        length += await self.send_packet(data)
+        write_presend(data, mtu)
+        length += await self._send_metadata([data])
         return length
@@ -1,8 +1,10 @@
+import collections
 import enum
 import logging
 
 from ..wire.exceptions import PacketInvalidData
 from ..wire.read import (
+    iter_packets,
     read_bytes,
     read_string,
     read_uint8,
@@ -91,9 +93,87 @@ class NewGRFSerializationType(enum.IntEnum):
     NST_CONVERSION_GRFID_MD5 = 4
 
 
+# The decoded packets, as returned by receive_* and passed as is to callback
+# classes that set receive_messages (see TCPProtocol).
+CoordinatorServerRegisterMessage = collections.namedtuple(
+    "CoordinatorServerRegisterMessage",
+    ["protocol_version", "game_type", "server_port", "invite_code", "invite_code_secret"],
+)
+CoordinatorServerUpdateMessage = collections.namedtuple(
+    "CoordinatorServerUpdateMessage",
+    [
+        "protocol_version",
+        "newgrf_serialization_type",
+        "newgrfs",
+        "game_date",
+        "start_date",
+        "companies_max",
+        "companies_on",
+        "clients_max",
+        "clients_on",
+        "spectators_max",
+        "spectators_on",
+        "name",
+        "openttd_version",
+        "use_password",
+        "is_dedicated",
+        "map_width",
+        "map_height",
+        "map_type",
+        "gamescript_version",
+        "gamescript_name",
+        "ticks_playing",
+    ],
+)
+CoordinatorClientListingMessage = collections.namedtuple(
+    "CoordinatorClientListingMessage",
+    ["protocol_version", "game_info_version", "openttd_version", "newgrf_lookup_table_cursor"],
+)
+CoordinatorClientConnectMessage = collections.namedtuple(
+    "CoordinatorClientConnectMessage", ["protocol_version", "invite_code"]
+)
+CoordinatorSercliConnectFailedMessage = collections.namedtuple(
+    "CoordinatorSercliConnectFailedMessage", ["protocol_version", "token", "tracking_number"]
+)
+CoordinatorClientConnectedMessage = collections.namedtuple(
+    "CoordinatorClientConnectedMessage", ["protocol_version", "token"]
+)
+CoordinatorSercliStunResultMessage = collections.namedtuple(
+    "CoordinatorSercliStunResultMessage", ["protocol_version", "token", "interface_number", "result"]
+)
+
+
 class CoordinatorProtocol(TCPProtocol):
     PacketType = PacketCoordinatorType
     PACKET_END = PacketCoordinatorType.PACKET_COORDINATOR_END
+    # Set to a SnapshotReader to send GC_LISTING and GC_NEWGRF_LOOKUP from a
+    # snapshot published with publish_snapshot(), instead of encoding them.
+    # The snapshot is used when their send_* is called without servers /
+    # newgrf_lookup_table; when those are given, they are encoded as usual.
+    snapshot = None
+
+    @staticmethod
+    def peek_invite_code(data):
+        # Return the invite_code of a framed SERVER_REGISTER or
+        # CLIENT_CONNECT packet, without decoding the rest of it. Returns None
+        # if the packet doesn't contain an invite_code. This is meant for
+        # routing packets (see PacketRouter), so it does not validate; but a
+        # packet too short to contain the invite_code raises PacketTooShort.
+        packet_type, data = read_uint8(data[2:])
+
+        if packet_type == PacketCoordinatorType.PACKET_COORDINATOR_SERVER_REGISTER:
+            protocol_version, data = read_uint8(data)
+            if protocol_version <= 1:
+                return None
+            # Skip game_type and server_port.
+            data = data[3:]
+        elif packet_type == PacketCoordinatorType.PACKET_COORDINATOR_CLIENT_CONNECT:
+            _, data = read_uint8(data)
+        else:
+            return None
+
+        invite_code, _ = read_string(data)
+        return invite_code
 
     @staticmethod
     def receive_PACKET_COORDINATOR_SERVER_REGISTER(source, data):
@@ -121,13 +201,9 @@ class CoordinatorProtocol(TCPProtocol):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected in SERVER_REGISTER; remaining: ", len(data))
 
-        return {
-            "protocol_version": protocol_version,
-            "game_type": game_type,
-            "server_port": server_port,
-            "invite_code": invite_code,
-            "invite_code_secret": invite_code_secret,
-        }
+        return CoordinatorServerRegisterMessage(
+            protocol_version, game_type, server_port, invite_code, invite_code_secret
+        )
 
     @staticmethod
     def receive_PACKET_COORDINATOR_SERVER_UPDATE(source, data):
@@ -225,29 +301,29 @@ class CoordinatorProtocol(TCPProtocol):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected in SERVER_UPDATE; remaining: ", len(data))
 
-        return {
-            "protocol_version": protocol_version,
-            "newgrf_serialization_type": newgrf_serialization_type,
-            "newgrfs": newgrfs,
-            "game_date": game_date,
-            "start_date": start_date,
-            "companies_max": companies_max,
-            "companies_on": companies_on,
-            "clients_max": clients_max,
-            "clients_on": clients_on,
-            "spectators_max": spectators_max,
-            "spectators_on": spectators_on,
-            "name": name,
-            "openttd_version": openttd_version,
-            "use_password": use_password,
-            "is_dedicated": is_dedicated,
-            "map_width": map_width,
-            "map_height": map_height,
-            "map_type": map_type,
-            "gamescript_version": gamescript_version,
-            "gamescript_name": gamescript_name,
-            "ticks_playing": ticks_playing,
-        }
+        return CoordinatorServerUpdateMessage(
+            protocol_version,
+            newgrf_serialization_type,
+            newgrfs,
+            game_date,
+            start_date,
+            companies_max,
+            companies_on,
+            clients_max,
+            clients_on,
+            spectators_max,
+            spectators_on,
+            name,
+            openttd_version,
+            use_password,
+            is_dedicated,
+            map_width,
+            map_height,
+            map_type,
+            gamescript_version,
+            gamescript_name,
+            ticks_playing,
+        )
 
     @staticmethod
     def receive_PACKET_COORDINATOR_CLIENT_LISTING(source, data):
@@ -270,12 +346,9 @@ class CoordinatorProtocol(TCPProtocol):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected in CLIENT_LISTING; remaining: ", len(data))
 
-        return {
-            "protocol_version": protocol_version,
-            "game_info_version": game_info_version,
-            "openttd_version": openttd_version,
-            "newgrf_lookup_table_cursor": newgrf_lookup_table_cursor,
-        }
+        return CoordinatorClientListingMessage(
+            protocol_version, game_info_version, openttd_version, newgrf_lookup_table_cursor
+        )
 
     @staticmethod
     def receive_PACKET_COORDINATOR_CLIENT_CONNECT(source, data):
@@ -289,10 +362,7 @@ class CoordinatorProtocol(TCPProtocol):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected in CLIENT_CONNECT; remaining: ", len(data))
 
-        return {
-            "protocol_version": protocol_version,
-            "invite_code": invite_code,
-        }
+        return CoordinatorClientConnectMessage(protocol_version, invite_code)
 
     @staticmethod
     def receive_PACKET_COORDINATOR_SERCLI_CONNECT_FAILED(source, data):
@@ -307,11 +377,7 @@ class CoordinatorProtocol(TCPProtocol):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected in SERCLI_CONNECT_FAILED; remaining: ", len(data))
 
-        return {
-            "protocol_version": protocol_version,
-            "token": token,
-            "tracking_number": tracking_number,
-        }
+        return CoordinatorSercliConnectFailedMessage(protocol_version, token, tracking_number)
 
     @staticmethod
     def receive_PACKET_COORDINATOR_CLIENT_CONNECTED(source, data):
@@ -325,10 +391,7 @@ class CoordinatorProtocol(TCPProtocol):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected in CLIENT_CONNECTED; remaining: ", len(data))
 
-        return {
-            "protocol_version": protocol_version,
-            "token": token,
-        }
+        return CoordinatorClientConnectedMessage(protocol_version, token)
 
     @staticmethod
     def receive_PACKET_COORDINATOR_SERCLI_STUN_RESULT(source, data):
@@ -344,12 +407,7 @@ class CoordinatorProtocol(TCPProtocol):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected in SERCLI_STUN_RESULT; remaining: ", len(data))
 
-        return {
-            "protocol_version": protocol_version,
-            "token": token,
-            "interface_number": interface_number,
-            "result": result,
-        }
+        return CoordinatorSercliStunResultMessage(protocol_version, token, interface_number, result)
 
     async def send_PACKET_COORDINATOR_GC_ERROR(self, protocol_version, error_no, error_detail):
         data = write_init(PacketCoordinatorType.PACKET_COORDINATOR_GC_ERROR)
@@ -381,7 +439,8 @@ class CoordinatorProtocol(TCPProtocol):
         write_presend(data, SEND_TCP_MTU)
         return await self.send_packet(data)
 
-    def _fill_NEWGRF_LOOKUP_PACKET(self, newgrf_lookup_table_cursor, newgrf_lookup_table):
+    @staticmethod
+    def _fill_NEWGRF_LOOKUP_PACKET(newgrf_lookup_table_cursor, newgrf_lookup_table):
         data = bytearray()
         count = 0
         for index, newgrf in newgrf_lookup_table.items():
@@ -406,13 +465,13 @@ class CoordinatorProtocol(TCPProtocol):
         if count != 0:
             yield count, data
 
-    async def send_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(
-        self, protocol_version, newgrf_lookup_table_cursor, newgrf_lookup_table
-    ):
+    @staticmethod
+    def iter_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(newgrf_lookup_table_cursor, newgrf_lookup_table):
         cursor = max(newgrf_lookup_table.keys())
 
-        length = 0
-        for count, body in self._fill_NEWGRF_LOOKUP_PACKET(newgrf_lookup_table_cursor, newgrf_lookup_table):
+        for count, body in CoordinatorProtocol._fill_NEWGRF_LOOKUP_PACKET(
+            newgrf_lookup_table_cursor, newgrf_lookup_table
+        ):
             data = write_init(PacketCoordinatorType.PACKET_COORDINATOR_GC_NEWGRF_LOOKUP)
 
             # The cursor is the highest index in the table. Index only increases
@@ -421,15 +480,52 @@ class CoordinatorProtocol(TCPProtocol):
             write_uint16(data, count)
             write_bytes(data, body)
 
-            write_presend(data, SEND_TCP_MTU)
-            length += await self.send_packet(data)
+            yield write_presend(data, SEND_TCP_MTU)
 
-        return length
+    @staticmethod
+    def encode_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(newgrf_lookup_table_cursor, newgrf_lookup_table):
+        packets = CoordinatorProtocol.iter_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(
+            newgrf_lookup_table_cursor, newgrf_lookup_table
+        )
+        return list(packets)
 
-    async def send_PACKET_COORDINATOR_GC_LISTING(
-        self, protocol_version, game_info_version, servers, newgrf_lookup_table
+    async def send_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(
+        self, protocol_version, newgrf_lookup_table_cursor, newgrf_lookup_table=None
     ):
-        length = 0
+        if newgrf_lookup_table is None:
+            # From the snapshot; nothing to send if nothing is published yet.
+            lookup = self.snapshot.get("GC_NEWGRF_LOOKUP") if self.snapshot is not None else None
+            if lookup is None:
+                return 0
+            return await self.send_bulk(self._skip_NEWGRF_LOOKUP_PACKETS(lookup, newgrf_lookup_table_cursor))
+
+        return await self.send_bulk(
+            self.iter_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(newgrf_lookup_table_cursor, newgrf_lookup_table)
+        )
+
+    @staticmethod
+    def _skip_NEWGRF_LOOKUP_PACKETS(lookup, newgrf_lookup_table_cursor):
+        # The snapshot contains the whole table, sorted by index. Skip the
+        # packets of which all entries are known by the client; the first
+        # packet sent can still contain a few known entries, which is
+        # harmless.
+        packets = list(iter_packets(lookup))
+
+        # Every packet holds the highest index of the table as cursor.
+        cursor, _ = read_uint32(packets[0][3:])
+        if cursor <= newgrf_lookup_table_cursor:
+            return []
+
+        for i in range(len(packets) - 1):
+            # The first entry of a packet starts after the length, type,
+            # cursor and count.
+            first_index, _ = read_uint32(packets[i + 1][9:])
+            if first_index > newgrf_lookup_table_cursor + 1:
+                return packets[i:]
+        return packets[-1:]
+
+    @staticmethod
+    def iter_PACKET_COORDINATOR_GC_LISTING(game_info_version, servers, newgrf_lookup_table):
         for server in servers:
             if server.game_type != ServerGameType.SERVER_GAME_TYPE_PUBLIC:
                 continue
@@ -499,15 +595,50 @@ class CoordinatorProtocol(TCPProtocol):
 
                 write_uint8(data, server.info["is_dedicated"])
 
-            write_presend(data, SEND_TCP_MTU)
-            length += await self.send_packet(data)
+            yield write_presend(data, SEND_TCP_MTU)
 
-        # Send a final packet with 0 servers to indicate end-of-list.
+        # A final packet with 0 servers indicates end-of-list.
         data = write_init(PacketCoordinatorType.PACKET_COORDINATOR_GC_LISTING)
         write_uint16(data, 0)
-        write_presend(data, SEND_TCP_MTU)
-        length += await self.send_packet(data)
-        return length
+        yield write_presend(data, SEND_TCP_MTU)
+
+    @staticmethod
+    def encode_PACKET_COORDINATOR_GC_LISTING(game_info_version, servers, newgrf_lookup_table):
+        return list(
+            CoordinatorProtocol.iter_PACKET_COORDINATOR_GC_LISTING(game_info_version, servers, newgrf_lookup_table)
+        )
+
+    async def send_PACKET_COORDINATOR_GC_LISTING(
+        self, protocol_version, game_info_version, servers=None, newgrf_lookup_table=None
+    ):
+        if servers is None:
+            # From the snapshot; an empty listing if nothing is published yet.
+            listing = self.snapshot.get(f"GC_LISTING-{game_info_version}") if self.snapshot is not None else None
+            if listing is not None:
+                return await self.send_bulk(iter_packets(listing))
+            servers = ()
+
+        return await self.send_bulk(
+            self.iter_PACKET_COORDINATOR_GC_LISTING(game_info_version, servers, newgrf_lookup_table)
+        )
+
+    @staticmethod
+    def publish_snapshot(publisher, servers, newgrf_lookup_table):
+        # Encode the listing (for every game_info_version) and the NewGRF
+        # lookup table once, and publish them via a SnapshotPublisher. Other
+        # processes serve them by setting "snapshot" to a SnapshotReader.
+        sections = {
+            f"GC_LISTING-{game_info_version}": CoordinatorProtocol.encode_PACKET_COORDINATOR_GC_LISTING(
+                game_info_version, servers, newgrf_lookup_table
+            )
+            # Every game_info_version a CLIENT_LISTING can ask for.
+            for game_info_version in range(1, 8)
+        }
+        if newgrf_lookup_table:
+            sections["GC_NEWGRF_LOOKUP"] = CoordinatorProtocol.encode_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(
+                0, dict(sorted(newgrf_lookup_table.items()))
+            )
+        publisher.publish(sections)
 
     async def send_PACKET_COORDINATOR_GC_CONNECTING(self, protocol_version, token, invite_code):
         data = write_init(PacketCoordinatorType.PACKET_COORDINATOR_GC_CONNECTING)
@@ -1,3 +1,4 @@
+import collections
 import enum
 import logging
 
@@ -49,6 +50,35 @@ class NewGRFSerializationType(enum.IntEnum):
     NST_CONVERSION_GRFID_MD5 = 4
 
 
+# The decoded packets, as returned by receive_* and passed as is to callback
+# classes that set receive_messages (see TCPProtocol).
+GameServerGameInfoMessage = collections.namedtuple(
+    "GameServerGameInfoMessage",
+    [
+        "newgrfs",
+        "game_date",
+        "start_date",
+        "companies_max",
+        "companies_on",
+        "clients_max",
+        "clients_on",
+        "spectators_max",
+        "spectators_on",
+        "name",
+        "openttd_version",
+        "use_password",
+        "is_dedicated",
+        "map_width",
+        "map_height",
+        "map_type",
+        "gamescript_version",
+        "gamescript_name",
+        "ticks_playing",
+    ],
+)
+GameServerShutdownMessage = collections.namedtuple("GameServerShutdownMessage", [])
+
+
 class GameProtocol(TCPProtocol):
     PacketType = PacketGameType
     PACKET_END = PacketGameType.PACKET_END
@@ -144,34 +174,34 @@ class GameProtocol(TCPProtocol):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected in SERVER_GAME_INFO; remaining: ", len(data))
 
-        return {
-            "newgrfs": newgrfs,
-            "game_date": game_date,
-            "start_date": start_date,
-            "companies_max": companies_max,
-            "companies_on": companies_on,
-            "clients_max": clients_max,
-            "clients_on": clients_on,
-            "spectators_max": spectators_max,
-            "spectators_on": spectators_on,
-            "name": name,
-            "openttd_version": openttd_version,
-            "use_password": use_password,
-            "is_dedicated": is_dedicated,
-            "map_width": map_width,
-            "map_height": map_height,
-            "map_type": map_type,
-            "gamescript_version": gamescript_version,
-            "gamescript_name": gamescript_name,
-            "ticks_playing": ticks_playing,
-        }
+        return GameServerGameInfoMessage(
+            newgrfs,
+            game_date,
+            start_date,
+            companies_max,
+            companies_on,
+            clients_max,
+            clients_on,
+            spectators_max,
+            spectators_on,
+            name,
+            openttd_version,
+            use_password,
+            is_dedicated,
+            map_width,
+            map_height,
+            map_type,
+            gamescript_version,
+            gamescript_name,
+            ticks_playing,
+        )
 
     @staticmethod
     def receive_PACKET_SERVER_SHUTDOWN(source, data):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected in SERVER_SHUTDOWN; remaining: ", len(data))
 
-        return {}
+        return GameServerShutdownMessage()
 
     async def send_PACKET_CLIENT_GAME_INFO(self):
         data = write_init(PacketGameType.PACKET_CLIENT_GAME_INFO)
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import random
+import time
+
+from ..wire.exceptions import SocketClosed
+from .game import GameProtocol
+
+log = logging.getLogger(__name__)
+
+
+class GameInfoResult:
+    def __init__(self, host, port, info=None, error=None):
+        self.host = host
+        self.port = port
+        self.info = info
+        self.error = error
+        self.timestamp = time.monotonic()
+
+    def __repr__(self):
+        return f"GameInfoResult(host={self.host!r}, port={self.port!r}, info={self.info!r}, error={self.error!r})"
+
+
+class ServerShutdown(Exception):
+    """The server announced it is shutting down."""
+
+
+class _PollCallback:
+    def __init__(self):
+        self.result = asyncio.get_running_loop().create_future()
+
+    async def receive_PACKET_SERVER_GAME_INFO(self, source, **info):
+        if not self.result.done():
+            self.result.set_result(info)
+
+    async def receive_PACKET_SERVER_SHUTDOWN(self, source):
+        if not self.result.done():
+            self.result.set_exception(ServerShutdown())
+
+    def disconnect(self, source):
+        if not self.result.done():
+            self.result.set_exception(SocketClosed())
+
+
+class GameInfoPoller:
+    # Query the GameInfo of many game servers concurrently.
+    #
+    # - concurrency: how many servers are queried at the same time.
+    # - connect_timeout / response_timeout: deadline for the TCP connection
+    #   to be established, and for the server to answer.
+    # - retries / backoff: how often a failed query is retried, and how long
+    #   to wait before the first retry; this doubles with every retry.
+    # - jitter: the maximum random delay before a query starts. This spreads
+    #   the queries, so periodic refreshes don't synchronize.
+    # - ttl: how long a successful result is reused before querying the
+    #   server again.
+
+    def __init__(
+        self, concurrency=256, connect_timeout=3, response_timeout=3, retries=2, backoff=0.5, jitter=0.5, ttl=60
+    ):
+        self.concurrency = concurrency
+        self.connect_timeout = connect_timeout
+        self.response_timeout = response_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.jitter = jitter
+        self.ttl = ttl
+
+        self._semaphore = None
+        # Ordered from oldest to newest result, so expired results are
+        # always at the front.
+        self._cache = {}
+
+    def cached(self, host, port):
+        """Return the cached result for this server, or None if there is none (or it expired)."""
+        result = self._cache.get((host, port))
+        if result is None:
+            return None
+
+        if time.monotonic() - result.timestamp > self.ttl:
+            del self._cache[(host, port)]
+            return None
+
+        return result
+
+    def _store(self, result):
+        key = (result.host, result.port)
+        self._cache.pop(key, None)
+        self._cache[key] = result
+
+        # Drop the expired results of servers that are no longer polled, so
+        # the cache doesn't keep growing. The result just stored is never
+        # expired, so this always stops.
+        expire = result.timestamp - self.ttl
+        while True:
+            key, oldest = next(iter(self._cache.items()))
+            if oldest.timestamp >= expire:
+                break
+            del self._cache[key]
+
+    async def _query(self, host, port):
+        loop = asyncio.get_running_loop()
+        callback = _PollCallback()
+
+        transport, protocol = await asyncio.wait_for(
+            loop.create_connection(lambda: GameProtocol(callback), host, port), self.connect_timeout
+        )
+        try:
+            await protocol.send_PACKET_CLIENT_GAME_INFO()
+            return await asyncio.wait_for(callback.result, self.response_timeout)
+        finally:
+            transport.close()
+
+    async def poll(self, host, port, use_cache=True):
+        """Query a single server, retrying on failure; the returned GameInfoResult contains either info or error."""
+        if use_cache:
+            result = self.cached(host, port)
+            if result is not None:
+                return result
+
+        if self.jitter:
+            await asyncio.sleep(random.uniform(0, self.jitter))
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt != 0:
+                # Exponential backoff, with some jitter to not retry all
+                # failed servers at exactly the same moment.
+                await asyncio.sleep(self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+
+            try:
+                async with self._semaphore:
+                    info = await self._query(host, port)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                log.debug("Failed to query %s:%d (attempt %d): %r", host, port, attempt + 1, err)
+                error = err
+                continue
+
+            result = GameInfoResult(host, port, info=info)
+            self._store(result)
+            return result
+
+        return GameInfoResult(host, port, error=error)
+
+    async def poll_many(self, servers, use_cache=True):
+        """Query all (host, port) servers, yielding a GameInfoResult for each as soon as it is known."""
+        tasks = [asyncio.create_task(self.poll(host, port, use_cache=use_cache)) for host, port in servers]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
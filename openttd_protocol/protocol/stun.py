@@ -1,3 +1,4 @@
+import collections
 import enum
 import logging
 
@@ -16,6 +17,13 @@ class PacketStunType(enum.IntEnum):
     PACKET_STUN_END = 1
 
 
+# The decoded packets, as returned by receive_* and passed as is to callback
+# classes that set receive_messages (see TCPProtocol).
+StunSercliStunMessage = collections.namedtuple(
+    "StunSercliStunMessage", ["protocol_version", "token", "interface_number"]
+)
+
+
 class StunProtocol(TCPProtocol):
     PacketType = PacketStunType
     PACKET_END = PacketStunType.PACKET_STUN_END
@@ -33,8 +41,4 @@ class StunProtocol(TCPProtocol):
         if len(data) != 0:
             raise PacketInvalidData("more bytes than expected; remaining: ", len(data))
 
-        return {
-            "protocol_version": protocol_version,
-            "token": token,
-            "interface_number": interface_number,
-        }
+        return StunSercliStunMessage(protocol_version, token, interface_number)
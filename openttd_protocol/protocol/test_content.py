@@ -0,0 +1,211 @@
+import asyncio
+import pytest
+
+from ..wire.cache import PacketCache
+from ..wire.testing import FakeTransport
+from ..wire.write import (
+    SEND_TCP_COMPAT_MTU,
+    SEND_TCP_MTU,
+)
+from .content import (
+    ContentProtocol,
+    ContentType,
+    PacketContentType,
+)
+
+
+def _connect(protocol_class=ContentProtocol):
+    protocol = protocol_class(None)
+    protocol.task.cancel()
+    protocol.connection_made(FakeTransport())
+    return protocol
+
+
+def _entry(content_id, name="name"):
+    return {
+        "content_type": ContentType.CONTENT_TYPE_AI,
+        "content_id": content_id,
+        "filesize": 1234,
+        "name": name,
+        "version": "1.0",
+        "url": "",
+        "description": "description",
+        "unique_id": b"\x01\x02\x03\x04",
+        "md5sum": b"\x00" * 16,
+        "dependencies": [],
+        "tags": ["tag"],
+    }
+
+
+def _client_info_list(payload):
+    return bytes([len(payload) + 3, 0, PacketContentType.PACKET_CONTENT_CLIENT_INFO_LIST]) + payload
+
+
+@pytest.mark.asyncio
+async def test_negotiate_mtu():
+    # Decoding a CLIENT_INFO_LIST has no side effects.
+    modern = b"\x03\xff\xff\xff\xff\x01vanilla\x0014.0\x00"
+    message = ContentProtocol.receive_PACKET_CONTENT_CLIENT_INFO_LIST(None, memoryview(modern))
+    assert message.openttd_version == 0xFFFFFFFF
+    assert message.branch_versions == {"vanilla": "14.0"}
+
+    class Application:
+        def __init__(self):
+            self.mtus = []
+
+        async def receive_PACKET_CONTENT_CLIENT_INFO_LIST(self, source, content_type, openttd_version, branch_versions):
+            # The application answers itself, and gets the negotiated MTU.
+            self.mtus.append(source.protocol.mtu)
+            await source.protocol.send_PACKET_CONTENT_SERVER_INFO(**_entry(1))
+
+    application = Application()
+    protocol = ContentProtocol(application)
+    protocol.task.cancel()
+    protocol.connection_made(FakeTransport())
+    assert protocol.mtu == SEND_TCP_COMPAT_MTU
+
+    # An old client stays on the compatible MTU.
+    protocol.data_received(_client_info_list(b"\x03\x00\x00\x00\x1c"))
+    await protocol._process_queue()
+    assert application.mtus == [SEND_TCP_COMPAT_MTU]
+
+    # A modern client upgrades the connection before the callback runs, and
+    # it never downgrades again.
+    protocol.data_received(_client_info_list(modern))
+    await protocol._process_queue()
+    protocol.data_received(_client_info_list(b"\x03\x00\x00\x00\x1c"))
+    await protocol._process_queue()
+    assert application.mtus == [SEND_TCP_COMPAT_MTU, SEND_TCP_MTU, SEND_TCP_MTU]
+
+    assert protocol.transport.written[1] == ContentProtocol._encode_PACKET_CONTENT_SERVER_INFO(
+        SEND_TCP_MTU, **_entry(1)
+    )
+
+
+@pytest.mark.asyncio
+async def test_server_info_cache():
+    class CachedContentProtocol(ContentProtocol):
+        server_info_cache = PacketCache()
+
+    cache = CachedContentProtocol.server_info_cache
+    protocol = _connect(CachedContentProtocol)
+
+    packet = protocol.encode_PACKET_CONTENT_SERVER_INFO(**_entry(1))
+    assert packet == ContentProtocol._encode_PACKET_CONTENT_SERVER_INFO(SEND_TCP_COMPAT_MTU, **_entry(1))
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # The second time, the cached packet is used; even if the metadata
+    # changed in the meantime.
+    assert protocol.encode_PACKET_CONTENT_SERVER_INFO(**_entry(1, name="other")) is packet
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Till the entry is invalidated.
+    CachedContentProtocol.invalidate_PACKET_CONTENT_SERVER_INFO(1)
+    other = protocol.encode_PACKET_CONTENT_SERVER_INFO(**_entry(1, name="other"))
+    assert other == ContentProtocol._encode_PACKET_CONTENT_SERVER_INFO(SEND_TCP_COMPAT_MTU, **_entry(1, name="other"))
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    await protocol.send_PACKET_CONTENT_SERVER_INFO(**_entry(1, name="other"))
+    assert protocol.transport.written == [other]
+
+    # A md5sum of the wrong length is never silently truncated or padded.
+    with pytest.raises(ValueError):
+        protocol.encode_PACKET_CONTENT_SERVER_INFO(**dict(_entry(2), md5sum=b"\x00" * 15))
+
+
+@pytest.mark.asyncio
+async def test_info_list_cache():
+    class CachedContentProtocol(ContentProtocol):
+        server_info_cache = PacketCache()
+        info_list_cache = PacketCache()
+
+    cache = CachedContentProtocol.info_list_cache
+    protocol = _connect(CachedContentProtocol)
+    names = ["one"]
+    calls = []
+
+    def get_entries():
+        calls.append(True)
+        return [_entry(1, name=names[0]), _entry(2)]
+
+    async def send_response(branch_versions):
+        protocol.transport.written.clear()
+        await protocol.send_CLIENT_INFO_LIST_response(
+            ContentType.CONTENT_TYPE_AI, 0xFFFFFFFF, branch_versions, get_entries
+        )
+        return b"".join(protocol.transport.written)
+
+    # A miss asks the application for the entries.
+    response = await send_response({"vanilla": "14.0", "jgrpp": "0.60"})
+    assert response == b"".join(
+        ContentProtocol._encode_PACKET_CONTENT_SERVER_INFO(SEND_TCP_MTU, **entry) for entry in get_entries()
+    )
+    assert len(calls) == 2
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # The same query, in another order, is a hit.
+    assert await send_response({"jgrpp": "0.60", "vanilla": "14.0"}) == response
+    assert len(calls) == 2
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # After an invalidate, the answer is built again; not from outdated
+    # SERVER_INFO packets.
+    names[0] = "two"
+    CachedContentProtocol.invalidate_CLIENT_INFO_LIST()
+    other = await send_response({"vanilla": "14.0", "jgrpp": "0.60"})
+    assert len(calls) == 3
+    assert other != response
+    assert other == b"".join(
+        ContentProtocol._encode_PACKET_CONTENT_SERVER_INFO(SEND_TCP_MTU, **entry) for entry in get_entries()
+    )
+
+
+@pytest.mark.asyncio
+async def test_info_list_cache_async():
+    class CachedContentProtocol(ContentProtocol):
+        info_list_cache = PacketCache()
+
+    cache = CachedContentProtocol.info_list_cache
+    protocol = _connect(CachedContentProtocol)
+
+    async def get_entries():
+        yield _entry(1)
+        # The database changes while the answer is being built.
+        CachedContentProtocol.invalidate_CLIENT_INFO_LIST()
+        yield _entry(2)
+
+    await protocol.send_CLIENT_INFO_LIST_response(ContentType.CONTENT_TYPE_AI, 0xFFFFFFFF, {}, get_entries)
+    assert len(protocol.transport.written) == 1
+    # The answer is sent, but not cached, as it might be outdated.
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("cached", [False, True])
+async def test_info_list_bulk(cached):
+    class CachedContentProtocol(ContentProtocol):
+        info_list_cache = PacketCache() if cached else None
+
+    protocol = _connect(CachedContentProtocol)
+    protocol.bulk_slice_bytes = 1
+    entries = [_entry(content_id) for content_id in range(1, 4)]
+
+    # While the peer is not keeping up, the listing waits ...
+    protocol.pause_writing()
+    task = asyncio.create_task(
+        protocol.send_CLIENT_INFO_LIST_response(ContentType.CONTENT_TYPE_AI, 0xFFFFFFFF, {}, lambda: entries)
+    )
+    await asyncio.sleep(0)
+    assert protocol.transport.written == []
+
+    # ... but metadata does not.
+    await protocol.send_PACKET_CONTENT_SERVER_INFO(**_entry(10))
+    assert len(protocol.transport.written) == 1
+
+    protocol.resume_writing()
+    await task
+
+    # The listing is written in slices, one packet each here.
+    assert [bytes(data) for data in protocol.transport.written[1:]] == [
+        ContentProtocol._encode_PACKET_CONTENT_SERVER_INFO(SEND_TCP_MTU, **entry) for entry in entries
+    ]
@@ -0,0 +1,176 @@
+import collections
+import os
+import pytest
+
+from ..wire.exceptions import PacketTooShort
+from ..wire.read import (
+    read_uint16,
+    read_uint32,
+)
+from ..wire.snapshot import (
+    SnapshotPublisher,
+    SnapshotReader,
+)
+from ..wire.testing import FakeTransport
+from .coordinator import (
+    CoordinatorProtocol,
+    ServerGameType,
+)
+
+Server = collections.namedtuple("Server", ["game_type", "info", "connection_string", "newgrfs_indexed"])
+
+
+def _lookup_table(count):
+    return {index: {"grfid": index, "md5sum": "00" * 16, "name": "n" * 80} for index in range(1, count + 1)}
+
+
+def _server(name):
+    info = {
+        "ticks_playing": 1234,
+        "gamescript_version": None,
+        "gamescript_name": None,
+        "game_date": 701265 + 1000,
+        "start_date": 701265,
+        "companies_max": 15,
+        "companies_on": 1,
+        "spectators_max": 10,
+        "name": name,
+        "openttd_version": "14.0",
+        "use_password": 0,
+        "clients_max": 25,
+        "clients_on": 2,
+        "spectators_on": 0,
+        "map_width": 256,
+        "map_height": 256,
+        "map_type": 0,
+        "is_dedicated": 1,
+    }
+    return Server(ServerGameType.SERVER_GAME_TYPE_PUBLIC, info, "1.2.3.4:3979", [1, 2])
+
+
+def _connect(snapshot):
+    protocol = CoordinatorProtocol(None)
+    protocol.task.cancel()
+    protocol.snapshot = snapshot
+    protocol.connection_made(FakeTransport())
+    return protocol
+
+
+def _entries(packets):
+    # The indices of the entries in GC_NEWGRF_LOOKUP packets.
+    indices = []
+    for packet in packets:
+        count, data = read_uint16(memoryview(packet)[7:])
+        for _ in range(count):
+            index, data = read_uint32(data)
+            indices.append(index)
+            data = data[4 + 16 + 81 :]
+    return indices
+
+
+@pytest.mark.parametrize(
+    "data, invite_code",
+    [
+        # SERVER_REGISTER, protocol version 2 and up.
+        (b"\x0d\x00\x01\x06\x01\x87\x0f+abc\x00s\x00", "+abc"),
+        # SERVER_REGISTER, protocol version 1 has no invite_code.
+        (b"\x07\x00\x01\x01\x01\x87\x0f", None),
+        # CLIENT_CONNECT.
+        (b"\x09\x00\x06\x06+abc\x00", "+abc"),
+        # Any other packet.
+        (b"\x04\x00\x04\x06", None),
+    ],
+)
+def test_peek_invite_code(data, invite_code):
+    assert CoordinatorProtocol.peek_invite_code(memoryview(data)) == invite_code
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"\x03\x00\x06",
+        b"\x04\x00\x06\x06",
+        b"\x08\x00\x06\x06+abc",
+        b"\x06\x00\x01\x06\x01\x87",
+    ],
+)
+def test_peek_invite_code_truncated(data):
+    with pytest.raises(PacketTooShort):
+        CoordinatorProtocol.peek_invite_code(memoryview(data))
+
+
+@pytest.mark.parametrize("newgrf_lookup_table_cursor", [0, 1, 299, 300, 301, 650, 999])
+def test_skip_newgrf_lookup_packets(newgrf_lookup_table_cursor):
+    table = _lookup_table(1000)
+    packets = CoordinatorProtocol.encode_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(0, table)
+    assert len(packets) > 2
+
+    skipped = CoordinatorProtocol._skip_NEWGRF_LOOKUP_PACKETS(memoryview(b"".join(packets)), newgrf_lookup_table_cursor)
+    indices = _entries(skipped)
+
+    # Only whole packets are skipped, and every unknown entry is still sent.
+    assert indices == list(range(indices[0], 1001))
+    assert indices[0] <= newgrf_lookup_table_cursor + 1
+    # But no packet that is fully known by the client.
+    assert _entries(skipped[:1])[-1] > newgrf_lookup_table_cursor
+
+
+@pytest.mark.parametrize("newgrf_lookup_table_cursor", [1000, 1001])
+def test_skip_newgrf_lookup_packets_known(newgrf_lookup_table_cursor):
+    packets = CoordinatorProtocol.encode_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(0, _lookup_table(1000))
+    lookup = memoryview(b"".join(packets))
+    assert CoordinatorProtocol._skip_NEWGRF_LOOKUP_PACKETS(lookup, newgrf_lookup_table_cursor) == []
+
+
+@pytest.mark.asyncio
+async def test_publish_snapshot():
+    name = f"openttd-protocol-test-coordinator-{os.getpid()}"
+    table = _lookup_table(1000)
+    # The lookup table is published sorted, no matter its order.
+    table = dict(reversed(list(table.items())))
+    servers = [_server("one"), _server("two")]
+
+    reader = SnapshotReader(name)
+    protocol = _connect(reader)
+
+    # Nothing is published yet: an empty listing, and no lookup table.
+    await protocol.send_PACKET_COORDINATOR_GC_LISTING(6, 7)
+    assert protocol.transport.written == [
+        b"".join(CoordinatorProtocol.encode_PACKET_COORDINATOR_GC_LISTING(7, [], None))
+    ]
+    protocol.transport.written.clear()
+    await protocol.send_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(6, 0)
+    assert protocol.transport.written == []
+
+    publisher = SnapshotPublisher(name)
+    try:
+        CoordinatorProtocol.publish_snapshot(publisher, servers, table)
+
+        for game_info_version in range(1, 8):
+            listing = CoordinatorProtocol.encode_PACKET_COORDINATOR_GC_LISTING(game_info_version, servers, table)
+            assert bytes(reader.get(f"GC_LISTING-{game_info_version}")) == b"".join(listing)
+
+        lookup = CoordinatorProtocol.encode_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(0, dict(sorted(table.items())))
+        assert bytes(reader.get("GC_NEWGRF_LOOKUP")) == b"".join(lookup)
+
+        # Without servers, the snapshot is sent.
+        await protocol.send_PACKET_COORDINATOR_GC_LISTING(6, 7)
+        assert b"".join(protocol.transport.written) == bytes(reader.get("GC_LISTING-7"))
+        protocol.transport.written.clear()
+        await protocol.send_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(6, 0)
+        assert b"".join(protocol.transport.written) == b"".join(lookup)
+        protocol.transport.written.clear()
+
+        # When servers are given, they are sent instead.
+        await protocol.send_PACKET_COORDINATOR_GC_LISTING(6, 7, servers[:1], table)
+        assert b"".join(protocol.transport.written) == b"".join(
+            CoordinatorProtocol.encode_PACKET_COORDINATOR_GC_LISTING(7, servers[:1], table)
+        )
+        protocol.transport.written.clear()
+        await protocol.send_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(6, 999, table)
+        assert b"".join(protocol.transport.written) == b"".join(
+            CoordinatorProtocol.encode_PACKET_COORDINATOR_GC_NEWGRF_LOOKUP(999, table)
+        )
+    finally:
+        reader.close()
+        publisher.close()
@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+
+from ..wire.write import (
+    write_init,
+    write_presend,
+)
+from .game import PacketGameType
+from .game_poller import (
+    GameInfoPoller,
+    ServerShutdown,
+)
+
+
+def _poller(replies, **kwargs):
+    # A poller that doesn't connect, but answers (or raises) from replies.
+    poller = GameInfoPoller(backoff=0, jitter=0, **kwargs)
+    queries = []
+
+    async def _query(host, port):
+        queries.append((host, port))
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    poller._query = _query
+    return poller, queries
+
+
+async def _serve(answer):
+    # A game server that reads CLIENT_GAME_INFO, and writes answer (if any).
+    async def handle(reader, writer):
+        await reader.readexactly(3)
+        if answer is not None:
+            writer.write(answer)
+        await reader.read()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+@pytest.mark.asyncio
+async def test_poll_cache():
+    poller, queries = _poller([{"name": "one"}, {"name": "two"}, {"name": "three"}], ttl=60)
+
+    result = await poller.poll("192.0.2.1", 3979)
+    assert result.info == {"name": "one"}
+    assert await poller.poll("192.0.2.1", 3979) is result
+    assert queries == [("192.0.2.1", 3979)]
+
+    # Once expired, the server is queried again.
+    result.timestamp -= 61
+    assert poller.cached("192.0.2.1", 3979) is None
+    result = await poller.poll("192.0.2.1", 3979)
+    assert result.info == {"name": "two"}
+    assert len(queries) == 2
+
+    # Expired results of servers that are no longer polled are dropped.
+    result.timestamp -= 61
+    await poller.poll("192.0.2.2", 3979)
+    assert list(poller._cache) == [("192.0.2.2", 3979)]
+
+
+@pytest.mark.asyncio
+async def test_poll_retry():
+    poller, queries = _poller([ConnectionRefusedError(), {"name": "one"}], retries=1)
+
+    result = await poller.poll("192.0.2.1", 3979)
+    assert result.info == {"name": "one"}
+    assert result.error is None
+    assert len(queries) == 2
+
+    # Once out of retries, the last error is returned, and nothing is cached.
+    poller, queries = _poller([ConnectionRefusedError(), ConnectionResetError()], retries=1)
+
+    result = await poller.poll("192.0.2.1", 3979)
+    assert result.info is None
+    assert isinstance(result.error, ConnectionResetError)
+    assert len(queries) == 2
+    assert poller.cached("192.0.2.1", 3979) is None
+
+
+@pytest.mark.asyncio
+async def test_poll_timeout():
+    server, port = await _serve(None)
+    poller = GameInfoPoller(response_timeout=0.05, retries=0, jitter=0)
+
+    result = await poller.poll("127.0.0.1", port)
+    assert isinstance(result.error, asyncio.TimeoutError)
+
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_poll_server_shutdown():
+    server, port = await _serve(write_presend(write_init(PacketGameType.PACKET_SERVER_SHUTDOWN), 3))
+    poller = GameInfoPoller(retries=0, jitter=0)
+
+    result = await poller.poll("127.0.0.1", port)
+    assert isinstance(result.error, ServerShutdown)
+
+    server.close()
+    await server.wait_closed()
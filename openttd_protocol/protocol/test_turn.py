@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+
+from ..wire.testing import FakeTransport
+from .turn import TurnProtocol
+
+
+def _connect(callback=None, port=12345):
+    protocol = TurnProtocol(callback)
+    protocol.connection_made(FakeTransport(port=port))
+    return protocol
+
+
+@pytest.mark.asyncio
+async def test_relay():
+    server = _connect(port=1)
+    client = _connect(port=2)
+
+    # Bytes received before the relay started, complete packets or not, are
+    # forwarded in order.
+    client.data_received(b"\x03\x00\x08\x04\x00")
+    server.data_received(b"\x03")
+    TurnProtocol.relay(server, client)
+    client.data_received(b"\x09\x01")
+    server.data_received(b"\x00\x07")
+
+    assert b"".join(server.transport.written) == b"\x03\x00\x08\x04\x00\x09\x01"
+    assert b"".join(client.transport.written) == b"\x03\x00\x07"
+    assert (server.relay_bytes, client.relay_bytes) == (3, 7)
+
+    # The tasks processing the queue are stopped.
+    await asyncio.sleep(0)
+    assert server.task.done()
+    assert client.task.done()
+
+    server.connection_lost(None)
+    client.connection_lost(None)
+
+
+@pytest.mark.asyncio
+async def test_relay_from_callback():
+    class Callback:
+        async def receive_PACKET_TURN_SERCLI_CONNECT(self, source, protocol_version, ticket):
+            TurnProtocol.relay(source.protocol, server)
+            # The callback is not interrupted by stopping its own task.
+            await asyncio.sleep(0)
+            seen.append(ticket)
+
+    seen = []
+    server = _connect(port=1)
+    client = _connect(Callback(), port=2)
+
+    client.data_received(b"\x08\x00\x01\x06abc\x00\x03\x00\x08")
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+    assert seen == ["abc"]
+    assert server.transport.written == [b"\x03\x00\x08"]
+    # The task ends by itself; it is not cancelled.
+    assert client.task.done()
+    assert not client.task.cancelled()
+
+    server.connection_lost(None)
+    client.connection_lost(None)
+
+
+@pytest.mark.asyncio
+async def test_relay_backpressure():
+    server = _connect(port=1)
+    client = _connect(port=2)
+    TurnProtocol.relay(server, client)
+
+    # Either side that cannot write stops reading on the other side.
+    server.pause_writing()
+    assert not client.transport.reading
+    assert server.transport.reading
+    server.resume_writing()
+    assert client.transport.reading
+
+    client.pause_writing()
+    assert not server.transport.reading
+    client.resume_writing()
+    assert server.transport.reading
+
+    server.connection_lost(None)
+    client.connection_lost(None)
+
+
+@pytest.mark.parametrize("closing", [0, 1])
+@pytest.mark.asyncio
+async def test_relay_teardown(closing):
+    protocols = [_connect(port=1), _connect(port=2)]
+    TurnProtocol.relay(*protocols)
+
+    # If one side is gone, the other side is closed too.
+    protocols[closing].connection_lost(None)
+    assert protocols[1 - closing].transport.closing
+    assert not protocols[closing].transport.closing
+
+    protocols[1 - closing].connection_lost(None)
@@ -0,0 +1,212 @@
+import asyncio
+import collections
+import time
+
+from .write import SEND_TCP_COMPAT_MTU
+
+
+class TokenBucket:
+    """Token bucket allowing on average rate bytes per second."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+
+        self._last = time.monotonic()
+
+    def refill(self, now):
+        """Add the tokens that became available since the last refill."""
+        self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def delay(self, size):
+        """Return how many seconds it takes before size bytes are allowed."""
+        # A packet can be bigger than the burst; in that case the bucket is
+        # allowed to go into debt, otherwise it would never be sent.
+        needed = min(size, self.burst)
+        if self.tokens >= needed:
+            return 0
+        return (needed - self.tokens) / self.rate
+
+    def consume(self, size):
+        """Take size bytes from the bucket; this can bring the bucket in debt."""
+        self.tokens -= size
+
+
+class _Transfer:
+    def __init__(self, source, rate, burst):
+        self.source = source
+        self.bucket = TokenBucket(rate, burst) if rate else None
+
+        self.deficit = 0
+        self.waiter = None
+
+        self.bytes_sent = 0
+        self.started = time.monotonic()
+
+
+class BandwidthScheduler:
+    """Share the uplink between concurrent transfers, using deficit round-robin."""
+
+    # A transfer is a (long) series of bulk packets, for example the chunks of
+    # a file. Before sending such packet, acquire() should be awaited; it
+    # returns once the packet is allowed to be sent. This is limited by:
+    # - rate: the amount of bytes per second for all transfers together.
+    # - connection_rate: the amount of bytes per second for a single transfer.
+    # - burst: the amount of bytes that can be sent at once after being idle;
+    #   by default one second worth of bytes.
+    # Between transfers that are waiting, deficit round-robin decides who is
+    # next. This means every transfer gets an equal share of bytes, no matter
+    # how big its packets are.
+    #
+    # Small packets that are not part of a transfer (metadata and such) should
+    # not wait behind the bulk data. Instead, they are sent right away, and
+    # charge() deducts them from the global rate. This means the transfers
+    # give way to them.
+
+    def __init__(self, rate=None, connection_rate=None, burst=None, quantum=SEND_TCP_COMPAT_MTU):
+        self.connection_rate = connection_rate
+        self.burst = burst
+        self.quantum = quantum
+
+        self.priority_bytes = 0
+
+        self._bucket = TokenBucket(rate, burst) if rate else None
+        self._transfers = {}
+        self._active = collections.deque()
+        self._wakeup = None
+        self._task = None
+
+    def open(self, key, source=None):
+        """Start a transfer; key is an object unique to the transfer, like the protocol instance."""
+        self._transfers[key] = _Transfer(source, self.connection_rate, self.burst)
+
+    def close(self, key):
+        """Finish a transfer."""
+        transfer = self._transfers.pop(key, None)
+        if transfer is not None and transfer.waiter is not None:
+            transfer.waiter[1].cancel()
+
+    def charge(self, size):
+        """Account for a packet that is sent outside of a transfer."""
+        self.priority_bytes += size
+        if self._bucket is not None:
+            self._bucket.consume(size)
+
+    async def acquire(self, key, size):
+        """Wait till the transfer is allowed to send size bytes."""
+        transfer = self._transfers[key]
+
+        # Without limits there is nothing to share; don't bother scheduling.
+        if self._bucket is None and transfer.bucket is None:
+            transfer.bytes_sent += size
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        transfer.waiter = (size, future)
+        self._active.append(transfer)
+
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        else:
+            self._wakeup.set()
+
+        try:
+            await future
+        finally:
+            transfer.waiter = None
+
+    def stats(self):
+        """Return the throughput of every active transfer."""
+        now = time.monotonic()
+
+        result = []
+        for transfer in self._transfers.values():
+            duration = now - transfer.started
+            result.append(
+                {
+                    "source": transfer.source,
+                    "bytes_sent": transfer.bytes_sent,
+                    "duration": duration,
+                    "rate": transfer.bytes_sent / duration if duration > 0 else 0,
+                }
+            )
+        return result
+
+    def _dispatch(self):
+        # Grant as many waiting transfers as possible. Returns the time to
+        # wait before trying again, or None if nobody is waiting anymore.
+        now = time.monotonic()
+        if self._bucket is not None:
+            self._bucket.refill(now)
+
+        delay = None
+        blocked = 0
+        while blocked < len(self._active):
+            transfer = self._active[0]
+
+            if transfer.waiter is None or transfer.waiter[1].done():
+                # Cancelled or closed while waiting.
+                self._active.popleft()
+                blocked = 0
+                continue
+
+            size, future = transfer.waiter
+
+            # If this transfer is over its own rate, give the others a go.
+            if transfer.bucket is not None:
+                transfer.bucket.refill(now)
+                transfer_delay = transfer.bucket.delay(size)
+                if transfer_delay:
+                    self._active.rotate(-1)
+                    blocked += 1
+                    delay = transfer_delay if delay is None else min(delay, transfer_delay)
+                    continue
+
+            # It is this transfer's turn; if we are over the global rate, we
+            # wait for it, to not give the turn away to someone else. This is
+            # also done before the deficit is raised, so a round only passes
+            # when there is bandwidth to hand out.
+            if self._bucket is not None:
+                global_delay = self._bucket.delay(size)
+                if global_delay:
+                    return global_delay
+
+            if transfer.deficit < size:
+                transfer.deficit += self.quantum
+                if transfer.deficit < size:
+                    self._active.rotate(-1)
+                    continue
+
+            if self._bucket is not None:
+                self._bucket.consume(size)
+
+            if transfer.bucket is not None:
+                transfer.bucket.consume(size)
+
+            self._active.popleft()
+            transfer.deficit -= size
+            transfer.bytes_sent += size
+            future.set_result(None)
+            blocked = 0
+
+        if not self._active:
+            return None
+        return delay
+
+    async def _run(self):
+        try:
+            while True:
+                delay = self._dispatch()
+                if delay is None:
+                    return
+
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._task = None
@@ -0,0 +1,66 @@
+import collections
+
+
+class PacketCache:
+    """Bounded LRU cache of packets that are ready to be sent."""
+
+    # Encoding a packet can be expensive, while the result is often the same
+    # for every client asking for it. This cache stores the result of
+    # write_presend(), so it can be handed to send_packet() directly.
+    #
+    # Every clear() increments the generation. When building an entry takes
+    # a while (or awaits), fetch the generation before starting, and pass it
+    # to put(). If the cache was cleared in the meantime, the (now outdated)
+    # entry is not stored. This makes invalidating everything atomic.
+
+    def __init__(self, max_entries=10000, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.generation = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Get the packet stored for this key, or None if there is none."""
+        packet = self._entries.get(key)
+        if packet is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return packet
+
+    def put(self, key, packet, generation=None):
+        """Store a packet for this key, evicting the least recently used entries if needed."""
+        if generation is not None and generation != self.generation:
+            return
+        if self.max_bytes is not None and len(packet) > self.max_bytes:
+            return
+
+        self.discard(key)
+        self._entries[key] = packet
+        self.size += len(packet)
+
+        while len(self._entries) > self.max_entries or (self.max_bytes is not None and self.size > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def discard(self, key):
+        """Remove the packet stored for this key, if any."""
+        packet = self._entries.pop(key, None)
+        if packet is not None:
+            self.size -= len(packet)
+
+    def clear(self):
+        """Remove all packets, and start a new generation."""
+        self._entries.clear()
+        self.size = 0
+        self.generation += 1
@@ -0,0 +1,121 @@
+import enum
+import itertools
+import mmap
+import os
+import struct
+import time
+import weakref
+
+# Append-only binary log of framed packets, to reproduce real traffic later
+# (see benchmark/replay.py).
+#
+# Every file starts with MAGIC, followed by records:
+#   float64 timestamp (time.time()), uint64 connection id, uint8 direction,
+#   uint32 length, followed by the packet (as framed on the wire).
+# All little endian.
+
+MAGIC = b"OTTDCAP1"
+RECORD = struct.Struct("<dQBI")
+
+
+class Direction(enum.IntEnum):
+    RECEIVED = 0
+    SENT = 1
+
+
+class PacketCapture:
+    # Assign an instance to TCPProtocol.capture (or to that of a subclass)
+    # to record every packet received and sent.
+    #
+    # Once a file grows beyond max_bytes, it is rotated: "capture.bin"
+    # becomes "capture.bin.1", "capture.bin.1" becomes "capture.bin.2", etc.
+    # At most "backups" old files are kept.
+    #
+    # Writes are buffered; call flush() to make sure everything up till now
+    # is on disk.
+
+    def __init__(self, filename, max_bytes=64 * 1024 * 1024, backups=5):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+        self._connection_ids = weakref.WeakKeyDictionary()
+        self._next_connection_id = itertools.count(1)
+        self._file = None
+        self._size = 0
+        self._open()
+
+    def _open(self):
+        self._file = open(self.filename, "wb")
+        self._file.write(MAGIC)
+        self._size = len(MAGIC)
+
+    def _rotate(self):
+        self._file.close()
+
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.filename}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.filename}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.filename, f"{self.filename}.1")
+
+        self._open()
+
+    def _record(self, protocol, direction, data):
+        connection_id = self._connection_ids.get(protocol)
+        if connection_id is None:
+            connection_id = self._connection_ids[protocol] = next(self._next_connection_id)
+
+        self._file.write(RECORD.pack(time.time(), connection_id, direction, len(data)))
+        self._file.write(data)
+        self._size += RECORD.size + len(data)
+
+        if self._size >= self.max_bytes:
+            self._rotate()
+
+    def packet_received(self, protocol, data):
+        self._record(protocol, Direction.RECEIVED, data)
+
+    def packet_sent(self, protocol, data):
+        self._record(protocol, Direction.SENT, data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def read_capture(filename):
+    """Iterate over (timestamp, connection_id, direction, packet) of all records in a capture file."""
+    # The packet is a memoryview into the (memory-mapped) file; copy it if it
+    # is needed after the iteration.
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= len(MAGIC):
+            return
+
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(data)
+        try:
+            if view[0 : len(MAGIC)] != MAGIC:
+                raise ValueError(f"{filename} is not a packet capture")
+
+            offset = len(MAGIC)
+            while offset + RECORD.size <= len(view):
+                timestamp, connection_id, direction, length = RECORD.unpack_from(view, offset)
+                offset += RECORD.size
+                if offset + length > len(view):
+                    # Truncated record; the capture was not flushed.
+                    break
+
+                yield timestamp, connection_id, Direction(direction), view[offset : offset + length]
+                offset += length
+        finally:
+            view.release()
+            try:
+                data.close()
+            except BufferError:
+                # The caller still holds on to a packet; the file is unmapped
+                # once that is gone.
+                pass
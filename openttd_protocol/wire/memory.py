@@ -0,0 +1,134 @@
+import asyncio
+import collections
+import logging
+import time
+import weakref
+
+log = logging.getLogger(__name__)
+
+
+class MemoryBudget:
+    # Assign an instance to TCPProtocol.memory_budget (or to that of a
+    # subclass), and call start() from within the event loop.
+    #
+    # The memory of a connection is what it buffers: received data that is
+    # not a complete packet yet, packets waiting to be handled, and data
+    # waiting to be written to the peer. Connections are evicted (aborted)
+    # when:
+    # - connection_budget: they use more than this many bytes.
+    # - write_paused_timeout: the peer did not read for this many seconds,
+    #   while we had data for it. Such peer is alive, but is not reading.
+    # - global_budget: all connections together use more than this many
+    #   bytes. Connections are evicted in order (see "evict": "largest" or
+    #   "oldest" first) till the total is within budget again.
+    #
+    # Received data is checked on arrival; everything else every "interval"
+    # seconds.
+
+    def __init__(
+        self,
+        connection_budget=None,
+        global_budget=None,
+        write_paused_timeout=None,
+        evict="largest",
+        interval=1.0,
+    ):
+        if evict not in ("largest", "oldest"):
+            raise ValueError(f"unknown eviction order: {evict}")
+
+        self.connection_budget = connection_budget
+        self.global_budget = global_budget
+        self.write_paused_timeout = write_paused_timeout
+        self.evict = evict
+        self.interval = interval
+
+        self.usage_total = 0
+        self.evicted = collections.Counter()
+
+        self._connections = weakref.WeakKeyDictionary()
+        self._task = None
+
+    def start(self):
+        """Start checking the budgets periodically."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """Stop checking the budgets periodically."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.check()
+
+    @staticmethod
+    def usage(protocol):
+        """Return the amount of bytes buffered for this connection."""
+        return len(protocol._data) + protocol._queued_bytes + protocol.transport.get_write_buffer_size()
+
+    def connection_made(self, protocol):
+        self._connections[protocol] = time.monotonic()
+
+    def connection_lost(self, protocol):
+        self._connections.pop(protocol, None)
+
+    def data_received(self, protocol):
+        if self.connection_budget is not None and self.usage(protocol) > self.connection_budget:
+            self._evict(protocol, "connection_budget")
+
+    def _evict(self, protocol, reason):
+        self.evicted[reason] += 1
+        log.info("Evicting connection from %s:%d: %s", protocol.source.ip, protocol.source.port, reason)
+        protocol.transport.abort()
+
+    def check(self):
+        """Evict the connections that are over budget."""
+        now = time.monotonic()
+
+        total = 0
+        candidates = []
+        for protocol, connected_at in list(self._connections.items()):
+            if protocol.transport.is_closing():
+                continue
+
+            if (
+                self.write_paused_timeout is not None
+                and protocol._write_paused_at is not None
+                and now - protocol._write_paused_at > self.write_paused_timeout
+            ):
+                self._evict(protocol, "write_paused")
+                continue
+
+            usage = self.usage(protocol)
+            if self.connection_budget is not None and usage > self.connection_budget:
+                self._evict(protocol, "connection_budget")
+                continue
+
+            total += usage
+            if usage:
+                candidates.append((usage, connected_at, protocol))
+
+        if self.global_budget is not None and total > self.global_budget:
+            if self.evict == "largest":
+                candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+            else:
+                candidates.sort(key=lambda candidate: candidate[1])
+
+            for usage, _, protocol in candidates:
+                if total <= self.global_budget:
+                    break
+                self._evict(protocol, "global_budget")
+                total -= usage
+
+        self.usage_total = total
+
+    def stats(self):
+        """Return the amount of connections, their total usage and the evictions per reason."""
+        return {
+            "connections": len(self._connections),
+            "usage": self.usage_total,
+            "evicted": dict(self.evicted),
+        }
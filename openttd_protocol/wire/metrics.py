@@ -0,0 +1,196 @@
+import bisect
+import collections
+import weakref
+
+# Upper bounds (in seconds) of the buckets of the handler latency histograms.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Return (upper-bound, count) pairs, with the count of all values up to that bound."""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics:
+    """Counters, histograms and gauges of the packets going through protocols."""
+
+    # Assign an instance to TCPProtocol.metrics (or to that of a subclass) to
+    # start collecting. When not assigned, the only cost is a single
+    # attribute lookup per packet.
+    #
+    # Everything is keyed by the name of the protocol class and the packet
+    # type. Gauges are calculated when exporting, by looking at the open
+    # connections, so they cost nothing while running.
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+
+        self.packets_received = collections.Counter()
+        self.bytes_received = collections.Counter()
+        self.packets_sent = collections.Counter()
+        self.bytes_sent = collections.Counter()
+        self.packets_invalid = collections.Counter()
+        self.packets_dropped = collections.Counter()
+        self.handler_latency = {}
+
+        self._connections = weakref.WeakSet()
+        self._packet_types = {}
+
+    def _register(self, protocol):
+        name = type(protocol).__name__
+        if name not in self._packet_types:
+            self._packet_types[name] = protocol.PacketType
+        return name
+
+    def connection_made(self, protocol):
+        self._register(protocol)
+        self._connections.add(protocol)
+
+    def connection_lost(self, protocol):
+        self._connections.discard(protocol)
+
+    def packet_received(self, protocol, packet_type, length):
+        key = (self._register(protocol), packet_type.value)
+        self.packets_received[key] += 1
+        self.bytes_received[key] += length
+
+    def packet_invalid(self, protocol):
+        self.packets_invalid[self._register(protocol)] += 1
+
+    def packet_dropped(self, protocol):
+        self.packets_dropped[self._register(protocol)] += 1
+
+    def packet_sent(self, protocol, data):
+        key = (self._register(protocol), data[2])
+        self.packets_sent[key] += 1
+        self.bytes_sent[key] += len(data)
+
+    def handler_finished(self, protocol, packet_type, duration):
+        key = (self._register(protocol), packet_type.value)
+        histogram = self.handler_latency.get(key)
+        if histogram is None:
+            histogram = self.handler_latency[key] = Histogram(self.buckets)
+        histogram.observe(duration)
+
+    def _packet_type_name(self, protocol_name, packet_type):
+        try:
+            return self._packet_types[protocol_name](packet_type).name
+        except ValueError:
+            return str(packet_type)
+
+    def _gauges(self):
+        gauges = collections.defaultdict(lambda: {"open": 0, "write_paused": 0, "queued": 0, "queued_packets": 0})
+        for protocol in list(self._connections):
+            gauge = gauges[type(protocol).__name__]
+            gauge["open"] += 1
+            if not protocol._can_write.is_set():
+                gauge["write_paused"] += 1
+            queued = protocol._queue.qsize()
+            if queued:
+                gauge["queued"] += 1
+                gauge["queued_packets"] += queued
+        return gauges
+
+    def as_dict(self):
+        """Return all metrics as a (JSON serializable) dict."""
+        result = collections.defaultdict(
+            lambda: {"connections": {}, "packets": {}, "invalid_packets": 0, "dropped_packets": 0}
+        )
+
+        for protocol_name, gauge in self._gauges().items():
+            result[protocol_name]["connections"] = gauge
+        for protocol_name, count in self.packets_invalid.items():
+            result[protocol_name]["invalid_packets"] = count
+        for protocol_name, count in self.packets_dropped.items():
+            result[protocol_name]["dropped_packets"] = count
+
+        keys = set(self.packets_received) | set(self.packets_sent) | set(self.handler_latency)
+        for protocol_name, packet_type in sorted(keys):
+            packet = {
+                "packets_received": self.packets_received[(protocol_name, packet_type)],
+                "bytes_received": self.bytes_received[(protocol_name, packet_type)],
+                "packets_sent": self.packets_sent[(protocol_name, packet_type)],
+                "bytes_sent": self.bytes_sent[(protocol_name, packet_type)],
+            }
+
+            histogram = self.handler_latency.get((protocol_name, packet_type))
+            if histogram is not None:
+                packet["handler_latency"] = {
+                    "buckets": {str(bound): count for bound, count in histogram.cumulative()},
+                    "sum": histogram.sum,
+                    "count": histogram.count,
+                }
+
+            result[protocol_name]["packets"][self._packet_type_name(protocol_name, packet_type)] = packet
+
+        return dict(result)
+
+    def as_prometheus(self, prefix="openttd_protocol"):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def counter(name, help, values, with_packet_type=True):
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for key, value in sorted(values.items()):
+                if with_packet_type:
+                    protocol_name, packet_type = key
+                    packet_type = self._packet_type_name(protocol_name, packet_type)
+                    labels = f'protocol="{protocol_name}",packet_type="{packet_type}"'
+                else:
+                    labels = f'protocol="{key}"'
+                lines.append(f"{prefix}_{name}{{{labels}}} {value}")
+
+        counter("packets_received_total", "Packets received.", self.packets_received)
+        counter("bytes_received_total", "Bytes received.", self.bytes_received)
+        counter("packets_sent_total", "Packets sent.", self.packets_sent)
+        counter("bytes_sent_total", "Bytes sent.", self.bytes_sent)
+        counter("packets_invalid_total", "Invalid packets received.", self.packets_invalid, with_packet_type=False)
+        counter(
+            "packets_dropped_total",
+            "Packets dropped as too many were waiting to be handled.",
+            self.packets_dropped,
+            with_packet_type=False,
+        )
+
+        lines.append(f"# HELP {prefix}_handler_seconds Time spent in receive_* callbacks.")
+        lines.append(f"# TYPE {prefix}_handler_seconds histogram")
+        for (protocol_name, packet_type), histogram in sorted(self.handler_latency.items()):
+            packet_type = self._packet_type_name(protocol_name, packet_type)
+            labels = f'protocol="{protocol_name}",packet_type="{packet_type}"'
+            for bound, count in histogram.cumulative():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{prefix}_handler_seconds_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f"{prefix}_handler_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"{prefix}_handler_seconds_count{{{labels}}} {histogram.count}")
+
+        gauges = self._gauges()
+        for name, help in (
+            ("open", "Open connections."),
+            ("write_paused", "Connections the peer is not reading from fast enough."),
+            ("queued", "Connections with received packets waiting to be handled."),
+            ("queued_packets", "Received packets waiting to be handled."),
+        ):
+            lines.append(f"# HELP {prefix}_connections_{name} {help}")
+            lines.append(f"# TYPE {prefix}_connections_{name} gauge")
+            for protocol_name, gauge in sorted(gauges.items()):
+                lines.append(f'{prefix}_connections_{name}{{protocol="{protocol_name}"}} {gauge[name]}')
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,103 @@
+import asyncio
+import concurrent.futures
+import enum
+import functools
+
+from .source import Source
+
+
+class Offload(enum.Enum):
+    INLINE = "inline"
+    THREAD = "thread"
+    PROCESS = "process"
+
+
+class Offloader:
+    # Runs receive_* callbacks that would block the event loop in a thread or
+    # process pool. The callback class declares which packets this applies
+    # to, with an "offload" attribute:
+    #
+    #   class Application:
+    #       offload = {PacketContentType.PACKET_CONTENT_CLIENT_CONTENT: Offload.THREAD}
+    #
+    #       def receive_PACKET_CONTENT_CLIENT_CONTENT(self, source, content_infos):
+    #           ...  # Runs in a thread; it is a normal function, not a coroutine.
+    #           return result
+    #
+    #       async def done_PACKET_CONTENT_CLIENT_CONTENT(self, source, result):
+    #           ...  # Runs on the event loop once the callback is done (optional).
+    #
+    # For Offload.PROCESS the callback has to be picklable; use a staticmethod.
+    # It gets a copy of the source without protocol, and its result has to be
+    # picklable too.
+    #
+    # Packets of a single connection are still handled one by one, in order;
+    # other connections continue while a callback is running. At most
+    # max_pending callbacks per pool are running or waiting; connections
+    # that find the pool full stop reading till there is room again.
+
+    def __init__(self, thread_workers=None, process_workers=None, max_pending=100):
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self.max_pending = max_pending
+
+        self._executors = {}
+        self._semaphores = {}
+
+    def _executor(self, offload):
+        executor = self._executors.get(offload)
+        if executor is None:
+            if offload == Offload.THREAD:
+                executor = concurrent.futures.ThreadPoolExecutor(self.thread_workers)
+            else:
+                executor = concurrent.futures.ProcessPoolExecutor(self.process_workers)
+            self._executors[offload] = executor
+        return executor
+
+    def _semaphore(self, offload):
+        semaphore = self._semaphores.get(offload)
+        if semaphore is None:
+            semaphore = self._semaphores[offload] = asyncio.Semaphore(self.max_pending)
+        return semaphore
+
+    async def run(self, protocol, offload, callback, source, /, *args, **kwargs):
+        """Run the callback in the pool for this kind of offload, and return its result."""
+        if asyncio.iscoroutinefunction(callback):
+            raise TypeError(f"{callback.__qualname__} is offloaded, so it should not be a coroutine")
+
+        if offload == Offload.PROCESS:
+            source = Source(None, source.addr, source.ip, source.port)
+
+        semaphore = self._semaphore(offload)
+        if semaphore.locked():
+            protocol.pause_reading()
+            try:
+                await semaphore.acquire()
+            finally:
+                protocol.resume_reading()
+        else:
+            await semaphore.acquire()
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor(offload), functools.partial(callback, source, *args, **kwargs)
+            )
+        finally:
+            semaphore.release()
+
+    def shutdown(self, wait=True):
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait)
+        self._executors.clear()
+
+
+_default = None
+
+
+def default_offloader():
+    """Return the Offloader used by protocols that have none assigned."""
+    global _default
+    if _default is None:
+        _default = Offloader()
+    return _default
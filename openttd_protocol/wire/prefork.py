@@ -0,0 +1,345 @@
+import asyncio
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import pickle
+import signal
+import struct
+import time
+import weakref
+
+log = logging.getLogger(__name__)
+
+
+def _is_open(protocol):
+    # connection_made() might not have been called yet.
+    transport = getattr(protocol, "transport", None)
+    return transport is not None and not transport.is_closing()
+
+
+# Workers send their stats to the parent over a pipe, as a uint32 length
+# followed by the pickled stats.
+_STATS_HEADER = struct.Struct("!I")
+
+
+class _StatsReader:
+    # The parent's end of the stats pipe of a worker.
+
+    def __init__(self, fd):
+        os.set_blocking(fd, False)
+        self._fd = fd
+        self._buffer = b""
+        self.eof = False
+
+    def fileno(self):
+        return self._fd
+
+    def read(self):
+        """Return the last stats in the pipe, or None if there is none; sets eof once the worker closed it."""
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                self.eof = True
+                break
+            self._buffer += data
+
+        stats = None
+        while len(self._buffer) >= _STATS_HEADER.size:
+            (length,) = _STATS_HEADER.unpack_from(self._buffer)
+            end = _STATS_HEADER.size + length
+            if len(self._buffer) < end:
+                break
+            stats = pickle.loads(self._buffer[_STATS_HEADER.size : end])
+            self._buffer = self._buffer[end:]
+        return stats
+
+    def close(self):
+        os.close(self._fd)
+
+
+class _StatsWriter(asyncio.BaseProtocol):
+    # The worker's end of the stats pipe, written without blocking.
+
+    def __init__(self):
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+    def send(self, stats):
+        # A parent that is busy (or stuck) should never stall the worker.
+        # If the previous stats are still waiting for room in the pipe,
+        # drop these; newer stats follow soon enough.
+        if self.transport.get_write_buffer_size():
+            return
+
+        data = pickle.dumps(stats)
+        self.transport.write(_STATS_HEADER.pack(len(data)) + data)
+
+
+class PreforkServer:
+    # Runs a TCPProtocol based service in several processes, all listening on
+    # the same port via SO_REUSEPORT; the kernel spreads new connections over
+    # the processes. Example:
+    #
+    #   server = PreforkServer(CoordinatorProtocol, Application, "0.0.0.0", 3976, workers=4)
+    #   server.run()
+    #
+    # application_factory is called inside every worker, after the fork, so
+    # every worker gets its own application (and event loop). If the
+    # application has a "shutdown" coroutine, it is awaited when the worker
+    # stops.
+    #
+    # The parent only supervises: it restarts workers that die, and on
+    # SIGTERM / SIGINT it asks all workers to stop. A stopping worker stops
+    # accepting new connections, and waits up to shutdown_timeout seconds for
+    # the existing connections to finish, before closing them.
+    #
+    # Every stats_interval seconds, each worker sends its stats to the
+    # parent; see stats(). If the protocol has metrics or a watchdog
+    # assigned, those are included too.
+
+    def __init__(
+        self,
+        protocol_class,
+        application_factory,
+        host,
+        port,
+        workers=None,
+        stats_interval=5,
+        restart_delay=1,
+        shutdown_timeout=10,
+    ):
+        self.protocol_class = protocol_class
+        self.application_factory = application_factory
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count()
+        self.stats_interval = stats_interval
+        self.restart_delay = restart_delay
+        self.shutdown_timeout = shutdown_timeout
+
+        self.restarts = [0] * self.workers
+
+        self._context = multiprocessing.get_context("fork")
+        self._processes = [None] * self.workers
+        self._pipes = [None] * self.workers
+        self._stats = [None] * self.workers
+        self._restart_at = {}
+        self._stopping = False
+
+    # Everything below runs in the parent.
+
+    def _start_worker(self, index):
+        receiver, sender = os.pipe()
+        process = self._context.Process(
+            target=self._worker_main, args=(sender,), name=f"{self.protocol_class.__name__}-{index}"
+        )
+        process.start()
+        os.close(sender)
+
+        self._processes[index] = process
+        self._pipes[index] = _StatsReader(receiver)
+        log.info("Started worker %d (pid %d)", index, process.pid)
+
+    def start(self):
+        """Start all workers."""
+        for index in range(self.workers):
+            self._start_worker(index)
+
+    def poll(self, timeout):
+        """Collect stats and restart dead workers; waits at most timeout seconds for something to happen."""
+        now = time.monotonic()
+        for index, restart_at in list(self._restart_at.items()):
+            if restart_at <= now:
+                del self._restart_at[index]
+                self.restarts[index] += 1
+                self._start_worker(index)
+            else:
+                timeout = min(timeout, restart_at - now)
+
+        waitables = [pipe for pipe in self._pipes if pipe is not None]
+        waitables += [process.sentinel for process in self._processes if process is not None]
+        ready = multiprocessing.connection.wait(waitables, timeout)
+
+        for index, pipe in enumerate(self._pipes):
+            if pipe is None or pipe not in ready:
+                continue
+
+            try:
+                stats = pipe.read()
+            except OSError:
+                stats = None
+                pipe.eof = True
+
+            if stats is not None:
+                self._stats[index] = stats
+            if pipe.eof:
+                pipe.close()
+                self._pipes[index] = None
+
+        for index, process in enumerate(self._processes):
+            if process is None or process.sentinel not in ready:
+                continue
+
+            process.join()
+            self._processes[index] = None
+            if self._pipes[index] is not None:
+                self._pipes[index].close()
+                self._pipes[index] = None
+
+            if self._stopping:
+                continue
+
+            log.warning(
+                "Worker %d (pid %d) died with exit code %s; restarting in %ds",
+                index,
+                process.pid,
+                process.exitcode,
+                self.restart_delay,
+            )
+            self._restart_at[index] = time.monotonic() + self.restart_delay
+
+    def stop(self):
+        """Ask all workers to stop, and wait for them to do so."""
+        self._stopping = True
+        self._restart_at.clear()
+
+        for process in self._processes:
+            if process is not None:
+                process.terminate()
+
+        deadline = time.monotonic() + self.shutdown_timeout + 5
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                log.warning("Worker %d (pid %d) did not stop in time; killing it", index, process.pid)
+                process.kill()
+                process.join()
+            self._processes[index] = None
+
+        for index, pipe in enumerate(self._pipes):
+            if pipe is not None:
+                pipe.close()
+                self._pipes[index] = None
+
+    def stats(self):
+        """Return the last stats received from every worker, by worker index."""
+        result = {}
+        for index, stats in enumerate(self._stats):
+            if stats is not None:
+                result[index] = dict(stats, restarts=self.restarts[index])
+        return result
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def run(self):
+        """Start the workers, and supervise them till SIGTERM / SIGINT."""
+        previous = {sig: signal.signal(sig, self._request_stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+
+        try:
+            self.start()
+            while not self._stopping:
+                self.poll(1)
+
+            log.info("Shutting down %d workers ...", self.workers)
+            self.stop()
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+
+    # Everything below runs in the workers.
+
+    def _worker_main(self, fd):
+        # Undo the signal handlers of the parent; the event loop installs
+        # its own.
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+        asyncio.run(self._serve(fd))
+
+    def _worker_stats(self, protocols, connections_total):
+        stats = {
+            "pid": os.getpid(),
+            "connections": sum(1 for protocol in list(protocols) if _is_open(protocol)),
+            "connections_total": connections_total,
+        }
+        if self.protocol_class.metrics is not None:
+            stats["metrics"] = self.protocol_class.metrics.as_dict()
+        if self.protocol_class.watchdog is not None:
+            stats["watchdog"] = self.protocol_class.watchdog.stats()
+        return stats
+
+    async def _serve(self, fd):
+        loop = asyncio.get_running_loop()
+        _, pipe = await loop.connect_write_pipe(_StatsWriter, os.fdopen(fd, "wb"))
+
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+
+        application = self.application_factory()
+        if self.protocol_class.watchdog is not None:
+            self.protocol_class.watchdog.start()
+        protocols = weakref.WeakSet()
+        connections_total = 0
+
+        def protocol_factory():
+            nonlocal connections_total
+
+            protocol = self.protocol_class(application)
+            protocols.add(protocol)
+            connections_total += 1
+            return protocol
+
+        server = await loop.create_server(
+            protocol_factory, host=self.host, port=self.port, reuse_port=True, start_serving=True
+        )
+
+        while not stop.is_set():
+            if pipe.closed.done():
+                # The parent is gone; no reason to continue.
+                break
+            pipe.send(self._worker_stats(protocols, connections_total))
+
+            try:
+                await asyncio.wait_for(stop.wait(), self.stats_interval)
+            except asyncio.TimeoutError:
+                pass
+
+        # Stop accepting new connections, and give the existing ones some
+        # time to finish.
+        server.close()
+
+        deadline = loop.time() + self.shutdown_timeout
+        while loop.time() < deadline:
+            if not any(_is_open(protocol) for protocol in list(protocols)):
+                break
+            await asyncio.sleep(0.1)
+
+        for protocol in list(protocols):
+            if _is_open(protocol):
+                protocol.transport.abort()
+
+        if hasattr(application, "shutdown"):
+            await application.shutdown()
+
+        if not pipe.closed.done():
+            pipe.send(self._worker_stats(protocols, connections_total))
+        pipe.transport.close()
+        try:
+            await asyncio.wait_for(asyncio.shield(pipe.closed), 1)
+        except asyncio.TimeoutError:
+            pipe.transport.abort()
@@ -0,0 +1,212 @@
+import asyncio
+import collections
+import enum
+import ipaddress
+import logging
+import time
+import weakref
+
+from .bandwidth import TokenBucket
+
+log = logging.getLogger(__name__)
+
+
+class Action(enum.Enum):
+    # Silently ignore the packet.
+    DROP = "drop"
+    # Accept the packet, but stop reading from the connection till the
+    # source is within its limits again; TCP makes the peer slow down.
+    # Packets already read after it wait unframed till then.
+    DELAY = "delay"
+    # Close the connection.
+    CLOSE = "close"
+
+
+class _SourceState:
+    def __init__(self):
+        self.connections = 0
+        self.bytes = None
+        self.packets = {}
+
+
+class RateLimiter:
+    # Assign an instance to TCPProtocol.rate_limiter (or to that of a
+    # subclass) to limit what a single source can do. Limits are per source
+    # IP, or per prefix of it (for example, /64 for IPv6, as that is often
+    # what a single user gets). They are applied on framed packets, before
+    # they are decoded, and use the IP from the PROXY header if enabled.
+    #
+    # - max_connections: concurrent connections; new connections over this
+    #   limit are closed.
+    # - packet_rate / packet_burst: packets per second (of any type).
+    # - packet_rates: packet type to (rate, burst) for types that need a
+    #   different limit; for example, a low one for CLIENT_LISTING.
+    # - byte_rate / byte_burst: bytes per second.
+    # - action: what to do with a packet over the limit (see Action).
+    #
+    # At most max_sources sources without open connections are tracked; the
+    # least recently seen ones are forgotten first. Sources with open
+    # connections are never forgotten, as that would reset their limits.
+
+    def __init__(
+        self,
+        max_connections=None,
+        packet_rate=None,
+        packet_burst=None,
+        packet_rates=None,
+        byte_rate=None,
+        byte_burst=None,
+        action=Action.DROP,
+        ipv4_prefix=32,
+        ipv6_prefix=64,
+        max_sources=100000,
+    ):
+        self.max_connections = max_connections
+        self.packet_rate = packet_rate
+        self.packet_burst = packet_burst
+        self.packet_rates = {int(packet_type): limit for packet_type, limit in (packet_rates or {}).items()}
+        self.byte_rate = byte_rate
+        self.byte_burst = byte_burst
+        self.action = action
+        self.ipv4_prefix = ipv4_prefix
+        self.ipv6_prefix = ipv6_prefix
+        self.max_sources = max_sources
+
+        # Keyed by (what was limited, action).
+        self.counters = collections.Counter()
+        self.evictions = 0
+
+        self._sources = collections.OrderedDict()
+        self._connections = weakref.WeakKeyDictionary()
+        self._resume_at = weakref.WeakKeyDictionary()
+
+    def _key(self, ip):
+        prefix = self.ipv4_prefix if ip.version == 4 else self.ipv6_prefix
+        if prefix == ip.max_prefixlen:
+            return ip
+        return ipaddress.ip_network((ip, prefix), strict=False)
+
+    def _state(self, protocol):
+        state = self._connections.get(protocol)
+        if state is not None:
+            return state
+
+        key = self._key(protocol.source.ip)
+        state = self._sources.get(key)
+        if state is None:
+            if len(self._sources) >= self.max_sources:
+                self._evict()
+            state = self._sources[key] = _SourceState()
+        else:
+            self._sources.move_to_end(key)
+
+        self._connections[protocol] = state
+        return state
+
+    def _evict(self):
+        # Forget the least recently seen source without open connections.
+        # Those with connections are still in use, so they move to the end;
+        # this way they are not looked at again for the next evictions.
+        for _ in range(len(self._sources)):
+            key, state = next(iter(self._sources.items()))
+            if state.connections == 0:
+                del self._sources[key]
+                self.evictions += 1
+                return
+            self._sources.move_to_end(key)
+
+    def connection_made(self, protocol):
+        """Return whether the connection is allowed."""
+        state = self._state(protocol)
+        state.connections += 1
+
+        if self.max_connections is not None and state.connections > self.max_connections:
+            self.counters[("connections", Action.CLOSE.value)] += 1
+            log.debug("Too many connections from %s; closing", protocol.source.ip)
+            return False
+        return True
+
+    def connection_lost(self, protocol):
+        state = self._connections.pop(protocol, None)
+        if state is not None:
+            state.connections -= 1
+
+    def _buckets(self, state, packet_type, length):
+        # Yield (what is limited, bucket, size) of all limits that apply.
+        limit = self.packet_rates.get(packet_type)
+        if limit is None and self.packet_rate is not None:
+            limit = (self.packet_rate, self.packet_burst)
+        if limit is not None:
+            bucket = state.packets.get(packet_type)
+            if bucket is None:
+                bucket = state.packets[packet_type] = TokenBucket(*limit)
+            yield "packets", bucket, 1
+
+        if self.byte_rate is not None:
+            if state.bytes is None:
+                state.bytes = TokenBucket(self.byte_rate, self.byte_burst)
+            yield "bytes", state.bytes, length
+
+    def packet_received(self, protocol, packet_type, length):
+        """Return whether the packet should be processed; if not, it is dropped, or the connection is closed."""
+        state = self._state(protocol)
+        buckets = list(self._buckets(state, packet_type, length))
+        # After creating the buckets, so a new bucket starts full.
+        now = time.monotonic()
+
+        limited = None
+        delay = 0
+        for what, bucket, size in buckets:
+            bucket.refill(now)
+            bucket_delay = bucket.delay(size)
+            if bucket_delay > delay:
+                limited, delay = what, bucket_delay
+
+        if limited is not None:
+            self.counters[(limited, self.action.value)] += 1
+
+            if self.action == Action.DROP:
+                return False
+            if self.action == Action.CLOSE:
+                log.debug("Source %s is over its %s limit; closing", protocol.source.ip, limited)
+                protocol.transport.close()
+                return False
+
+            self._pause(protocol, now + delay)
+
+        for _, bucket, size in buckets:
+            bucket.consume(size)
+        return True
+
+    def _pause(self, protocol, resume_at):
+        if protocol in self._resume_at:
+            self._resume_at[protocol] = max(self._resume_at[protocol], resume_at)
+            return
+
+        self._resume_at[protocol] = resume_at
+        protocol.pause_reading()
+        asyncio.get_running_loop().call_later(resume_at - time.monotonic(), self._resume, protocol)
+
+    def _resume(self, protocol):
+        resume_at = self._resume_at.get(protocol)
+        if resume_at is None:
+            return
+
+        # The pause might have been extended in the meantime.
+        delay = resume_at - time.monotonic()
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._resume, protocol)
+            return
+
+        del self._resume_at[protocol]
+        # This also frames the packets that were read after the one that was
+        # over the limit, which can delay the connection again.
+        protocol.resume_reading()
+
+    def stats(self):
+        """Return the counters, and how many sources are tracked."""
+        return {
+            "sources": len(self._sources),
+            "evictions": self.evictions,
+            "limited": {f"{what}.{action}": count for (what, action), count in sorted(self.counters.items())},
+        }
@@ -1,8 +1,14 @@
 import struct
 
-from typing import Tuple
+from typing import (
+    Iterator,
+    Tuple,
+)
 
-from .exceptions import PacketTooShort
+from .exceptions import (
+    PacketInvalidSize,
+    PacketTooShort,
+)
 
 # Two notes worth mentioning about this implementation:
 #
@@ -75,3 +81,14 @@ def read_string(data: memoryview) -> Tuple[str, memoryview]:
     except IndexError:
         raise PacketTooShort from None
     return data[0:index].tobytes().decode(), data[index + 1 :]
+
+
+def iter_packets(data: memoryview) -> Iterator[memoryview]:
+    """Iterate over the (framed) packets in data, for example a cached series of packets."""
+    while len(data) > 0:
+        length, _ = read_uint16(data)
+        # A corrupt or truncated length would otherwise never advance.
+        if length < 2 or length > len(data):
+            raise PacketInvalidSize(len(data), length)
+        yield data[0:length]
+        data = data[length:]
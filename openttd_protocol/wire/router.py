@@ -0,0 +1,215 @@
+import asyncio
+import collections
+import logging
+
+from .exceptions import PacketInvalid
+from .read import read_uint8
+from .tcp import PausableReading
+
+log = logging.getLogger(__name__)
+
+
+def peek_packet_type(data):
+    """Return the (raw) packet type of a framed packet, without decoding the rest."""
+    packet_type, _ = read_uint8(data[2:])
+    return packet_type
+
+
+class _Upstream(PausableReading, asyncio.Protocol):
+    def __init__(self, pool, address):
+        super().__init__()
+
+        self.pool = pool
+        self.address = address
+        self.downstream = None
+        self.transport = None
+
+        self._can_write = asyncio.Event()
+        self._can_write.set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.transport.set_write_buffer_limits()
+
+    def connection_lost(self, exc):
+        self.pool._lost(self)
+
+        # Without upstream, the downstream has nobody to talk to anymore.
+        if self.downstream is not None:
+            self.downstream.transport.close()
+
+    def data_received(self, data):
+        if self.downstream is None:
+            log.warning("Upstream %s:%d sent data before being assigned; closing", *self.address)
+            self.transport.close()
+            return
+
+        # Responses go back as they are; they are already framed.
+        self.downstream.transport.write(data)
+
+        # If the downstream cannot keep up, stop reading from the upstream
+        # till it can.
+        if not self.downstream._can_write.is_set():
+            self.pause_reading()
+            asyncio.create_task(self._resume_when_downstream_writable())
+
+    async def _resume_when_downstream_writable(self):
+        await self.downstream._can_write.wait()
+        self.resume_reading()
+
+    def pause_writing(self):
+        self._can_write.clear()
+
+    def resume_writing(self):
+        self._can_write.set()
+
+    async def write(self, data):
+        await self._can_write.wait()
+        self.transport.write(data)
+
+
+class UpstreamPool:
+    # Connections to the upstreams packets are routed to.
+    #
+    # Every downstream connection gets its own upstream connection, as the
+    # OpenTTD protocols are stateful per connection. To not have a connect
+    # in the path of every new downstream, "idle" connections are kept ready
+    # per upstream address.
+    #
+    # If proxy_protocol is set, a PROXY header is sent to the upstream once it
+    # is assigned to a downstream, so the upstream knows the real source.
+
+    def __init__(self, idle=0, connect_timeout=5, proxy_protocol=True):
+        self.idle = idle
+        self.connect_timeout = connect_timeout
+        self.proxy_protocol = proxy_protocol
+
+        self._idle = collections.defaultdict(list)
+        self._connecting = collections.Counter()
+
+    async def _connect(self, address):
+        loop = asyncio.get_running_loop()
+        _, upstream = await asyncio.wait_for(
+            loop.create_connection(lambda: _Upstream(self, address), *address), self.connect_timeout
+        )
+        return upstream
+
+    async def _fill_idle(self, address):
+        self._connecting[address] += 1
+        try:
+            upstream = await self._connect(address)
+        except Exception as err:
+            log.warning("Failed to connect to upstream %s:%d: %r", address[0], address[1], err)
+            return
+        finally:
+            self._connecting[address] -= 1
+
+        self._idle[address].append(upstream)
+
+    def _replenish(self, address):
+        missing = self.idle - len(self._idle[address]) - self._connecting[address]
+        for _ in range(missing):
+            asyncio.create_task(self._fill_idle(address))
+
+    def _lost(self, upstream):
+        idle = self._idle.get(upstream.address)
+        if idle and upstream in idle:
+            idle.remove(upstream)
+
+    async def acquire(self, address, downstream):
+        """Return an upstream connection to address, dedicated to this downstream protocol."""
+        idle = self._idle[address]
+        upstream = idle.pop() if idle else None
+        self._replenish(address)
+
+        if upstream is None:
+            upstream = await self._connect(address)
+        upstream.downstream = downstream
+
+        if self.proxy_protocol:
+            source = downstream.source
+            family = "TCP6" if source.ip.version == 6 else "TCP4"
+            local_ip, local_port = downstream.transport.get_extra_info("sockname")[0:2]
+            header = f"PROXY {family} {source.ip} {local_ip} {source.port} {local_port}\r\n"
+            await upstream.write(header.encode())
+
+        return upstream
+
+    def release(self, upstream):
+        """Close an upstream connection, as its downstream is gone."""
+        upstream.downstream = None
+        upstream.transport.close()
+
+
+class PacketRouter:
+    # Callback class that forwards packets to upstreams, without decoding
+    # them. Use it as callback_class of any TCPProtocol:
+    #
+    #   router = PacketRouter(application, route)
+    #   CoordinatorProtocol(router)
+    #
+    # For the first packet of a connection, route(source, packet_type, data)
+    # is called, with the raw packet type and the framed packet. It can peek
+    # into the packet (with the read_* functions), and returns the (host,
+    # port) of the upstream to forward to, or None to handle the packet
+    # locally, by the application. Once a connection is routed, all its
+    # packets go to the same upstream, as-is. Responses from the upstream are
+    # written back to the connection, also as-is.
+    #
+    # If the packet is too short to peek into (route() raises PacketInvalid),
+    # the connection goes to the default address instead; with None, the
+    # application decodes it, and drops the connection as invalid.
+    #
+    # Everything else (connected, disconnect, receive_PACKET_*, ..) is
+    # passed to the application.
+
+    def __init__(self, application, route, pool=None, default=None):
+        self._application = application
+        self._route = route
+        self._default = default
+        self._pool = pool if pool is not None else UpstreamPool()
+        self._upstreams = {}
+
+    def __getattr__(self, name):
+        return getattr(self._application, name)
+
+    async def receive_raw(self, source, data):
+        protocol = source.protocol
+
+        upstream = self._upstreams.get(protocol)
+        if upstream is None:
+            if hasattr(self._application, "receive_raw"):
+                if await self._application.receive_raw(source, data):
+                    return True
+
+            try:
+                address = self._route(source, peek_packet_type(data), data)
+            except PacketInvalid as err:
+                log.info("Cannot route packet from %s:%d: %r", source.ip, source.port, err)
+                address = self._default
+            if address is None:
+                return False
+
+            try:
+                upstream = await self._pool.acquire(address, protocol)
+            except (OSError, asyncio.TimeoutError) as err:
+                # Without upstream, the connection has nobody to talk to.
+                log.warning("Failed to connect %s:%d to upstream %s:%d: %r", source.ip, source.port, *address, err)
+                protocol.transport.close()
+                return True
+            if protocol.transport.is_closing():
+                # The connection was lost while we were connecting.
+                self._pool.release(upstream)
+                return True
+            self._upstreams[protocol] = upstream
+
+        await upstream.write(data)
+        return True
+
+    def disconnect(self, source):
+        upstream = self._upstreams.pop(source.protocol, None)
+        if upstream is not None:
+            self._pool.release(upstream)
+
+        if hasattr(self._application, "disconnect"):
+            self._application.disconnect(source)
@@ -0,0 +1,193 @@
+import os
+import struct
+import sys
+
+from multiprocessing import (
+    resource_tracker,
+    shared_memory,
+)
+
+# Pre-encoded packets shared between processes on the same host, via
+# multiprocessing.shared_memory. One process publishes snapshots; every
+# other process serves them straight from the shared memory, without
+# encoding them or keeping a copy of its own. Sending them is not zero-copy:
+# send_bulk() joins every slice of packets into a single write.
+#
+# A snapshot consists of named sections, each a list of packets (already
+# prepared with write_presend()). Every publish creates a new shared memory
+# segment, named "<name>-<generation>". A small control segment, named
+# "<name>", holds the generation of the current snapshot; readers check it
+# on every lookup, and switch over when it changes. Once a new generation is
+# published, the previous segment is unlinked; readers still using it keep
+# their mapping till they switch.
+#
+# Segment layout (little endian):
+#   uint64 generation, uint32 section count,
+#   per section: uint16 key length, key (UTF-8), uint64 offset, uint64 length,
+#   followed by the packets of all sections.
+
+_CONTROL_FORMAT = "<Q"
+_HEADER_FORMAT = "<QI"
+_SECTION_FORMAT = "<QQ"
+
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    # Before Python 3.13, attaching to a segment registers it with the
+    # resource tracker, which unlinks it when this process exits, even
+    # though another process owns it. Undo that registration.
+    segment = shared_memory.SharedMemory(name=name)
+    if os.name == "posix":
+        resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+
+class SnapshotPublisher:
+    def __init__(self, name):
+        self.name = name
+        self._segment = None
+
+        try:
+            self._control = shared_memory.SharedMemory(name=name, create=True, size=struct.calcsize(_CONTROL_FORMAT))
+            self.generation = 0
+        except FileExistsError:
+            # Left behind by a previous publisher; continue where it left off,
+            # as readers might still be attached to it.
+            self._control = shared_memory.SharedMemory(name=name)
+            (self.generation,) = struct.unpack_from(_CONTROL_FORMAT, self._control.buf, 0)
+
+    def publish(self, sections):
+        """Publish a new snapshot; sections is a dict of key to a list of packets."""
+        generation = self.generation + 1
+
+        keys = [key.encode() for key in sections]
+        blobs = [b"".join(packets) for packets in sections.values()]
+
+        header_size = struct.calcsize(_HEADER_FORMAT)
+        header_size += sum(2 + len(key) + struct.calcsize(_SECTION_FORMAT) for key in keys)
+        size = header_size + sum(len(blob) for blob in blobs)
+
+        try:
+            segment = shared_memory.SharedMemory(name=f"{self.name}-{generation}", create=True, size=size)
+        except FileExistsError:
+            # Left behind by a previous publisher that crashed.
+            stale = shared_memory.SharedMemory(name=f"{self.name}-{generation}")
+            stale.close()
+            stale.unlink()
+            segment = shared_memory.SharedMemory(name=f"{self.name}-{generation}", create=True, size=size)
+
+        buf = segment.buf
+        struct.pack_into(_HEADER_FORMAT, buf, 0, generation, len(keys))
+        pos = struct.calcsize(_HEADER_FORMAT)
+        offset = header_size
+        for key, blob in zip(keys, blobs):
+            struct.pack_into("<H", buf, pos, len(key))
+            buf[pos + 2 : pos + 2 + len(key)] = key
+            pos += 2 + len(key)
+            struct.pack_into(_SECTION_FORMAT, buf, pos, offset, len(blob))
+            pos += struct.calcsize(_SECTION_FORMAT)
+
+            buf[offset : offset + len(blob)] = blob
+            offset += len(blob)
+        del buf
+
+        # Only now the segment is complete, readers are pointed to it.
+        struct.pack_into(_CONTROL_FORMAT, self._control.buf, 0, generation)
+        self.generation = generation
+
+        previous, self._segment = self._segment, segment
+        if previous is not None:
+            previous.close()
+            previous.unlink()
+
+    def close(self):
+        """Remove the snapshot; readers keep their current snapshot, but will not see new ones."""
+        if self._segment is not None:
+            self._segment.close()
+            self._segment.unlink()
+            self._segment = None
+
+        self._control.close()
+        self._control.unlink()
+
+
+class SnapshotReader:
+    def __init__(self, name):
+        self.name = name
+        self.generation = 0
+
+        self._control = None
+        self._segment = None
+        self._sections = {}
+        self._retired = []
+
+    def _switch(self, generation):
+        try:
+            segment = _attach(f"{self.name}-{generation}")
+        except FileNotFoundError:
+            # Already replaced by a newer generation; pick that one up on
+            # the next lookup.
+            return
+
+        buf = segment.buf
+        header_generation, count = struct.unpack_from(_HEADER_FORMAT, buf, 0)
+        if header_generation != generation:
+            del buf
+            segment.close()
+            return
+
+        sections = {}
+        pos = struct.calcsize(_HEADER_FORMAT)
+        for _ in range(count):
+            (key_length,) = struct.unpack_from("<H", buf, pos)
+            key = bytes(buf[pos + 2 : pos + 2 + key_length]).decode()
+            pos += 2 + key_length
+            sections[key] = struct.unpack_from(_SECTION_FORMAT, buf, pos)
+            pos += struct.calcsize(_SECTION_FORMAT)
+        del buf
+
+        if self._segment is not None:
+            self._retired.append(self._segment)
+        self._segment = segment
+        self._sections = sections
+        self.generation = generation
+
+        # A segment can only be closed once nobody refers to its memory
+        # anymore; till then, keep trying on every switch.
+        for retired in list(self._retired):
+            try:
+                retired.close()
+            except BufferError:
+                continue
+            self._retired.remove(retired)
+
+    def get(self, key):
+        """Return the packets of a section of the current snapshot as a single memoryview, or None."""
+        if self._control is None:
+            try:
+                self._control = _attach(self.name)
+            except FileNotFoundError:
+                # Nothing is published yet.
+                return None
+
+        (generation,) = struct.unpack_from(_CONTROL_FORMAT, self._control.buf, 0)
+        if generation != self.generation:
+            self._switch(generation)
+
+        section = self._sections.get(key)
+        if section is None:
+            return None
+
+        offset, length = section
+        return self._segment.buf[offset : offset + length]
+
+    def close(self):
+        self._sections = {}
+        for segment in [self._segment, self._control] + self._retired:
+            if segment is not None:
+                segment.close()
+        self._segment = None
+        self._control = None
+        self._retired = []
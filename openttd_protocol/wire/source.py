@@ -1,21 +1,35 @@
+import functools
 import ipaddress
 
 
+@functools.lru_cache(maxsize=4096)
+def _parse_ip(ip):
+    ip = ipaddress.ip_address(ip)
+
+    # If using IPv6, IPv4 addresses are mapped like "::fffff:<IPv4>".
+    # Convert those instances to an IPv4Address, so the class of an
+    # instance can be used to easily detect if it is an IPv4 or IPv6.
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+
+    return ip
+
+
 class Source:
+    # Sources are created for every connection (and every datagram), so
+    # keep them small and cheap: parsing the ip is cached for addresses seen
+    # recently. It is still parsed here, so a malformed ip (for example in a
+    # PROXY header) is rejected right away.
+    __slots__ = ("protocol", "addr", "ip", "port")
+
     def __init__(self, protocol, addr, ip, port):
         self.protocol = protocol
         self.addr = addr
 
         # Normally ip and port are in addr, but in case of Proxy Protocol
         # this might differ. So, please use ip/port over addr.
-        self.ip = ipaddress.ip_address(ip)
+        self.ip = _parse_ip(ip)
         self.port = port
 
-        # If using IPv6, IPv4 addresses are mapped like "::fffff:<IPv4>".
-        # Convert those instances to an IPv4Address, so the class of an
-        # instance can be used to easily detect if it is an IPv4 or IPv6.
-        if isinstance(self.ip, ipaddress.IPv6Address) and self.ip.ipv4_mapped:
-            self.ip = self.ip.ipv4_mapped
-
     def __repr__(self):
         return f"Source(ip={self.ip!r}, port={self.port!r}, addr={self.addr!r})"
@@ -0,0 +1,120 @@
+import asyncio
+import collections
+
+Packet = collections.namedtuple("Packet", ["source", "type", "message"])
+
+
+class PacketStream:
+    # Instead of a callback per packet, consume the received packets by
+    # iterating over them:
+    #
+    #   async for packet in protocol.packets():
+    #       ...  # packet.source, packet.type, packet.message
+    #
+    # A stream can also be given as callback class to a server, or to
+    # protocol.packets() of several connections, to merge their packets into
+    # a single stream. With batches() packets of many connections can be
+    # handled at once.
+    #
+    # At most max_size packets are buffered; a connection that finds the
+    # stream full stops reading till the consumer caught up to half of it.
+    # Meanwhile, the packets it already read wait in its own queue, which is
+    # bounded by TCPProtocol.queue_max_size.
+    # A stream created by protocol.packets() ends when its connections are
+    # closed; otherwise when close() is called.
+
+    receive_messages = True
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+
+        self._packets = collections.deque()
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._attached = set()
+        self._closed = False
+
+    def __getattr__(self, name):
+        # Every receive_PACKET_* callback puts the packet on the stream.
+        if not name.startswith("receive_PACKET_"):
+            raise AttributeError(name)
+
+        packet_type_name = name[len("receive_") :]
+
+        async def receive(source, message):
+            await self._put(source, source.protocol.PacketType[packet_type_name], message)
+
+        setattr(self, name, receive)
+        return receive
+
+    def attach(self, protocol):
+        """End the stream once this (and every other attached) connection is closed."""
+        self._attached.add(protocol)
+
+    def disconnect(self, source):
+        if source.protocol in self._attached:
+            self._attached.discard(source.protocol)
+            if not self._attached:
+                self.close()
+
+    def close(self):
+        """End the stream; packets already buffered are still returned."""
+        self._closed = True
+        self._readable.set()
+        self._writable.set()
+
+    async def _put(self, source, packet_type, message):
+        if len(self._packets) >= self.max_size:
+            protocol = source.protocol
+            protocol.pause_reading()
+            try:
+                while len(self._packets) >= self.max_size and not self._closed:
+                    self._writable.clear()
+                    await self._writable.wait()
+            finally:
+                protocol.resume_reading()
+
+        if self._closed:
+            return
+
+        self._packets.append(Packet(source, packet_type, message))
+        self._readable.set()
+
+    async def _wait_readable(self):
+        while not self._packets and not self._closed:
+            self._readable.clear()
+            await self._readable.wait()
+
+    def _taken(self):
+        if len(self._packets) <= self.max_size // 2:
+            self._writable.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self._wait_readable()
+        if not self._packets:
+            raise StopAsyncIteration
+
+        packet = self._packets.popleft()
+        self._taken()
+        return packet
+
+    async def get_batch(self, max_size=100):
+        """Wait for a packet, and return it with those received after it (at most max_size); empty once ended."""
+        await self._wait_readable()
+
+        count = min(len(self._packets), max_size)
+        batch = [self._packets.popleft() for _ in range(count)]
+        self._taken()
+        return batch
+
+    async def batches(self, max_size=100):
+        """Iterate over the packets in lists of at most max_size packets."""
+        while True:
+            batch = await self.get_batch(max_size)
+            if not batch:
+                return
+            yield batch
@@ -1,5 +1,8 @@
 import asyncio
+import enum
+import itertools
 import logging
+import time
 
 from asyncio.coroutines import iscoroutine
 
@@ -9,33 +12,130 @@ from .exceptions import (
     PacketInvalidType,
     SocketClosed,
 )
+from .offload import (
+    Offload,
+    default_offloader,
+)
 from .read import (
     read_uint8,
     read_uint16,
 )
 from .source import Source
+from .stream import (
+    Packet,
+    PacketStream,
+)
 
 log = logging.getLogger(__name__)
 
 
-class TCPProtocol(asyncio.Protocol):
+def message_kwargs(message):
+    """Return the fields of a decoded packet as keyword arguments for its callback."""
+    # receive_* return a named tuple; a dict is accepted too, for decoders
+    # that predate those.
+    if type(message) is dict:
+        return message
+    return message._asdict()
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class Priority(enum.IntEnum):
+    # Small packets that are latency sensitive; the default.
+    CONTROL = 0
+    # Large series of packets, like listings and file transfers.
+    BULK = 1
+
+
+class PausableReading:
+    # Reading from a connection can be paused by several owners at the same
+    # time: the rate limiter, the offloader, a full PacketStream, a relay
+    # peer that is stalling, .. . Every pause_reading() has to be matched by
+    # a resume_reading(); the transport resumes once all owners resumed.
+
+    _reading_paused = 0
+
+    def pause_reading(self):
+        self._reading_paused += 1
+        if self._reading_paused == 1:
+            self.transport.pause_reading()
+
+    def resume_reading(self):
+        self._reading_paused -= 1
+        if self._reading_paused == 0 and not self.transport.is_closing():
+            self.transport.resume_reading()
+            self.reading_resumed()
+
+    def reading_resumed(self):
+        pass
+
+
+class TCPProtocol(PausableReading, asyncio.Protocol):
     proxy_protocol = False
     PacketType = None
     PACKET_END = 0
+    # Set to a Metrics instance to collect metrics about the packets.
+    metrics = None
+    # Set to a Watchdog instance to detect slow callbacks and sends.
+    watchdog = None
+    # Set to a PacketCapture instance to record all packets.
+    capture = None
+    # Set to a RateLimiter instance to limit what a single source can do.
+    rate_limiter = None
+    # Set to an Offloader instance to run the callbacks the callback class
+    # wants offloaded (see Offloader); if not set, a default one is used.
+    offloader = None
+    # Set to a MemoryBudget instance to evict connections that buffer too
+    # much, or whose peer stopped reading.
+    memory_budget = None
+    # While the peer is not reading fast enough (we are write-paused), bulk
+    # packets wait till it catches up, but control packets are still written
+    # as long as the write buffer is below this many bytes. This way they
+    # don't wait behind a listing or file transfer in flight.
+    control_buffer_limit = 256 * 1024
+    # send_bulk() writes its packets in slices, and yields to the event loop
+    # between slices, so a single large listing doesn't stall every other
+    # connection. A slice ends after this many bytes, or after encoding it
+    # took this many seconds; None to not limit on either.
+    bulk_slice_bytes = 64 * 1024
+    bulk_slice_time = 0.002
+    # Callback classes with a receive_batch(source, packets) callback, or
+    # receive_batch_PACKET_X(source, messages) for a packet type, get the
+    # packets in batches: those already received, up to batch_max_size, and
+    # those that arrive within batch_max_delay seconds after the first. The
+    # messages are dicts, or named tuples with receive_messages.
+    batch_max_size = 100
+    batch_max_delay = 0
+    # At most this many packets per connection wait to be handled. Once
+    # reached, reading (and framing what is already read) pauses till half
+    # of them are handled. This way a connection whose packets are not
+    # handled fast enough, for example as its PacketStream is full, doesn't
+    # buffer more and more.
+    queue_max_size = 10000
 
     def __init__(self, callback_class):
         super().__init__()
 
-        self._callback = callback_class
+        self._set_callback(callback_class)
 
         self._data = b""
         self.new_connection = True
+        self._rejected = False
 
         self._queue = asyncio.Queue()
+        self._queued_bytes = 0
+        self._queue_full = False
+        self._queued_waiter = None
         self._can_write = asyncio.Event()
         self._can_write.set()
+        self._write_paused_at = None
+        self._control_waiting = 0
 
         self._pause_task = None
+        self._processing = True
         self.task = asyncio.create_task(self._guard_process_queue())
 
     def connection_made(self, transport):
@@ -50,16 +150,74 @@ class TCPProtocol(asyncio.Protocol):
         socket_addr = transport.get_extra_info("peername")
         self.source = Source(self, socket_addr, socket_addr[0], socket_addr[1])
 
+        if self.metrics is not None:
+            self.metrics.connection_made(self)
+
+        # With the proxy protocol, the real source is only known once the
+        # first data arrives.
+        if self.rate_limiter is not None and not self.proxy_protocol:
+            if not self.rate_limiter.connection_made(self):
+                # The callback class never hears of a rejected connection.
+                self._rejected = True
+                self.transport.close()
+                return
+        if self.memory_budget is not None:
+            self.memory_budget.connection_made(self)
+
         if hasattr(self._callback, "connected"):
             self._callback.connected(self.source)
 
     def connection_lost(self, exc):
-        if hasattr(self._callback, "disconnect"):
+        if self.metrics is not None:
+            self.metrics.connection_lost(self)
+        if self.rate_limiter is not None:
+            self.rate_limiter.connection_lost(self)
+        if self.memory_budget is not None:
+            self.memory_budget.connection_lost(self)
+
+        if hasattr(self._callback, "disconnect") and not self._rejected:
             self._callback.disconnect(self.source)
         self.task.cancel()
         if self._pause_task:
             self._pause_task.cancel()
 
+    def packets(self, stream=None, max_size=1000):
+        """Return a PacketStream with the packets of this connection; these no longer go to the callback class."""
+        # Pass the same stream to several connections to merge their packets.
+        if stream is None:
+            stream = PacketStream(max_size)
+        stream.attach(self)
+        self._set_callback(stream)
+        return stream
+
+    def _set_callback(self, callback_class):
+        self._callback = callback_class
+
+        # What the callback class wants is looked up once, instead of for
+        # every packet.
+        self._receive_raw = getattr(callback_class, "receive_raw", None)
+        # Callback classes that set "receive_messages" get the decoded packet
+        # as the named tuple receive_* returns, as receive_X(source, msg);
+        # this saves creating a dict and unpacking it as keyword arguments
+        # for every packet.
+        self._messages = getattr(callback_class, "receive_messages", False)
+
+        offload = getattr(callback_class, "offload", None) or {}
+        self._offloaded = {packet_type: how for packet_type, how in offload.items() if how != Offload.INLINE}
+
+        # The packet types that are handled in batches.
+        self._receive_batch = getattr(callback_class, "receive_batch", None)
+        if self.PacketType is None:
+            self._batched = frozenset()
+        elif self._receive_batch is not None:
+            self._batched = frozenset(self.PacketType)
+        else:
+            self._batched = frozenset(
+                packet_type
+                for packet_type in self.PacketType
+                if hasattr(callback_class, f"receive_batch_{packet_type.name}")
+            )
+
     async def _check_closed(self):
         while True:
             # When a peer is stalling, it can also mean the connection is
@@ -81,11 +239,13 @@ class TCPProtocol(asyncio.Protocol):
 
     def pause_writing(self):
         self._can_write.clear()
+        self._write_paused_at = time.monotonic()
         self._pause_task = asyncio.create_task(self._check_closed())
 
     def resume_writing(self):
         self._pause_task.cancel()
         self._can_write.set()
+        self._write_paused_at = None
 
     def _detect_source_ip_port(self, data):
         if not self.proxy_protocol:
@@ -124,11 +284,31 @@ class TCPProtocol(asyncio.Protocol):
             data = self._detect_source_ip_port(data)
             self.new_connection = False
 
+            if self.rate_limiter is not None and self.proxy_protocol:
+                if not self.rate_limiter.connection_made(self):
+                    self.transport.close()
+                    return
+
         data = memoryview(self._data + data)
         self._data = self.receive_data(self._queue, data)
 
+        if self.memory_budget is not None:
+            self.memory_budget.data_received(self)
+
+    def reading_resumed(self):
+        self.receive_buffered()
+
+    def receive_buffered(self):
+        """Frame the data that was received, but left unframed while reading was paused."""
+        self._data = self.receive_data(self._queue, memoryview(self._data))
+
     def receive_data(self, queue, data):
         while len(data) > 2:
+            # Once reading is paused (by the rate limiter, a full queue, ..),
+            # the rest waits till it resumes.
+            if self._reading_paused:
+                break
+
             length, _ = read_uint16(data)
             if length < 2:
                 log.info(
@@ -143,13 +323,43 @@ class TCPProtocol(asyncio.Protocol):
             if len(data) < length:
                 break
 
+            if self.rate_limiter is not None:
+                # Limits are per packet type, which is peeked at before the
+                # packet is decoded.
+                packet_type = data[2] if length > 2 else None
+                if not self.rate_limiter.packet_received(self, packet_type, length):
+                    if self.transport.is_closing():
+                        return b""
+                    data = data[length:]
+                    continue
+
+            if self.capture is not None:
+                self.capture.packet_received(self, data[0:length])
+
             queue.put_nowait(data[0:length])
+            self._queued_bytes += length
             data = data[length:]
 
+            if not self._queue_full and queue.qsize() >= self.queue_max_size:
+                self._queue_full = True
+                self.pause_reading()
+
+        # A batch might be waiting for more packets.
+        if self._queued_waiter is not None and not queue.empty():
+            _wake(self._queued_waiter)
+
         return data.tobytes()
 
+    def _stop_processing(self):
+        # Stop handling the queued packets, for example as the connection is
+        # handed over to something else. When called from a callback, that
+        # callback still runs to the end.
+        self._processing = False
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
+
     async def _guard_process_queue(self):
-        while True:
+        while self._processing:
             try:
                 await self._process_queue()
             except asyncio.CancelledError:
@@ -166,20 +376,147 @@ class TCPProtocol(asyncio.Protocol):
                 self.transport.abort()
                 return
 
+    def _taken(self, data):
+        self._queued_bytes -= len(data)
+        if self._queue_full and self._queue.qsize() <= self.queue_max_size // 2:
+            self._queue_full = False
+            self.resume_reading()
+
     async def _process_queue(self):
         data = await self._queue.get()
+        self._taken(data)
 
-        if hasattr(self._callback, "receive_raw"):
-            if await self._callback.receive_raw(self.source, data):
-                return
+        if self._receive_raw is not None and await self._receive_raw(self.source, data):
+            return
+        packet_type, message = self._decode(data)
+
+        if packet_type in self._batched:
+            await self._process_batch(packet_type, message)
+            return
+
+        # Most packets take this path, so await the callback directly.
+        handler, callback = self._handler(packet_type, message)
+        if self.metrics is None and self.watchdog is None:
+            await handler
+        else:
+            await self._handle(handler, packet_type, callback)
 
+    def _decode(self, data):
         try:
-            packet_type, kwargs = self.receive_packet(self.source, data)
+            return self.receive_packet(self.source, data)
         except PacketInvalid as err:
             log.info("Dropping invalid packet from %s:%d: %r", self.source.ip, self.source.port, err)
+            if self.metrics is not None:
+                self.metrics.packet_invalid(self)
             raise SocketClosed
 
-        await getattr(self._callback, f"receive_{packet_type.name}")(self.source, **kwargs)
+    def _handler(self, packet_type, message):
+        # Return the coroutine that handles the packet, and the callback it
+        # calls.
+        callback = getattr(self._callback, f"receive_{packet_type.name}")
+
+        offload = self._offloaded.get(packet_type) if self._offloaded else None
+        if offload is not None:
+            return self._offload(packet_type, offload, callback, message), callback
+        if self._messages:
+            return callback(self.source, message), callback
+        return callback(self.source, **message_kwargs(message)), callback
+
+    async def _handle(self, handler, packet_type, callback):
+        if self.metrics is None and self.watchdog is None:
+            await handler
+            return
+
+        start = time.perf_counter()
+        try:
+            await handler
+        finally:
+            duration = time.perf_counter() - start
+            if self.metrics is not None:
+                self.metrics.handler_finished(self, packet_type, duration)
+            if self.watchdog is not None:
+                self.watchdog.handler_finished(self.source, packet_type, callback, duration)
+
+    async def _wait_queued(self, deadline):
+        # Wait till a packet is queued, or till the deadline. This is not
+        # done with wait_for(queue.get()), as a timeout can then lose a
+        # packet that was just taken from the queue (bpo-42130).
+        loop = asyncio.get_running_loop()
+        self._queued_waiter = waiter = loop.create_future()
+        timer = loop.call_at(deadline, _wake, waiter)
+        try:
+            await waiter
+        finally:
+            timer.cancel()
+            self._queued_waiter = None
+
+    async def _process_batch(self, packet_type, message):
+        # The callback class handles (this type of) packets in batches. Add
+        # the packets that are already received, and, with batch_max_delay,
+        # those that arrive shortly after.
+        packets = [Packet(self.source, packet_type, message)]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_max_delay
+
+        try:
+            while len(packets) < self.batch_max_size:
+                if self._queue.empty():
+                    if loop.time() >= deadline:
+                        break
+                    await self._wait_queued(deadline)
+                    if self._queue.empty():
+                        break
+
+                data = self._queue.get_nowait()
+                self._taken(data)
+
+                if self._receive_raw is not None and await self._receive_raw(self.source, data):
+                    continue
+                packets.append(Packet(self.source, *self._decode(data)))
+        except SocketClosed:
+            # Like without batches, the packets before an invalid one are
+            # still handled.
+            await self._dispatch_batch(packets)
+            raise
+
+        await self._dispatch_batch(packets)
+
+    async def _dispatch_batch(self, packets):
+        # Like single packets, batches get the decoded packets as named
+        # tuples if the callback class sets receive_messages; otherwise as
+        # dicts.
+        if self._receive_batch is not None:
+            if not self._messages:
+                packets = [Packet(packet.source, packet.type, message_kwargs(packet.message)) for packet in packets]
+            # Timings are accounted to the type of the first packet.
+            await self._handle(self._receive_batch(self.source, packets), packets[0].type, self._receive_batch)
+            return
+
+        # Consecutive packets of a type that has a batch callback go to it
+        # together; the others go to their own callback, in order.
+        for packet_type, group in itertools.groupby(packets, key=lambda packet: packet.type):
+            if packet_type not in self._batched:
+                for packet in group:
+                    handler, callback = self._handler(packet_type, packet.message)
+                    await self._handle(handler, packet_type, callback)
+                continue
+
+            messages = [packet.message for packet in group]
+            if not self._messages:
+                messages = [message_kwargs(message) for message in messages]
+            callback = getattr(self._callback, f"receive_batch_{packet_type.name}")
+            await self._handle(callback(self.source, messages), packet_type, callback)
+
+    async def _offload(self, packet_type, offload, callback, message):
+        offloader = self.offloader if self.offloader is not None else default_offloader()
+        if self._messages:
+            result = await offloader.run(self, offload, callback, self.source, message)
+        else:
+            result = await offloader.run(self, offload, callback, self.source, **message_kwargs(message))
+
+        done = getattr(self._callback, f"done_{packet_type.name}", None)
+        if done is not None:
+            await done(self.source, result)
 
     def receive_packet(self, source, data):
         # Check length of packet
@@ -199,11 +536,53 @@ class TCPProtocol(asyncio.Protocol):
             raise PacketInvalidType(packet_type)
 
         # Process this packet
-        kwargs = func(source, data)
-        return packet_type, kwargs
+        message = func(source, data)
+
+        if self.metrics is not None:
+            self.metrics.packet_received(self, packet_type, length)
+
+        return packet_type, message
+
+    async def send_packet(self, data, priority=Priority.CONTROL):
+        length = await self._timed_write(data, priority, "send_packet")
+
+        if self.metrics is not None:
+            self.metrics.packet_sent(self, data)
+        if self.capture is not None:
+            self.capture.packet_sent(self, data)
+
+        return length
+
+    async def _wait_can_write(self, priority):
+        if priority == Priority.BULK:
+            await self._can_write.wait()
 
-    async def send_packet(self, data):
-        await self._can_write.wait()
+            # Control packets waiting for the same resume go first.
+            while self._control_waiting:
+                await asyncio.sleep(0)
+                await self._can_write.wait()
+            return
+
+        if self._can_write.is_set() or self.transport.get_write_buffer_size() < self.control_buffer_limit:
+            return
+
+        self._control_waiting += 1
+        try:
+            await self._can_write.wait()
+        finally:
+            self._control_waiting -= 1
+
+    async def _timed_write(self, data, priority, method):
+        if self.watchdog is None:
+            return await self._write(data, priority)
+
+        start = time.perf_counter()
+        length = await self._write(data, priority)
+        self.watchdog.send_finished(self.source, data, time.perf_counter() - start, method)
+        return length
+
+    async def _write(self, data, priority=Priority.CONTROL):
+        await self._wait_can_write(priority)
 
         # When a socket is closed on the other side, and due to the nature of
         # how asyncio is doing writes, we never receive an exception. So,
@@ -219,3 +598,56 @@ class TCPProtocol(asyncio.Protocol):
             await res
 
         return len(data)
+
+    async def send_packets(self, packets, priority=Priority.CONTROL):
+        # Send a list of packets that are already prepared with
+        # write_presend(), for example because they came from a PacketCache.
+        # All packets are handed to the transport in a single write, which
+        # is a lot cheaper than calling send_packet() for each of them.
+        return await self._send_joined(packets, priority, "send_packets")
+
+    async def _send_joined(self, packets, priority, method):
+        data = b"".join(packets)
+        if not data:
+            return 0
+
+        length = await self._timed_write(data, priority, method)
+
+        if self.metrics is not None:
+            for packet in packets:
+                self.metrics.packet_sent(self, packet)
+        if self.capture is not None:
+            for packet in packets:
+                self.capture.packet_sent(self, packet)
+
+        return length
+
+    async def send_bulk(self, packets):
+        # Send an iterable of packets that are prepared with write_presend().
+        # It is consumed one slice at a time, so it can (and should) be a
+        # generator that encodes the packets as it goes.
+        length = 0
+        slice_packets = []
+        slice_bytes = 0
+        slice_start = time.perf_counter()
+
+        for packet in packets:
+            slice_packets.append(packet)
+            slice_bytes += len(packet)
+
+            if (self.bulk_slice_bytes is not None and slice_bytes >= self.bulk_slice_bytes) or (
+                self.bulk_slice_time is not None and time.perf_counter() - slice_start >= self.bulk_slice_time
+            ):
+                length += await self._send_joined(slice_packets, Priority.BULK, "send_bulk")
+                # Unless the peer is not keeping up, this returns without
+                # yielding; so give the other tasks their turn here.
+                await asyncio.sleep(0)
+
+                slice_packets = []
+                slice_bytes = 0
+                slice_start = time.perf_counter()
+
+        if slice_packets:
+            length += await self._send_joined(slice_packets, Priority.BULK, "send_bulk")
+
+        return length
@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+import time
+
+from .bandwidth import (
+    BandwidthScheduler,
+    TokenBucket,
+)
+
+
+def test_token_bucket():
+    bucket = TokenBucket(100)
+    assert bucket.delay(100) == 0
+
+    bucket.consume(150)
+    assert bucket.delay(10) == pytest.approx(0.6, abs=0.01)
+
+    # Packets bigger than the burst are allowed once the bucket is full.
+    bucket.refill(bucket._last + 10)
+    assert bucket.tokens == 100
+    assert bucket.delay(1000) == 0
+
+
+@pytest.mark.asyncio
+async def test_bandwidth_scheduler_fairness():
+    scheduler = BandwidthScheduler(rate=1000000, burst=300, quantum=100)
+    order = []
+
+    async def transfer(key, size, count):
+        scheduler.open(key)
+        try:
+            for _ in range(count):
+                await scheduler.acquire(key, size)
+                order.append(key)
+                await asyncio.sleep(0)
+        finally:
+            scheduler.close(key)
+
+    # Both transfers should get an equal share of bytes, so "small" should
+    # be allowed three packets for every packet "big" is allowed.
+    await asyncio.gather(transfer("small", 100, 30), transfer("big", 300, 10))
+    assert order.count("small") == 30
+    assert order.count("big") == 10
+    assert order[0:20].count("big") in (4, 5, 6)
+
+
+@pytest.mark.asyncio
+async def test_bandwidth_scheduler_rate():
+    scheduler = BandwidthScheduler(rate=100000)
+    scheduler.open("a", source="source")
+
+    start = time.monotonic()
+    # The first 100000 bytes are a burst; the next 10000 should take 0.1s.
+    for _ in range(11):
+        await scheduler.acquire("a", 10000)
+    assert time.monotonic() - start >= 0.09
+
+    stats = scheduler.stats()
+    assert stats[0]["source"] == "source"
+    assert stats[0]["bytes_sent"] == 110000
+
+    scheduler.close("a")
+    assert scheduler.stats() == []
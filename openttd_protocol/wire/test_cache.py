@@ -0,0 +1,58 @@
+from .cache import PacketCache
+
+
+def test_packet_cache():
+    cache = PacketCache(max_entries=2)
+
+    assert cache.get("a") is None
+    cache.put("a", b"\x03\x00\x01")
+    cache.put("b", b"\x03\x00\x02")
+    assert cache.get("a") == b"\x03\x00\x01"
+
+    # "b" is now the least recently used, so it should be evicted.
+    cache.put("c", b"\x03\x00\x03")
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == b"\x03\x00\x01"
+    assert cache.get("c") == b"\x03\x00\x03"
+
+    assert cache.hits == 3
+    assert cache.misses == 2
+
+    cache.discard("a")
+    assert cache.get("a") is None
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_packet_cache_max_bytes():
+    cache = PacketCache(max_bytes=8)
+
+    cache.put("a", b"\x03\x00\x01")
+    cache.put("b", b"\x03\x00\x02")
+    assert cache.size == 6
+
+    # Too big to ever fit; should not evict anything.
+    cache.put("c", b"\x00" * 9)
+    assert cache.get("c") is None
+    assert len(cache) == 2
+
+    # Doesn't fit together with "a"; "a" is the least recently used.
+    cache.put("d", b"\x04\x00\x04\x00")
+    assert cache.get("a") is None
+    assert cache.get("b") == b"\x03\x00\x02"
+    assert cache.size == 7
+
+
+def test_packet_cache_generation():
+    cache = PacketCache()
+
+    generation = cache.generation
+    cache.put("a", b"\x03\x00\x01", generation=generation)
+    assert cache.get("a") == b"\x03\x00\x01"
+
+    # Entries built before a clear() are outdated, and should be ignored.
+    cache.clear()
+    cache.put("a", b"\x03\x00\x01", generation=generation)
+    assert cache.get("a") is None
+    assert cache.generation == generation + 1
@@ -0,0 +1,59 @@
+import pytest
+
+from .capture import (
+    Direction,
+    PacketCapture,
+    read_capture,
+)
+from .testing import (
+    FakeTransport,
+    OpenTTDProtocolTest,
+)
+
+
+@pytest.mark.asyncio
+async def test_capture(tmp_path):
+    filename = str(tmp_path / "capture.bin")
+    capture = PacketCapture(filename)
+
+    one = OpenTTDProtocolTest(None)
+    one.task.cancel()
+    one.capture = capture
+    one.connection_made(FakeTransport())
+    two = OpenTTDProtocolTest(None)
+    two.task.cancel()
+    two.capture = capture
+    two.connection_made(FakeTransport())
+
+    # One and a half packet; only complete packets are captured.
+    one.data_received(b"\x03\x00\x00\x04\x00")
+    two.data_received(b"\x03\x00\x00")
+    one.data_received(b"\x00\x01")
+    await one.send_packet(b"\x03\x00\x00")
+    capture.close()
+
+    records = [
+        (connection_id, direction, bytes(packet)) for _, connection_id, direction, packet in read_capture(filename)
+    ]
+    assert records == [
+        (1, Direction.RECEIVED, b"\x03\x00\x00"),
+        (2, Direction.RECEIVED, b"\x03\x00\x00"),
+        (1, Direction.RECEIVED, b"\x04\x00\x00\x01"),
+        (1, Direction.SENT, b"\x03\x00\x00"),
+    ]
+
+
+def test_capture_rotate(tmp_path):
+    filename = str(tmp_path / "capture.bin")
+    capture = PacketCapture(filename, max_bytes=50, backups=2)
+    protocol = OpenTTDProtocolTest.__new__(OpenTTDProtocolTest)
+
+    # Every record is 21 + 3 bytes; a file rotates after two records.
+    for _ in range(7):
+        capture.packet_received(protocol, b"\x03\x00\x00")
+    capture.close()
+
+    assert len(list(read_capture(filename))) == 1
+    assert len(list(read_capture(f"{filename}.1"))) == 2
+    assert len(list(read_capture(f"{filename}.2"))) == 2
+    assert not (tmp_path / "capture.bin.3").exists()
@@ -0,0 +1,68 @@
+import pytest
+
+from .memory import MemoryBudget
+from .testing import (
+    FakeTransport,
+    OpenTTDProtocolTest,
+)
+
+
+def _connect(memory_budget, write_buffer_size=0):
+    protocol = OpenTTDProtocolTest(None)
+    protocol.task.cancel()
+    protocol.memory_budget = memory_budget
+    protocol.connection_made(FakeTransport(write_buffer_size=write_buffer_size))
+    return protocol
+
+
+@pytest.mark.asyncio
+async def test_memory_budget_connection():
+    memory_budget = MemoryBudget(connection_budget=10)
+    protocol = _connect(memory_budget)
+
+    # Two queued packets and half a packet; 9 bytes.
+    protocol.data_received(b"\x03\x00\x00\x03\x00\x00\x05\x00\x00")
+    assert memory_budget.usage(protocol) == 9
+    assert not protocol.transport.aborted
+
+    protocol.data_received(b"\x00\x00")
+    assert protocol.transport.aborted
+    assert memory_budget.stats()["evicted"] == {"connection_budget": 1}
+
+
+@pytest.mark.asyncio
+async def test_memory_budget_global():
+    memory_budget = MemoryBudget(global_budget=250)
+    small = _connect(memory_budget, write_buffer_size=100)
+    large = _connect(memory_budget, write_buffer_size=200)
+    idle = _connect(memory_budget)
+
+    memory_budget.check()
+    assert large.transport.aborted
+    assert not small.transport.aborted
+    assert not idle.transport.aborted
+    assert memory_budget.stats() == {"connections": 3, "usage": 100, "evicted": {"global_budget": 1}}
+
+    memory_budget = MemoryBudget(global_budget=250, evict="oldest")
+    old = _connect(memory_budget, write_buffer_size=100)
+    new = _connect(memory_budget, write_buffer_size=200)
+
+    memory_budget.check()
+    assert old.transport.aborted
+    assert not new.transport.aborted
+
+
+@pytest.mark.asyncio
+async def test_memory_budget_write_paused():
+    memory_budget = MemoryBudget(write_paused_timeout=0)
+    protocol = _connect(memory_budget)
+
+    memory_budget.check()
+    assert not protocol.transport.aborted
+
+    protocol.pause_writing()
+    memory_budget.check()
+    assert protocol.transport.aborted
+    assert memory_budget.stats()["evicted"] == {"write_paused": 1}
+
+    protocol._pause_task.cancel()
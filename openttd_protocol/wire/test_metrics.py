@@ -0,0 +1,65 @@
+import pytest
+
+from .metrics import (
+    Histogram,
+    Metrics,
+)
+from .source import Source
+from .testing import (
+    FakeTransport,
+    OpenTTDProtocolTest,
+)
+
+
+def test_histogram():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    assert histogram.cumulative() == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(2.65)
+
+
+@pytest.mark.asyncio
+async def test_metrics():
+    seen_packet = [False]
+
+    class Callback:
+        async def receive_PACKET_ONE(source):
+            seen_packet[0] = True
+
+    metrics = Metrics()
+
+    test = OpenTTDProtocolTest(Callback)
+    test.task.cancel()
+    test.metrics = metrics
+    test.connection_made(FakeTransport())
+    test.source = Source(test, None, "127.0.0.1", 12345)
+
+    test._queue.put_nowait(memoryview(b"\x03\x00\x00"))
+    test._queue.put_nowait(memoryview(b"\x03\x00\x00"))
+    await test._process_queue()
+    assert seen_packet[0] is True
+
+    await test.send_packet(b"\x03\x00\x01")
+    await test.send_packets([b"\x03\x00\x01", b"\x04\x00\x00\x00"])
+
+    result = metrics.as_dict()["OpenTTDProtocolTest"]
+    assert result["connections"] == {"open": 1, "write_paused": 0, "queued": 1, "queued_packets": 1}
+    assert result["packets"]["PACKET_ONE"]["packets_received"] == 1
+    assert result["packets"]["PACKET_ONE"]["bytes_received"] == 3
+    assert result["packets"]["PACKET_ONE"]["handler_latency"]["count"] == 1
+    assert result["packets"]["PACKET_TWO"]["packets_sent"] == 2
+    assert result["packets"]["PACKET_TWO"]["bytes_sent"] == 6
+    assert result["packets"]["PACKET_ONE"]["packets_sent"] == 1
+
+    prometheus = metrics.as_prometheus()
+    assert 'openttd_protocol_packets_received_total{protocol="OpenTTDProtocolTest",packet_type="PACKET_ONE"} 1' in (
+        prometheus
+    )
+    assert 'openttd_protocol_connections_open{protocol="OpenTTDProtocolTest"} 1' in prometheus
+    assert 'le="+Inf"} 1' in prometheus
+
+    metrics.connection_lost(test)
+    assert metrics.as_dict()["OpenTTDProtocolTest"]["connections"] == {}
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import pytest
+import threading
+
+from .offload import (
+    Offload,
+    Offloader,
+)
+from .read import read_uint8
+from .testing import (
+    FakeTransport,
+    OpenTTDProtocolTest,
+    OpenTTDTestType,
+)
+
+
+class OffloadProtocolTest(OpenTTDProtocolTest):
+    @staticmethod
+    def receive_PACKET_ONE(source, data):
+        value, _ = read_uint8(data)
+        return {"value": value}
+
+
+def _connect(callback, offloader):
+    protocol = OffloadProtocolTest(callback)
+    protocol.offloader = offloader
+    protocol.connection_made(FakeTransport())
+    return protocol
+
+
+@pytest.mark.asyncio
+async def test_offload_thread():
+    loop_thread = threading.current_thread()
+    release = threading.Event()
+    seen = []
+
+    class Callback:
+        offload = {OpenTTDTestType.PACKET_ONE: Offload.THREAD}
+
+        def receive_PACKET_ONE(self, source, value):
+            assert threading.current_thread() is not loop_thread
+            # Only the first packet blocks, till the other connection has
+            # been handled.
+            if value == 1:
+                release.wait(5)
+            return value * 10
+
+        async def done_PACKET_ONE(self, source, result):
+            seen.append(result)
+
+        async def receive_PACKET_TWO(self, source, value):
+            seen.append(value)
+            release.set()
+
+    offloader = Offloader(thread_workers=2)
+    callback = Callback()
+    one = _connect(callback, offloader)
+    two = _connect(callback, offloader)
+
+    # Packets of a connection are handled in order; the blocking callback of
+    # "one" doesn't stop "two".
+    one.data_received(b"\x04\x00\x00\x01\x04\x00\x01\x02\x04\x00\x00\x03")
+    two.data_received(b"\x04\x00\x01\x04")
+
+    for _ in range(100):
+        if len(seen) == 4:
+            break
+        await asyncio.sleep(0.01)
+
+    assert seen == [4, 10, 2, 30]
+
+    one.connection_lost(None)
+    two.connection_lost(None)
+    offloader.shutdown()
+
+
+class ProcessCallback:
+    offload = {OpenTTDTestType.PACKET_ONE: Offload.PROCESS}
+
+    @staticmethod
+    def receive_PACKET_ONE(source, value):
+        return (os.getpid(), str(source.ip), value)
+
+    def __init__(self):
+        self.results = []
+
+    async def done_PACKET_ONE(self, source, result):
+        self.results.append(result)
+
+
+@pytest.mark.asyncio
+async def test_offload_process():
+    offloader = Offloader(process_workers=1)
+    callback = ProcessCallback()
+    protocol = _connect(callback, offloader)
+
+    protocol.data_received(b"\x04\x00\x00\x07")
+
+    for _ in range(500):
+        if callback.results:
+            break
+        await asyncio.sleep(0.01)
+
+    pid, ip, value = callback.results[0]
+    assert pid != os.getpid()
+    assert (ip, value) == ("127.0.0.1", 7)
+
+    protocol.connection_lost(None)
+    offloader.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_offload_resolved_once():
+    seen = []
+
+    class Callback:
+        lookups = 0
+
+        @property
+        def offload(self):
+            Callback.lookups += 1
+            return {OpenTTDTestType.PACKET_ONE: Offload.INLINE}
+
+        async def receive_PACKET_ONE(self, source, value):
+            seen.append(value)
+
+    protocol = _connect(Callback(), Offloader())
+    protocol.data_received(b"\x04\x00\x00\x01" * 3)
+
+    for _ in range(100):
+        if len(seen) == 3:
+            break
+        await asyncio.sleep(0.01)
+
+    # Offload.INLINE runs on the event loop, as if not offloaded; and the
+    # callback class is asked only once what to offload.
+    assert seen == [1, 1, 1]
+    assert Callback.lookups == 1
+
+    protocol.connection_lost(None)
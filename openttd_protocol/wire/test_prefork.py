@@ -0,0 +1,88 @@
+import asyncio
+import os
+import pytest
+import signal
+import socket
+import time
+
+from .prefork import (
+    PreforkServer,
+    _StatsReader,
+    _StatsWriter,
+)
+from .testing import OpenTTDProtocolTest
+
+
+class Application:
+    async def receive_PACKET_ONE(self, source):
+        await source.protocol.send_packet(b"\x03\x00\x00")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(server, condition):
+    deadline = time.monotonic() + 10
+    while not condition():
+        assert time.monotonic() < deadline
+        server.poll(0.05)
+
+
+def test_prefork_server():
+    port = _free_port()
+    server = PreforkServer(
+        OpenTTDProtocolTest, Application, "127.0.0.1", port, workers=2, stats_interval=0.05, restart_delay=0
+    )
+    server.start()
+
+    try:
+        _wait_for(server, lambda: len(server.stats()) == 2)
+
+        with socket.create_connection(("127.0.0.1", port)) as sock:
+            sock.sendall(b"\x03\x00\x00")
+            assert sock.recv(3) == b"\x03\x00\x00"
+
+            _wait_for(server, lambda: sum(stats["connections"] for stats in server.stats().values()) == 1)
+
+        # A worker that dies is restarted.
+        os.kill(server.stats()[0]["pid"], signal.SIGKILL)
+        _wait_for(server, lambda: server.restarts[0] == 1 and server.stats()[0]["connections_total"] == 0)
+    finally:
+        server.stop()
+
+    assert all(process is None for process in server._processes)
+
+
+@pytest.mark.asyncio
+async def test_stats_pipe_full():
+    loop = asyncio.get_running_loop()
+    receiver, sender = os.pipe()
+    reader = _StatsReader(receiver)
+    _, writer = await loop.connect_write_pipe(_StatsWriter, os.fdopen(sender, "wb"))
+
+    # A parent that doesn't read never blocks the worker; once the pipe is
+    # full, stats are dropped instead of buffered.
+    for index in range(100):
+        writer.send({"index": index, "padding": b"\x00" * 16384})
+    assert writer.transport.get_write_buffer_size() < 2 * 16384
+
+    # Every stats that was sent arrives complete; the last one is returned.
+    stats = None
+    while stats is None or writer.transport.get_write_buffer_size():
+        stats = reader.read() or stats
+        await asyncio.sleep(0)
+    stats = reader.read() or stats
+    assert 0 < stats["index"] < 99
+
+    writer.send({"index": 100})
+    await asyncio.sleep(0)
+    assert reader.read() == {"index": 100}
+
+    writer.transport.close()
+    await writer.closed
+    assert reader.read() is None
+    assert reader.eof
+    reader.close()
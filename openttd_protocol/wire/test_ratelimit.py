@@ -0,0 +1,136 @@
+import asyncio
+import pytest
+
+from .ratelimit import (
+    Action,
+    RateLimiter,
+)
+from .testing import (
+    FakeTransport,
+    OpenTTDProtocolTest,
+    OpenTTDTestType,
+)
+
+
+def _connect(rate_limiter, ip="127.0.0.1"):
+    protocol = OpenTTDProtocolTest(None)
+    protocol.task.cancel()
+    protocol.rate_limiter = rate_limiter
+    protocol.connection_made(FakeTransport(ip))
+    return protocol
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_connections():
+    rate_limiter = RateLimiter(max_connections=2, ipv4_prefix=24)
+
+    one = _connect(rate_limiter, "192.0.2.1")
+    two = _connect(rate_limiter, "192.0.2.2")
+    three = _connect(rate_limiter, "192.0.2.3")
+    other = _connect(rate_limiter, "198.51.100.1")
+    assert not one.transport.closing
+    assert not two.transport.closing
+    assert three.transport.closing
+    assert not other.transport.closing
+
+    # Once a connection is gone, there is room for a new one.
+    three.connection_lost(None)
+    one.connection_lost(None)
+    four = _connect(rate_limiter, "192.0.2.4")
+    assert not four.transport.closing
+
+    assert rate_limiter.stats() == {"sources": 2, "evictions": 0, "limited": {"connections.close": 1}}
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_packets_drop():
+    rate_limiter = RateLimiter(packet_rate=100, packet_rates={OpenTTDTestType.PACKET_TWO: (1, 2)})
+    protocol = _connect(rate_limiter)
+
+    protocol.data_received(b"\x03\x00\x01" * 3 + b"\x03\x00\x00" * 3)
+    assert protocol._queue.qsize() == 5
+    assert rate_limiter.counters[("packets", "drop")] == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_bytes_close():
+    rate_limiter = RateLimiter(byte_rate=5, action=Action.CLOSE)
+    protocol = _connect(rate_limiter)
+
+    protocol.data_received(b"\x03\x00\x00" * 3)
+    assert protocol._queue.qsize() == 1
+    assert protocol.transport.closing
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_delay():
+    rate_limiter = RateLimiter(packet_rate=50, packet_burst=1, action=Action.DELAY)
+    protocol = _connect(rate_limiter)
+
+    # The second packet is over the limit; it is accepted, but the third is
+    # not framed till the delay is over.
+    protocol.data_received(b"\x03\x00\x00" * 3)
+    assert protocol._queue.qsize() == 2
+    assert protocol._data == b"\x03\x00\x00"
+    assert not protocol.transport.reading
+
+    # Data read in the meantime waits too.
+    protocol.data_received(b"\x03\x00\x00")
+    assert protocol._queue.qsize() == 2
+
+    await asyncio.sleep(0.1)
+    assert protocol._queue.qsize() == 4
+    assert protocol._data == b""
+    assert protocol.transport.reading
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_rejected():
+    class Callback:
+        connections = []
+
+        @classmethod
+        def connected(cls, source):
+            cls.connections.append(source)
+
+        @classmethod
+        def disconnect(cls, source):
+            cls.connections.remove(source)
+
+    rate_limiter = RateLimiter(max_connections=1)
+    protocols = []
+    for _ in range(2):
+        protocol = OpenTTDProtocolTest(Callback)
+        protocol.task.cancel()
+        protocol.rate_limiter = rate_limiter
+        protocol.connection_made(FakeTransport())
+        protocols.append(protocol)
+
+    # The callback class never hears of the rejected connection.
+    assert protocols[1].transport.closing
+    assert Callback.connections == [protocols[0].source]
+
+    protocols[1].connection_lost(None)
+    assert Callback.connections == [protocols[0].source]
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_evict():
+    rate_limiter = RateLimiter(max_connections=1, max_sources=2)
+
+    one = _connect(rate_limiter, "192.0.2.1")
+    two = _connect(rate_limiter, "192.0.2.2")
+    two.connection_lost(None)
+
+    # The least recently seen source with no connections is forgotten; the
+    # one with a connection keeps its limits.
+    _connect(rate_limiter, "192.0.2.3")
+    assert rate_limiter.evictions == 1
+    assert _connect(rate_limiter, "192.0.2.1").transport.closing
+
+    # When every source has connections, none is forgotten.
+    _connect(rate_limiter, "192.0.2.4")
+    assert rate_limiter.evictions == 1
+    assert rate_limiter.stats()["sources"] == 3
+
+    one.connection_lost(None)
@@ -1,7 +1,11 @@
 import pytest
 
-from .exceptions import PacketTooShort
+from .exceptions import (
+    PacketInvalidSize,
+    PacketTooShort,
+)
 from .read import (
+    iter_packets,
     read_uint8,
     read_uint16,
     read_uint32,
@@ -53,3 +57,26 @@ def test_read_failure(proc, data):
     # Test with the indicated payload too.
     with pytest.raises(PacketTooShort):
         proc(data)
+
+
+def test_iter_packets():
+    packets = list(iter_packets(memoryview(b"\x03\x00\x01\x04\x00\x02\x05")))
+    assert [bytes(packet) for packet in packets] == [b"\x03\x00\x01", b"\x04\x00\x02\x05"]
+
+
+@pytest.mark.parametrize(
+    "data, failure",
+    [
+        (b"\x03\x00\x01\x00\x00", PacketInvalidSize),
+        (b"\x03\x00\x01\x01\x00", PacketInvalidSize),
+        (b"\x03\x00\x01\x05\x00\x02", PacketInvalidSize),
+        (b"\x03\x00\x01\x04", PacketTooShort),
+    ],
+)
+def test_iter_packets_failure(data, failure):
+    # A corrupt length raises, instead of never advancing; the packets
+    # before it are still returned.
+    packets = iter_packets(memoryview(data))
+    assert bytes(next(packets)) == b"\x03\x00\x01"
+    with pytest.raises(failure):
+        next(packets)
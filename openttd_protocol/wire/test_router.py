@@ -0,0 +1,124 @@
+import asyncio
+import pytest
+
+from .read import read_uint8
+from .router import (
+    PacketRouter,
+    UpstreamPool,
+    peek_packet_type,
+)
+from .testing import (
+    FakeTransport,
+    OpenTTDProtocolTest,
+    OpenTTDTestType,
+)
+
+
+def test_peek_packet_type():
+    assert peek_packet_type(memoryview(b"\x04\x00\x01\x02")) == 1
+
+
+@pytest.mark.asyncio
+async def test_packet_router():
+    loop = asyncio.get_running_loop()
+    seen_upstream = []
+    seen_local = []
+
+    class Upstream:
+        async def receive_PACKET_TWO(self, source, value):
+            seen_upstream.append((str(source.ip), value))
+            # Answer with the value plus one, which should reach the client.
+            await source.protocol.send_PACKET_TWO(value + 1)
+
+    class Application:
+        async def receive_PACKET_ONE(self, source):
+            seen_local.append(True)
+
+    class UpstreamProtocol(OpenTTDProtocolTest):
+        proxy_protocol = True
+
+    upstream_server = await loop.create_server(lambda: UpstreamProtocol(Upstream()), "127.0.0.1", 0)
+    upstream_address = ("127.0.0.1", upstream_server.sockets[0].getsockname()[1])
+
+    def route(source, packet_type, data):
+        if packet_type == OpenTTDTestType.PACKET_TWO.value:
+            return upstream_address
+        return None
+
+    router = PacketRouter(Application(), route, UpstreamPool(idle=1))
+    server = await loop.create_server(lambda: OpenTTDProtocolTest(router), "127.0.0.1", 0)
+
+    reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[0:2])
+    writer.write(b"\x03\x00\x00")
+    writer.write(b"\x04\x00\x01\x05")
+    assert await asyncio.wait_for(reader.readexactly(4), 5) == b"\x04\x00\x01\x06"
+
+    assert seen_local == [True]
+    assert seen_upstream == [("127.0.0.1", 5)]
+
+    writer.close()
+    await writer.wait_closed()
+    server.close()
+    await server.wait_closed()
+    upstream_server.close()
+    await upstream_server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_packet_router_default():
+    loop = asyncio.get_running_loop()
+    seen_upstream = []
+
+    class Upstream:
+        async def receive_PACKET_TWO(self, source, value):
+            seen_upstream.append(value)
+
+    class UpstreamProtocol(OpenTTDProtocolTest):
+        proxy_protocol = True
+
+    upstream_server = await loop.create_server(lambda: UpstreamProtocol(Upstream()), "127.0.0.1", 0)
+    upstream_address = ("127.0.0.1", upstream_server.sockets[0].getsockname()[1])
+
+    def route(source, packet_type, data):
+        # Expects a second byte, which isn't there.
+        read_uint8(data[4:])
+        return None
+
+    # A packet that is too short to route goes to the default upstream.
+    router = PacketRouter(None, route, UpstreamPool(), default=upstream_address)
+    server = await loop.create_server(lambda: OpenTTDProtocolTest(router), "127.0.0.1", 0)
+
+    reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[0:2])
+    writer.write(b"\x04\x00\x01\x05")
+    for _ in range(100):
+        if seen_upstream:
+            break
+        await asyncio.sleep(0.01)
+
+    assert seen_upstream == [5]
+
+    writer.close()
+    await writer.wait_closed()
+    server.close()
+    await server.wait_closed()
+    upstream_server.close()
+    await upstream_server.wait_closed()
+
+
+@pytest.mark.parametrize("error", [ConnectionRefusedError(), asyncio.TimeoutError()])
+@pytest.mark.asyncio
+async def test_packet_router_upstream_failed(error):
+    class FailingPool(UpstreamPool):
+        async def _connect(self, address):
+            raise error
+
+    router = PacketRouter(None, lambda source, packet_type, data: ("127.0.0.1", 1), FailingPool())
+    protocol = OpenTTDProtocolTest(router)
+    protocol.task.cancel()
+    protocol.connection_made(FakeTransport())
+
+    # Without upstream the connection is closed, instead of failing with an
+    # internal error and staying connected.
+    protocol.data_received(b"\x04\x00\x01\x05")
+    await protocol._process_queue()
+    assert protocol.transport.closing
@@ -0,0 +1,42 @@
+import os
+
+from .snapshot import (
+    SnapshotPublisher,
+    SnapshotReader,
+)
+
+
+def test_snapshot():
+    name = f"openttd-protocol-test-{os.getpid()}"
+
+    reader = SnapshotReader(name)
+    assert reader.get("one") is None
+
+    publisher = SnapshotPublisher(name)
+    try:
+        publisher.publish({"one": [b"\x03\x00\x01", b"\x04\x00\x02\x05"], "two": []})
+
+        view = reader.get("one")
+        assert bytes(view) == b"\x03\x00\x01\x04\x00\x02\x05"
+        assert bytes(reader.get("two")) == b""
+        assert reader.get("three") is None
+        assert reader.generation == 1
+
+        # A new generation is picked up on the next lookup, while the view
+        # on the old generation stays valid.
+        publisher.publish({"one": [b"\x03\x00\x03"]})
+        assert bytes(reader.get("one")) == b"\x03\x00\x03"
+        assert reader.get("two") is None
+        assert reader.generation == 2
+        assert bytes(view) == b"\x03\x00\x01\x04\x00\x02\x05"
+        assert len(reader._retired) == 1
+
+        # Once the old view is gone, old generations are closed on the next
+        # switch.
+        del view
+        publisher.publish({"one": [b"\x03\x00\x04"]})
+        assert bytes(reader.get("one")) == b"\x03\x00\x04"
+        assert len(reader._retired) == 0
+    finally:
+        reader.close()
+        publisher.close()
@@ -0,0 +1,33 @@
+import ipaddress
+import pytest
+
+from .source import Source
+
+
+@pytest.mark.parametrize(
+    "ip, result",
+    [
+        ("127.0.0.1", ipaddress.IPv4Address("127.0.0.1")),
+        ("::1", ipaddress.IPv6Address("::1")),
+        ("::ffff:127.0.0.1", ipaddress.IPv4Address("127.0.0.1")),
+        (ipaddress.IPv6Address("::ffff:127.0.0.1"), ipaddress.IPv4Address("127.0.0.1")),
+    ],
+)
+def test_source_ip(ip, result):
+    source = Source(None, None, ip, 12345)
+    assert source.ip == result
+    assert type(source.ip) is type(result)
+    assert source.port == 12345
+
+
+def test_source_slots():
+    source = Source(None, None, "127.0.0.1", 12345)
+    with pytest.raises(AttributeError):
+        source.something = True
+
+
+@pytest.mark.parametrize("ip", ["127.0.0.256", "not-an-ip", ""])
+def test_source_ip_invalid(ip):
+    # Also when the ip is not used, a malformed one is rejected.
+    with pytest.raises(ValueError):
+        Source(None, None, ip, 12345)
@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+
+from .stream import PacketStream
+from .testing import (
+    FakeTransport,
+    OpenTTDProtocolTest,
+    OpenTTDTestType,
+)
+
+
+def _connect(port=12345):
+    protocol = OpenTTDProtocolTest(None)
+    protocol.connection_made(FakeTransport(port=port))
+    return protocol
+
+
+@pytest.mark.asyncio
+async def test_stream_backpressure():
+    protocol = _connect()
+    packets = protocol.packets(max_size=2)
+
+    protocol.data_received(b"\x04\x00\x01\x01\x04\x00\x01\x02\x04\x00\x01\x03\x04\x00\x01\x04")
+    await asyncio.sleep(0)
+    # The stream is full, so the connection stops reading.
+    assert not protocol.transport.reading
+
+    packet = await packets.__anext__()
+    assert packet.source is protocol.source
+    assert packet.type == OpenTTDTestType.PACKET_TWO
+    assert packet.message == {"value": 1}
+    await packets.__anext__()
+    await asyncio.sleep(0)
+    assert protocol.transport.reading
+
+    protocol.connection_lost(None)
+    assert [packet.message["value"] async for packet in packets] == [3, 4]
+
+
+@pytest.mark.asyncio
+async def test_stream_merge_batches():
+    stream = PacketStream()
+    one = _connect(1)
+    two = _connect(2)
+    one.packets(stream)
+    two.packets(stream)
+
+    one.data_received(b"\x04\x00\x01\x01\x04\x00\x01\x02")
+    two.data_received(b"\x04\x00\x01\x03")
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    batch = await stream.get_batch()
+    assert sorted((packet.source.port, packet.message["value"]) for packet in batch) == [(1, 1), (1, 2), (2, 3)]
+
+    # The stream ends once all connections are closed.
+    one.connection_lost(None)
+    two.connection_lost(None)
+    assert [batch async for batch in stream.batches()] == []
+
+
+@pytest.mark.asyncio
+async def test_stream_bounded():
+    protocol = _connect()
+    protocol.queue_max_size = 4
+    packets = protocol.packets(max_size=2)
+
+    # Everything is read at once, but only framed as far as there is room.
+    protocol.data_received(b"".join(b"\x04\x00\x01" + bytes([value]) for value in range(1, 21)))
+    for _ in range(5):
+        await asyncio.sleep(0)
+    assert len(packets._packets) == 2
+    assert protocol._queue.qsize() <= 4
+    assert len(protocol._data) >= 14 * 4
+    assert not protocol.transport.reading
+
+    assert [(await packets.__anext__()).message["value"] for _ in range(20)] == list(range(1, 21))
+    assert protocol.transport.reading
+    assert protocol._data == b""
+
+    protocol.connection_lost(None)
+
+
+@pytest.mark.asyncio
+async def test_stream_pause_shared():
+    protocol = _connect()
+    packets = protocol.packets(max_size=1)
+
+    protocol.data_received(b"\x04\x00\x01\x01\x04\x00\x01\x02")
+    await asyncio.sleep(0)
+    assert not protocol.transport.reading
+
+    # Someone else pauses the connection too; the stream resuming doesn't
+    # resume the connection, till the other did too.
+    protocol.pause_reading()
+    await packets.__anext__()
+    await packets.__anext__()
+    await asyncio.sleep(0)
+    assert not protocol.transport.reading
+
+    protocol.resume_reading()
+    assert protocol.transport.reading
+
+    protocol.connection_lost(None)
@@ -1,4 +1,5 @@
 import asyncio
+import collections
 import enum
 import pytest
 
@@ -8,7 +9,10 @@ from .exceptions import (
     PacketInvalidType,
 )
 from .source import Source
-from .tcp import TCPProtocol
+from .tcp import (
+    Priority,
+    TCPProtocol,
+)
 from .read import read_uint8
 
 
@@ -145,3 +149,199 @@ async def test_process_queue(data, result):
     test._queue.put_nowait(memoryview(b"\x04\x00\x00"))  # Force an exception
     await test._process_queue()
     assert seen_packet[0] is True
+
+
+class WriteTransport:
+    def __init__(self):
+        self.written = []
+        self.write_buffer_size = 1024 * 1024
+
+    def get_write_buffer_size(self):
+        return self.write_buffer_size
+
+    def is_closing(self):
+        return False
+
+    def write(self, data):
+        self.written.append(data)
+
+
+@pytest.mark.asyncio
+async def test_send_priority():
+    test = OpenTTDProtocolTest(None)
+    test.task.cancel()
+    test.transport = WriteTransport()
+
+    # The peer is not reading, so bulk has to wait; control too, as the write
+    # buffer is over its limit.
+    test.pause_writing()
+    bulk = asyncio.create_task(test.send_packet(b"bulk", Priority.BULK))
+    control = asyncio.create_task(test.send_packet(b"control"))
+    await asyncio.sleep(0)
+    assert test.transport.written == []
+
+    # Once the peer catches up, control goes first.
+    test.resume_writing()
+    await asyncio.gather(bulk, control)
+    assert test.transport.written == [b"control", b"bulk"]
+
+    # With a small write buffer, control doesn't wait for the peer at all.
+    test.pause_writing()
+    test.transport.write_buffer_size = 0
+    bulk = asyncio.create_task(test.send_packet(b"bulk", Priority.BULK))
+    await test.send_packet(b"control")
+    assert test.transport.written[2:] == [b"control"]
+
+    test.resume_writing()
+    await bulk
+    assert test.transport.written[3:] == [b"bulk"]
+
+
+@pytest.mark.asyncio
+async def test_send_bulk():
+    test = OpenTTDProtocolTest(None)
+    test.task.cancel()
+    test.transport = WriteTransport()
+    test.bulk_slice_bytes = 6
+    test.bulk_slice_time = None
+
+    other_ran = []
+
+    async def other():
+        other_ran.append(len(test.transport.written))
+
+    def packets():
+        asyncio.create_task(other())
+        for _ in range(5):
+            yield b"\x03\x00\x00"
+
+    assert await test.send_bulk(packets()) == 15
+    assert test.transport.written == [b"\x03\x00\x00" * 2, b"\x03\x00\x00" * 2, b"\x03\x00\x00"]
+    # Other tasks ran between the slices.
+    assert other_ran == [1]
+
+
+@pytest.mark.asyncio
+async def test_process_queue_messages():
+    Message = collections.namedtuple("Message", ["value"])
+    seen = []
+
+    class MessageProtocol(OpenTTDProtocolTest):
+        def receive_PACKET_TWO(self, source, data):
+            value, data = read_uint8(data)
+            return Message(value)
+
+    class KwargsCallback:
+        async def receive_PACKET_TWO(source, value):
+            seen.append(value)
+
+    class MessageCallback:
+        receive_messages = True
+
+        async def receive_PACKET_TWO(source, msg):
+            seen.append(msg)
+
+    for callback in (KwargsCallback, MessageCallback):
+        test = MessageProtocol(callback)
+        test.task.cancel()
+        test.source = Source(test, None, "127.0.0.1", 12345)
+        test.transport = FakeTransport()
+
+        test._queue.put_nowait(memoryview(b"\x04\x00\x01\x02"))
+        await test._process_queue()
+
+    assert seen == [2, Message(2)]
+    assert type(seen[1]) is Message
+
+
+@pytest.mark.asyncio
+async def test_process_queue_batch():
+    seen = []
+
+    class TypeBatchCallback:
+        async def receive_PACKET_ONE(source):
+            seen.append("one")
+
+        async def receive_batch_PACKET_TWO(source, messages):
+            seen.append([message["value"] for message in messages])
+
+    class BatchCallback:
+        async def receive_batch(source, packets):
+            seen.append([packet.type for packet in packets])
+
+    for callback in (TypeBatchCallback, BatchCallback):
+        test = OpenTTDProtocolTest(callback)
+        test.task.cancel()
+        test.source = Source(test, None, "127.0.0.1", 12345)
+        test.transport = FakeTransport()
+        test.batch_max_size = 4
+
+        for data in (b"\x04\x00\x01\x01", b"\x04\x00\x01\x02", b"\x03\x00\x00", b"\x04\x00\x01\x03", b"\x03\x00\x00"):
+            test._queue.put_nowait(memoryview(data))
+        await test._process_queue()
+        await test._process_queue()
+
+    one, two = OpenTTDTestType.PACKET_ONE, OpenTTDTestType.PACKET_TWO
+    assert seen == [[1, 2], "one", [3], "one", [two, two, one, two], [one]]
+
+
+@pytest.mark.asyncio
+async def test_process_queue_batch_delay():
+    batches = []
+
+    class BatchCallback:
+        async def receive_batch(source, packets):
+            batches.append(len(packets))
+
+    test = OpenTTDProtocolTest(BatchCallback)
+    test.task.cancel()
+    test.source = Source(test, None, "127.0.0.1", 12345)
+    test.transport = FakeTransport()
+    test.batch_max_delay = 0.05
+
+    test.data_received(b"\x03\x00\x00")
+    asyncio.get_running_loop().call_later(0.01, test.data_received, b"\x03\x00\x00")
+    await test._process_queue()
+    assert batches == [2]
+
+    # Without more packets, the batch ends at the deadline.
+    test.data_received(b"\x03\x00\x00")
+    await test._process_queue()
+    assert batches == [2, 1]
+    assert test._queued_waiter is None
+
+
+@pytest.mark.asyncio
+async def test_process_queue_batch_messages():
+    Message = collections.namedtuple("Message", ["value"])
+    seen = []
+
+    class MessageProtocol(OpenTTDProtocolTest):
+        def receive_PACKET_TWO(self, source, data):
+            value, data = read_uint8(data)
+            return Message(value)
+
+    class KwargsCallback:
+        async def receive_batch_PACKET_TWO(source, messages):
+            seen.append(messages)
+
+    class MessageCallback(KwargsCallback):
+        receive_messages = True
+
+    class PacketsCallback:
+        receive_messages = True
+
+        async def receive_batch(source, packets):
+            seen.append([packet.message for packet in packets])
+
+    for callback in (KwargsCallback, MessageCallback, PacketsCallback):
+        test = MessageProtocol(callback)
+        test.task.cancel()
+        test.source = Source(test, None, "127.0.0.1", 12345)
+        test.transport = FakeTransport()
+
+        test.data_received(b"\x04\x00\x01\x01\x04\x00\x01\x02")
+        await test._process_queue()
+
+    assert seen == [[{"value": 1}, {"value": 2}], [Message(1), Message(2)], [Message(1), Message(2)]]
+    assert type(seen[1][0]) is Message
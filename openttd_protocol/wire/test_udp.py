@@ -0,0 +1,115 @@
+import pytest
+
+from .metrics import Metrics
+from .source import Source
+from .testing import (
+    FakeTransport,
+    OpenTTDUDPProtocolTest,
+)
+
+
+@pytest.mark.parametrize(
+    "data, result",
+    [
+        (b"\x03\x00\x00", [b"\x03\x00\x00"]),
+        (b"\x03\x00\x00\x04\x00\x01\x02", [b"\x03\x00\x00", b"\x04\x00\x01\x02"]),
+        (b"\x03\x00\x00\x05\x00\x01", [b"\x03\x00\x00"]),
+        (b"\x03\x00\x00\x03", [b"\x03\x00\x00"]),
+        (b"\x01\x00\x00", []),
+    ],
+)
+@pytest.mark.asyncio
+async def test_datagram_received(data, result):
+    test = OpenTTDUDPProtocolTest(None)
+    test.task.cancel()
+
+    test.datagram_received(data, ("127.0.0.1", 12345))
+
+    packets = []
+    while not test._queue.empty():
+        source, packet = test._queue.get_nowait()
+        assert str(source.ip) == "127.0.0.1"
+        assert source.port == 12345
+        packets.append(packet)
+    assert packets == result
+
+
+@pytest.mark.asyncio
+async def test_process_queue():
+    seen = []
+
+    class Callback:
+        async def receive_PACKET_TWO(source, value):
+            seen.append((source.port, value))
+
+    test = OpenTTDUDPProtocolTest(Callback)
+    test.task.cancel()
+
+    source = Source(test, ("127.0.0.1", 12345), "127.0.0.1", 12345)
+    test._queue.put_nowait((source, memoryview(b"\x04\x00\x01\x02")))
+    await test._process_queue()
+
+    # Invalid packets are dropped, without stopping the processing.
+    test._queue.put_nowait((source, memoryview(b"\x05\x00\x01\x02\x00")))
+    await test._process_queue()
+
+    assert seen == [(12345, 2)]
+
+
+@pytest.mark.asyncio
+async def test_process_queue_resolved_once():
+    seen = []
+
+    class Callback:
+        lookups = 0
+
+        def __getattribute__(self, name):
+            Callback.lookups += 1
+            return super().__getattribute__(name)
+
+        async def receive_raw(self, source, data):
+            return data[2] == 0
+
+        async def receive_PACKET_TWO(self, source, value):
+            seen.append(value)
+
+    test = OpenTTDUDPProtocolTest(Callback())
+    test.task.cancel()
+    lookups = Callback.lookups
+
+    source = Source(test, ("127.0.0.1", 12345), "127.0.0.1", 12345)
+    for data in (b"\x03\x00\x00", b"\x04\x00\x01\x02", b"\x04\x00\x01\x03"):
+        test._queue.put_nowait((source, memoryview(data)))
+        await test._process_queue()
+
+    # The callback class is asked what it wants once, not per datagram.
+    assert seen == [2, 3]
+    assert Callback.lookups == lookups
+
+
+@pytest.mark.asyncio
+async def test_queue_full():
+    class BoundedProtocolTest(OpenTTDUDPProtocolTest):
+        queue_max_size = 2
+
+    metrics = Metrics()
+    test = BoundedProtocolTest(None)
+    test.task.cancel()
+    test.metrics = metrics
+
+    test.datagram_received(b"\x03\x00\x00\x04\x00\x01\x02\x03\x00\x00", ("127.0.0.1", 12345))
+
+    assert test._queue.qsize() == 2
+    assert metrics.as_dict()["BoundedProtocolTest"]["dropped_packets"] == 1
+    assert 'openttd_protocol_packets_dropped_total{protocol="BoundedProtocolTest"} 1' in metrics.as_prometheus()
+
+
+@pytest.mark.asyncio
+async def test_send_packets():
+    test = OpenTTDUDPProtocolTest(None)
+    test.task.cancel()
+    test.transport = FakeTransport()
+
+    length = await test.send_packets([(b"\x03\x00\x00", ("127.0.0.1", 1)), (b"\x03\x00\x01", ("127.0.0.1", 2))])
+    assert length == 6
+    assert test.transport.sent == [(b"\x03\x00\x00", ("127.0.0.1", 1)), (b"\x03\x00\x01", ("127.0.0.1", 2))]
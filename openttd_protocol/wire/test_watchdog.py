@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import pytest
+import time
+
+from .source import Source
+from .testing import (
+    FakeTransport,
+    OpenTTDProtocolTest,
+)
+from .watchdog import Watchdog
+
+
+class Callback:
+    async def receive_PACKET_ONE(source):
+        time.sleep(0.02)
+
+
+@pytest.mark.asyncio
+async def test_watchdog_slow_callback(caplog):
+    watchdog = Watchdog(handler_threshold=0.01, max_reports=1)
+
+    test = OpenTTDProtocolTest(Callback)
+    test.task.cancel()
+    test.watchdog = watchdog
+    test.connection_made(FakeTransport())
+    test.source = Source(test, None, "127.0.0.1", 12345)
+
+    with caplog.at_level(logging.WARNING):
+        for _ in range(2):
+            test._queue.put_nowait(memoryview(b"\x03\x00\x00"))
+            await test._process_queue()
+
+    assert "Callback.receive_PACKET_ONE" in caplog.text
+    assert "PACKET_ONE from 127.0.0.1:12345" in caplog.text
+
+    stats = watchdog.stats()
+    assert stats["handlers"]["OpenTTDProtocolTest.PACKET_ONE"]["count"] == 2
+    assert stats["handlers"]["OpenTTDProtocolTest.PACKET_ONE"]["slow"] == 2
+    # Only the first report is logged; the second is rate-limited.
+    assert stats["suppressed"] == 1
+
+    await test.send_packet(b"\x03\x00\x01")
+    assert watchdog.stats()["sends"]["OpenTTDProtocolTest"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_watchdog_slow_send(caplog):
+    class SlowTransport(FakeTransport):
+        def write(self, data):
+            time.sleep(0.02)
+            super().write(data)
+
+    watchdog = Watchdog(handler_threshold=0.01)
+
+    test = OpenTTDProtocolTest(None)
+    test.task.cancel()
+    test.watchdog = watchdog
+    test.connection_made(SlowTransport())
+
+    # Batched and bulk sends are watched too.
+    with caplog.at_level(logging.WARNING):
+        await test.send_packets([b"\x03\x00\x00", b"\x03\x00\x01"])
+        await test.send_bulk(iter([b"\x03\x00\x00"]))
+
+    assert "Slow send_packets" in caplog.text
+    assert "Slow send_bulk" in caplog.text
+    assert "of PACKET_ONE to 127.0.0.1:12345" in caplog.text
+    assert watchdog.stats()["sends"]["OpenTTDProtocolTest"]["slow"] == 2
+
+
+@pytest.mark.asyncio
+async def test_watchdog_lag():
+    watchdog = Watchdog(interval=0.01, lag_threshold=0.05)
+    watchdog.start()
+
+    await asyncio.sleep(0.02)
+    time.sleep(0.1)
+    await asyncio.sleep(0.02)
+
+    watchdog.stop()
+
+    stats = watchdog.stats()
+    assert stats["lag"]["slow"] >= 1
+    assert stats["lag"]["max"] >= 0.05
+
+
+def test_watchdog_suppressed(caplog):
+    watchdog = Watchdog(max_reports=1)
+
+    for _ in range(3):
+        watchdog._report("Report")
+    assert watchdog.stats()["suppressed"] == 2
+
+    # A new window logs how many were suppressed in the last one; the total
+    # keeps counting.
+    watchdog._report_window -= watchdog.report_interval + 1
+    with caplog.at_level(logging.WARNING):
+        watchdog._report("Report")
+        watchdog._report("Report")
+
+    # The window is reported as long as it really was.
+    assert "Watchdog suppressed 2 reports in the last 11s" in caplog.text
+    assert watchdog.stats()["suppressed"] == 3
@@ -0,0 +1,95 @@
+import enum
+
+from .exceptions import PacketInvalidData
+from .read import read_uint8
+from .tcp import TCPProtocol
+from .udp import UDPProtocol
+from .write import (
+    SEND_TCP_MTU,
+    write_init,
+    write_presend,
+    write_uint8,
+)
+
+# Helpers shared by the tests: a protocol with two simple packets, and a
+# transport that records what is done with it instead of using a socket.
+
+
+class OpenTTDTestType(enum.IntEnum):
+    PACKET_ONE = 0
+    PACKET_TWO = 1
+    PACKET_END = 2
+
+
+class OpenTTDTestPackets:
+    PacketType = OpenTTDTestType
+    PACKET_END = PacketType.PACKET_END.value
+
+    @staticmethod
+    def receive_PACKET_ONE(source, data):
+        return {}
+
+    @staticmethod
+    def receive_PACKET_TWO(source, data):
+        value, data = read_uint8(data)
+
+        if len(data) != 0:
+            raise PacketInvalidData("more bytes than expected; remaining: ", len(data))
+
+        return {"value": value}
+
+
+class OpenTTDProtocolTest(OpenTTDTestPackets, TCPProtocol):
+    async def send_PACKET_TWO(self, value):
+        data = write_init(OpenTTDTestType.PACKET_TWO)
+        write_uint8(data, value)
+        write_presend(data, SEND_TCP_MTU)
+        return await self.send_packet(data)
+
+
+class OpenTTDUDPProtocolTest(OpenTTDTestPackets, UDPProtocol):
+    pass
+
+
+class FakeTransport:
+    def __init__(self, ip="127.0.0.1", port=12345, write_buffer_size=0):
+        self.ip = ip
+        self.port = port
+        self.write_buffer_size = write_buffer_size
+
+        self.written = []
+        self.sent = []
+        self.reading = True
+        self.closing = False
+        self.aborted = False
+
+    def get_extra_info(self, name):
+        return (self.ip, self.port)
+
+    def set_write_buffer_limits(self):
+        pass
+
+    def get_write_buffer_size(self):
+        return self.write_buffer_size
+
+    def is_closing(self):
+        return self.closing
+
+    def close(self):
+        self.closing = True
+
+    def abort(self):
+        self.aborted = True
+        self.closing = True
+
+    def write(self, data):
+        self.written.append(data)
+
+    def sendto(self, data, addr):
+        self.sent.append((data, addr))
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+
+from .exceptions import PacketInvalid
+from .read import read_uint16
+from .source import Source
+from .tcp import (
+    TCPProtocol,
+    message_kwargs,
+)
+
+log = logging.getLogger(__name__)
+
+
+class UDPProtocol(asyncio.DatagramProtocol):
+    PacketType = None
+    PACKET_END = 0
+    # Set to a Metrics instance to collect metrics about the packets.
+    metrics = None
+    # At most this many packets wait to be handled. Under a flood, the
+    # packets that arrive while the queue is full are dropped; as with any
+    # UDP packet that gets lost, it is up to the peer to try again.
+    queue_max_size = 10000
+
+    # Validating and dispatching a packet is identical for TCP and UDP.
+    receive_packet = TCPProtocol.receive_packet
+
+    def __init__(self, callback_class):
+        super().__init__()
+
+        self._set_callback(callback_class)
+
+        self._queue = asyncio.Queue(self.queue_max_size)
+        self._can_write = asyncio.Event()
+        self._can_write.set()
+
+        self.task = asyncio.create_task(self._guard_process_queue())
+
+    def _set_callback(self, callback_class):
+        self._callback = callback_class
+
+        # Like TCPProtocol, look up what the callback class wants once,
+        # instead of for every datagram.
+        self._receive_raw = getattr(callback_class, "receive_raw", None)
+        self._messages = getattr(callback_class, "receive_messages", False)
+        self._callbacks = {}
+        if self.PacketType is not None:
+            for packet_type in self.PacketType:
+                callback = getattr(callback_class, f"receive_{packet_type.name}", None)
+                if callback is not None:
+                    self._callbacks[packet_type] = callback
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.task.cancel()
+
+    def pause_writing(self):
+        self._can_write.clear()
+
+    def resume_writing(self):
+        self._can_write.set()
+
+    def error_received(self, exc):
+        # Most likely an ICMP error about an earlier datagram; as UDP is
+        # connectionless, there is nothing we can do with it.
+        log.debug("UDP error received: %r", exc)
+
+    def datagram_received(self, data, addr):
+        # Every datagram comes from its own source; there is no state shared
+        # between datagrams, unlike with TCP.
+        source = Source(self, addr, addr[0], addr[1])
+        self.receive_data(self._queue, source, memoryview(data))
+
+    def receive_data(self, queue, source, data):
+        # A datagram can contain more than one packet; but it should always
+        # contain complete packets.
+        while len(data) > 0:
+            if len(data) < 2:
+                log.info("Dropping invalid datagram from %s:%d: trailing byte", source.ip, source.port)
+                return
+
+            length, _ = read_uint16(data)
+            if length < 2 or length > len(data):
+                log.info(
+                    "Dropping invalid datagram from %s:%d: impossible length field of %d in packet",
+                    source.ip,
+                    source.port,
+                    length,
+                )
+                return
+
+            try:
+                queue.put_nowait((source, data[0:length]))
+            except asyncio.QueueFull:
+                if self.metrics is not None:
+                    self.metrics.packet_dropped(self)
+            data = data[length:]
+
+    async def _guard_process_queue(self):
+        while True:
+            try:
+                await self._process_queue()
+            except asyncio.CancelledError:
+                # Our coroutine is cancelled, pass it on the the caller.
+                raise
+            except Exception:
+                # Unlike TCP, one bad packet should not stop us from handling
+                # the packets of all other sources.
+                log.exception("Internal error: process_queue triggered an exception")
+
+    async def _process_queue(self):
+        source, data = await self._queue.get()
+
+        if self._receive_raw is not None and await self._receive_raw(source, data):
+            return
+
+        try:
+            packet_type, message = self.receive_packet(source, data)
+        except PacketInvalid as err:
+            log.info("Dropping invalid packet from %s:%d: %r", source.ip, source.port, err)
+            if self.metrics is not None:
+                self.metrics.packet_invalid(self)
+            return
+
+        callback = self._callbacks[packet_type]
+        if self._messages:
+            handler = callback(source, message)
+        else:
+            handler = callback(source, **message_kwargs(message))
+
+        if self.metrics is None:
+            await handler
+            return
+
+        start = time.perf_counter()
+        try:
+            await handler
+        finally:
+            self.metrics.handler_finished(self, packet_type, time.perf_counter() - start)
+
+    async def send_packet(self, data, addr):
+        await self._can_write.wait()
+
+        self.transport.sendto(data, addr)
+
+        if self.metrics is not None:
+            self.metrics.packet_sent(self, data)
+
+        return len(data)
+
+    async def send_packets(self, datagrams):
+        # Send a list of (data, addr) tuples, each as its own datagram. This
+        # is done without returning to the event loop in between, unless the
+        # transport asks us to pause.
+        length = 0
+        for data, addr in datagrams:
+            if not self._can_write.is_set():
+                await self._can_write.wait()
+
+            self.transport.sendto(data, addr)
+            length += len(data)
+
+            if self.metrics is not None:
+                self.metrics.packet_sent(self, data)
+
+        return length
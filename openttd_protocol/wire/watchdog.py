@@ -0,0 +1,154 @@
+import asyncio
+import collections
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class RunningStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.slow = 0
+
+    def add(self, value, slow):
+        self.count += 1
+        self.total += value
+        self.last = value
+        if value > self.max:
+            self.max = value
+        if slow:
+            self.slow += 1
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "last": self.last,
+            "slow": self.slow,
+        }
+
+
+class Watchdog:
+    """Detect a stalling event loop, and the handlers that cause it."""
+
+    # Assign an instance to TCPProtocol.watchdog (or to that of a subclass),
+    # and call start() from within the event loop.
+    #
+    # - lag_threshold: an event loop that is late this many seconds to wake
+    #   up, is reported as stalled.
+    # - handler_threshold: a receive_* callback that takes this many seconds,
+    #   is reported as slow. The same goes for awaiting a send_packet(), a
+    #   send_packets(), or a slice of a send_bulk().
+    # - report_interval: at most max_reports are logged per this many
+    #   seconds; the rest is only counted.
+    #
+    # The duration of a callback is the wall time till it returns, so it
+    # includes the time it awaits other things. The lag measurement tells
+    # if the loop was really blocked; the last slow callback is included in
+    # that report, as it is the most likely culprit.
+
+    def __init__(self, interval=0.1, lag_threshold=0.1, handler_threshold=0.05, report_interval=10.0, max_reports=10):
+        self.interval = interval
+        self.lag_threshold = lag_threshold
+        self.handler_threshold = handler_threshold
+        self.report_interval = report_interval
+        self.max_reports = max_reports
+
+        self.lag = RunningStats()
+        self.handlers = collections.defaultdict(RunningStats)
+        self.sends = collections.defaultdict(RunningStats)
+        # Total reports suppressed since the start.
+        self.suppressed = 0
+
+        self._last_slow = None
+        self._reports = 0
+        self._suppressed = 0
+        self._report_window = 0.0
+        self._task = None
+
+    def start(self):
+        """Start measuring the event loop lag."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._measure_lag())
+
+    def stop(self):
+        """Stop measuring the event loop lag."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _measure_lag(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+
+            slow = lag > self.lag_threshold
+            self.lag.add(lag, slow)
+            if slow:
+                if self._last_slow is not None:
+                    self._report(
+                        "Event loop stalled for %.3fs; last slow callback: %s (%.3fs) for %s from %s:%d",
+                        lag,
+                        *self._last_slow,
+                    )
+                else:
+                    self._report("Event loop stalled for %.3fs", lag)
+
+    def _report(self, message, *args):
+        now = time.monotonic()
+        if now - self._report_window > self.report_interval:
+            if self._suppressed:
+                log.warning(
+                    "Watchdog suppressed %d reports in the last %.0fs", self._suppressed, now - self._report_window
+                )
+            self._report_window = now
+            self._reports = 0
+            self._suppressed = 0
+
+        if self._reports >= self.max_reports:
+            self.suppressed += 1
+            self._suppressed += 1
+            return
+
+        self._reports += 1
+        log.warning(message, *args)
+
+    def handler_finished(self, source, packet_type, callback, duration):
+        slow = duration > self.handler_threshold
+        self.handlers[(type(source.protocol).__name__, packet_type.name)].add(duration, slow)
+
+        if slow:
+            name = getattr(callback, "__qualname__", repr(callback))
+            self._last_slow = (name, duration, packet_type.name, str(source.ip), source.port)
+            self._report("Slow callback %s (%.3fs) for %s from %s:%d", *self._last_slow)
+
+    def send_finished(self, source, data, duration, method="send_packet"):
+        protocol = source.protocol
+        slow = duration > self.handler_threshold
+        self.sends[type(protocol).__name__].add(duration, slow)
+
+        if slow:
+            try:
+                packet_type = protocol.PacketType(data[2]).name
+            except ValueError:
+                packet_type = str(data[2])
+            self._report("Slow %s (%.3fs) of %s to %s:%d", method, duration, packet_type, source.ip, source.port)
+
+    def stats(self):
+        """Return the running statistics."""
+        return {
+            "lag": self.lag.as_dict(),
+            "handlers": {
+                f"{protocol}.{packet_type}": stats.as_dict() for (protocol, packet_type), stats in self.handlers.items()
+            },
+            "sends": {protocol: stats.as_dict() for protocol, stats in self.sends.items()},
+            "suppressed": self.suppressed,
+        }
@@ -13,7 +13,7 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/OpenTTD/py-protocol",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=["benchmark", "benchmark.*"]),
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: GNU Lesser General Public License v2 (LGPLv2)",
@@ -22,4 +22,10 @@ setuptools.setup(
     python_requires='>=3.8',
     install_requires=[
     ],
+    extras_require={
+        # Vectorized decoding of captured traffic; see openttd_protocol.analysis.
+        "columnar": [
+            "numpy",
+        ],
+    },
 )